@@ -14,6 +14,7 @@ Provides entry point for DVR-Scan's command-line interface (CLI).
 """
 
 import logging
+import multiprocessing
 import sys
 from subprocess import CalledProcessError
 
@@ -83,4 +84,6 @@ def main():
             main_impl()
 
 if __name__ == "__main__":
+    # Required for worker processes in frozen (PyInstaller) builds of the engine.
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -523,10 +523,10 @@ class MotionSettingsWindow:
         combo = ttk.Combobox(frame, textvariable=self._bg_subtractor, width=SETTING_INPUT_WIDTH)
         combo.state(["readonly"])
         if SubtractorCudaMOG2.is_available():
-            combo["values"] = ("MOG2_CUDA", "MOG2", "CNT")
+            combo["values"] = ("MOG2_CUDA", "MOG2", "CNT", "MOG2_TILED", "AVG")
             self._bg_subtractor.set("MOG2_CUDA")
         else:
-            combo["values"] = ("MOG2", "CNT")
+            combo["values"] = ("MOG2", "CNT", "MOG2_TILED", "AVG")
             self._bg_subtractor.set("MOG2")
 
         combo.grid(row=0, column=1, sticky=EXPAND_HORIZONTAL)
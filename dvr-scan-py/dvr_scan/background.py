@@ -0,0 +1,78 @@
+#
+#      DVR-Scan: Video Motion Event Detection & Extraction Tool
+#   --------------------------------------------------------------
+#       [  Site: https://www.dvr-scan.com/                 ]
+#       [  Repo: https://github.com/Breakthrough/DVR-Scan  ]
+#
+# Copyright (C) 2016 Brandon Castellano <http://www.bcastell.com>.
+# DVR-Scan is licensed under the BSD 2-Clause License; see the included
+# LICENSE file, or visit one of the above pages for details.
+#
+"""``dvr_scan.background`` Module
+
+Saves and loads snapshots of the background of a camera: frames without motion sampled over a
+scan, which are replayed into the background model at the start of the next scan so it doesn't
+have to learn the scene from the first frames. OpenCV can't serialize the state of its background
+subtractors, and replaying frames works the same for all of them.
+"""
+
+import collections
+import typing as ty
+from pathlib import Path
+
+import numpy as np
+
+SNAPSHOT_FRAMES: int = 16
+"""Maximum number of frames kept in a background snapshot."""
+
+SNAPSHOT_INTERVAL_SECONDS: float = 2.0
+"""Minimum time between frames sampled for a snapshot, so it covers some variation in the scene
+(e.g. trees moving in the wind or flickering lights) rather than a single moment."""
+
+
+class BackgroundSampler:
+    """Keeps the last `num_frames` frames added, at most one every `interval` seconds."""
+
+    def __init__(
+        self,
+        framerate: float,
+        num_frames: int = SNAPSHOT_FRAMES,
+        interval: float = SNAPSHOT_INTERVAL_SECONDS,
+    ):
+        self._frames: ty.Deque[np.ndarray] = collections.deque(maxlen=num_frames)
+        self._interval = max(1, round(interval * framerate))
+        self._next_frame = 0
+
+    @property
+    def frames(self) -> ty.List[np.ndarray]:
+        return list(self._frames)
+
+    def add(self, frame_num: int, frame: np.ndarray):
+        """Adds `frame` if at least `interval` seconds have passed since the last frame added."""
+        if frame_num < self._next_frame:
+            return
+        # Frames may be drawn on later for output, so keep a copy.
+        self._frames.append(frame.copy())
+        self._next_frame = frame_num + self._interval
+
+
+def save_background(path: Path, frames: ty.List[np.ndarray]):
+    """Saves `frames` to `path` as a background snapshot."""
+    with open(path, "wb") as snapshot_file:
+        np.savez_compressed(snapshot_file, frames=np.stack(frames))
+
+
+def load_background(path: Path) -> ty.List[np.ndarray]:
+    """Loads the frames of a background snapshot saved with `save_background`.
+
+    Raises:
+        ValueError: `path` is not a background snapshot.
+    """
+    try:
+        with np.load(path) as snapshot:
+            frames = snapshot["frames"]
+    except (OSError, KeyError) as ex:
+        raise ValueError(f"{path} is not a background snapshot.") from ex
+    if frames.ndim != 4 or frames.shape[3] != 3 or frames.dtype != np.uint8 or not len(frames):
+        raise ValueError(f"{path} is not a background snapshot.")
+    return list(frames)
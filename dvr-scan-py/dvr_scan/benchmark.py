@@ -0,0 +1,157 @@
+#
+#      DVR-Scan: Video Motion Event Detection & Extraction Tool
+#   --------------------------------------------------------------
+#       [  Site: https://www.dvr-scan.com/                 ]
+#       [  Repo: https://github.com/Breakthrough/DVR-Scan  ]
+#
+# Copyright (C) 2016 Brandon Castellano <http://www.bcastell.com>.
+# DVR-Scan is licensed under the BSD 2-Clause License; see the included
+# LICENSE file, or visit one of the above pages for details.
+#
+"""``dvr_scan.benchmark`` Module
+
+Compares background subtractors on a set of videos for speed (frames scanned per second) and
+event recall against a reference subtractor (MOG2 by default). Run with:
+
+    python -m dvr_scan.benchmark -i tests/resources/traffic_camera.mp4
+
+Prints one JSON object per video and subtractor.
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing as ty
+
+from dvr_scan.cli import RegionAction
+from dvr_scan.platform_utils import init_logger
+from dvr_scan.region import Point
+from dvr_scan.scanner import DetectorType, MotionEvent, MotionScanner, OutputMode
+
+
+def _frame_ranges(events: ty.List[MotionEvent]) -> ty.List[ty.Tuple[int, int]]:
+    return [(event.start.frame_num, event.end.frame_num) for event in events]
+
+
+def event_recall(
+    events: ty.List[ty.Tuple[int, int]], reference: ty.List[ty.Tuple[int, int]]
+) -> ty.Dict[str, ty.Optional[float]]:
+    """Compares (start, end) frame ranges to those of a reference run. Returns the fraction of
+    reference events overlapped by at least one event (`event_recall`), the fraction of frames
+    in reference events also in an event (`frame_recall`), and the fraction of frames in events
+    also in a reference event (`frame_precision`). Values are None if there is nothing to
+    compare against."""
+
+    def overlap(a, b):
+        return max(0, min(a[1], b[1]) - max(a[0], b[0]))
+
+    reference_frames = sum(end - start for start, end in reference)
+    event_frames = sum(end - start for start, end in events)
+    common_frames = sum(overlap(a, b) for a in events for b in reference)
+    return {
+        "event_recall": (
+            sum(any(overlap(a, b) > 0 for a in events) for b in reference) / len(reference)
+            if reference
+            else None
+        ),
+        "frame_recall": common_frames / reference_frames if reference_frames else None,
+        "frame_precision": common_frames / event_frames if event_frames else None,
+    }
+
+
+def run_benchmark(
+    video: str,
+    detector_type: DetectorType,
+    regions: ty.Optional[ty.List[ty.List[Point]]] = None,
+    **detection_params,
+) -> ty.Dict[str, ty.Any]:
+    """Scans `video` with the given subtractor, passing any other `detection_params` on to
+    `MotionScanner.set_detection_params`. Returns the events found and timing."""
+    scanner = MotionScanner([video])
+    scanner.set_output(output_mode=OutputMode.SCAN_ONLY)
+    scanner.set_detection_params(detector_type=detector_type, **detection_params)
+    scanner.set_regions(regions=regions)
+    start = time.perf_counter()
+    result = scanner.scan()
+    elapsed = time.perf_counter() - start
+    return {
+        "video": video,
+        "subtractor": detector_type.name,
+        "frames": result.num_frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(result.num_frames / elapsed, 1) if elapsed > 0 else None,
+        "frames_gated": result.num_frames_gated,
+        "events": _frame_ranges(result.event_list),
+    }
+
+
+def main():
+    available = [
+        detector_type.name for detector_type in DetectorType if detector_type.value.is_available()
+    ]
+    parser = argparse.ArgumentParser(
+        description="Compare background subtractors for speed and event recall."
+    )
+    parser.add_argument("-i", "--input", nargs="+", required=True, help="Videos to scan.")
+    parser.add_argument(
+        "-b",
+        "--bg-subtractor",
+        nargs="+",
+        type=str.upper,
+        choices=available,
+        default=available,
+        help="Subtractors to benchmark (default: all available).",
+    )
+    parser.add_argument(
+        "--reference",
+        type=str.upper,
+        choices=available,
+        default="MOG2",
+        help="Subtractor whose events recall is measured against (default: MOG2).",
+    )
+    parser.add_argument(
+        "-df", "--downscale-factor", type=int, default=1, help="Downscale factor for all runs."
+    )
+    parser.add_argument(
+        "--cascade-gate", action="store_true", help="Enable the cascade gate for all runs."
+    )
+    parser.add_argument(
+        "-a",
+        "--add-region",
+        metavar="X0 Y0 ...",
+        dest="regions",
+        nargs="*",
+        action=RegionAction,
+        default=[],
+        help="Limit detection to this region, as with the scan command. May be repeated.",
+    )
+    args = parser.parse_args()
+    # Results are written to stdout, so keep log messages on stderr.
+    init_logger(show_stdout=True, use_stderr=True)
+
+    subtractors = [args.reference] + [name for name in args.bg_subtractor if name != args.reference]
+    for video in args.input:
+        reference = None
+        for name in subtractors:
+            result = run_benchmark(
+                video,
+                DetectorType[name],
+                regions=args.regions,
+                downscale_factor=args.downscale_factor,
+                cascade_gate=args.cascade_gate,
+            )
+            if reference is None:
+                reference = result
+            result.update(event_recall(result["events"], reference["events"]))
+            result["speedup"] = (
+                round(result["fps"] / reference["fps"], 2)
+                if result["fps"] and reference["fps"]
+                else None
+            )
+            print(json.dumps(result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -539,6 +539,7 @@ import typing as ty
 
 from dvr_scan import get_license_info
 from dvr_scan.config import CHOICE_MAP, USER_CONFIG_FILE_PATH, ConfigRegistry
+from dvr_scan.hikvision.helpers import parse_timestamp
 from dvr_scan.platform_utils import HAS_MOG2_CUDA
 from dvr_scan.region import RegionValidator
 from dvr_scan.shared import logfile_path
@@ -561,7 +562,9 @@ assert SCAN_ONLY_MODE in CHOICE_MAP["output-mode"]
 
 VALID_OUTPUT_MODES = [mode for mode in CHOICE_MAP["output-mode"] if mode != SCAN_ONLY_MODE]
 
-BACKGROUND_SUBTRACTORS = ["MOG2", "CNT", "MOG2_CUDA"] if HAS_MOG2_CUDA else ["MOG2", "CNT"]
+BACKGROUND_SUBTRACTORS = [
+    subtractor for subtractor in CHOICE_MAP["bg-subtractor"] if subtractor != "MOG2_CUDA" or HAS_MOG2_CUDA
+]
 
 
 LOGFILE_PATH = logfile_path(name_prefix="dvr-scan")
@@ -667,8 +670,32 @@ def get_cli_parser(user_config: ConfigRegistry):
         parser_scan._optionals.title = "scan arguments"
 
     parser_scan.add_argument(
-        "-i", "--input", metavar="video_file", required=True, type=str, nargs="+", action="append",
-        help="[REQUIRED] Path to input video(s) or glob pattern.",
+        "-i", "--input", metavar="video_file", type=str, nargs="+", action="append",
+        help="[REQUIRED] Path to input video(s) or glob pattern (unless --image is set).",
+    )
+    parser_scan.add_argument(
+        "--image", metavar="disk_image", type=str,
+        help="Scan video carved directly from a Hikvision disk image instead of -i, without"
+             " writing intermediate files. Select the video with --image-block/--image-range.",
+    )
+    parser_scan.add_argument(
+        "--image-block", metavar="offset", type=str, action="append",
+        help="Hex offset of a data block (as listed in the HIKBTREE) to scan from --image."
+             " Requires --master-file. May be specified multiple times.",
+    )
+    parser_scan.add_argument(
+        "--image-range", metavar=("start", "end"), type=lambda value: int(value, 0), nargs=2,
+        action="append",
+        help="Absolute byte range of H.264 video to scan from --image. May be specified"
+             " multiple times.",
+    )
+    parser_scan.add_argument(
+        "--master-file", metavar="master_sector.json", type=str,
+        help="Path to the master_sector.json file, used with --image-block.",
+    )
+    parser_scan.add_argument(
+        "--extra-offset", metavar="bytes", type=int,
+        help="Extra offset value from master sector parsing, used with --image-block.",
     )
     parser_scan.add_argument(
         "-d", "--output-dir", metavar="path", type=str, help="Directory to write output files."
@@ -707,7 +734,9 @@ def get_cli_parser(user_config: ConfigRegistry):
     MOG2_CUDA = ", MOG2_CUDA (Nvidia GPU)" if HAS_MOG2_CUDA else ""
     parser_scan.add_argument(
         "-b", "--bg-subtractor", metavar="type", type=string_type_check(BACKGROUND_SUBTRACTORS, False, "type"),
-        help=f"Background subtractor to use: MOG2 (default), CNT, or MOG2_CUDA (if available)."
+        help=f"Background subtractor to use: MOG2 (default), CNT, MOG2_CUDA (if available), MOG2_TILED "
+             f"(MOG2 in tiles processed in parallel, for high resolution video), or AVG (running average, "
+             f"fastest, for triaging static scenes)."
              f"{user_config.get_help_string('bg-subtractor')}",
     )
     parser_scan.add_argument(
@@ -743,6 +772,33 @@ def get_cli_parser(user_config: ConfigRegistry):
         "-et", "--end-time", metavar="time", type=timecode_type_check("time"),
         help="Time to stop processing video at."
     )
+    parser_scan.add_argument(
+        "--scan-windows", metavar="windows.txt", type=str,
+        help="Only scan the time windows listed in this file, one `start end` pair per line (in"
+             " the same formats as -st/--start-time).",
+    )
+    parser_scan.add_argument(
+        "--alarm-logs", metavar="system_logs.json", type=str,
+        help="Only scan the video around the motion alarms in these parsed Hikvision system logs."
+             " Requires --video-start-time.",
+    )
+    parser_scan.add_argument(
+        "--video-start-time", metavar="unix_time", type=int,
+        help="Unix timestamp of the first frame of the input, used with --alarm-logs.",
+    )
+    parser_scan.add_argument(
+        "--window-margin", metavar=("before", "after"), type=timecode_type_check("time"), nargs=2,
+        help="Time to scan before and after each window from --scan-windows/--alarm-logs/--prescreen."
+        " [before: %s, after: %s]" % (
+            user_config.get("window-margin-before"),
+            user_config.get("window-margin-after"),
+        ),
+    )
+    parser_scan.add_argument(
+        "--window-warmup", metavar="time", type=timecode_type_check("time"),
+        help="Time before each window used only to train the background model."
+        f"{user_config.get_help_string('window-warmup')}",
+    )
     parser_scan.add_argument(
         "-roi", "--region-of-interest", dest="region_of_interest", metavar="x0 y0 w h", nargs="*",
         help=argparse.SUPPRESS
@@ -767,10 +823,58 @@ def get_cli_parser(user_config: ConfigRegistry):
         "-df", "--downscale-factor", metavar="factor", type=int_type_check(0, None, "factor"),
         help=f"Factor to downscale video for performance.{user_config.get_help_string('downscale-factor')}"
     )
+    parser_scan.add_argument(
+        "-afs", "--adaptive-frame-skip", metavar="max_frames", type=int_type_check(0, None, "max_frames"),
+        help="Skip up to this many frames between processing while motion scores are well below the"
+             " threshold, and none as they approach it. Can't be used with -fs/--frame-skip."
+             f"{user_config.get_help_string('adaptive-frame-skip')}"
+    )
+    parser_scan.add_argument(
+        "--cascade-gate", action="store_true", default=None,
+        help="Only run the background subtractor on frames where a quick thumbnail comparison finds"
+             " motion (and periodically to keep learning the background). Much faster on mostly"
+             f" static footage.{user_config.get_help_string('cascade-gate', show_default=False)}"
+    )
+    parser_scan.add_argument(
+        "--skip-duplicates", action="store_true", default=None,
+        help="Don't run the background subtractor on frames identical to the previous one (e.g."
+             " repeated by DVRs to pad low frame rate recordings), which share its motion score."
+             f"{user_config.get_help_string('skip-duplicates', show_default=False)}"
+    )
+    parser_scan.add_argument(
+        "--load-background", metavar="BACKGROUND.npz", type=str,
+        help="Train the background model on a snapshot saved by --save-background before scanning,"
+             " instead of learning the scene from the first frames. Ignored if the file doesn't"
+             f" exist.{user_config.get_help_string('load-background', show_default=False)}",
+    )
+    parser_scan.add_argument(
+        "--save-background", metavar="BACKGROUND.npz", type=str,
+        help="Save a snapshot of frames without motion to a file once scanning completes, to warm"
+             " start the next scan of the same camera with --load-background."
+             f"{user_config.get_help_string('save-background', show_default=False)}",
+    )
+    parser_scan.add_argument(
+        "--two-pass", action="store_true", default=None,
+        help="Run the detector on keyframes only first, then scan around those with motion at the"
+             " full frame rate. Requires PyAV."
+             f"{user_config.get_help_string('two-pass', show_default=False)}"
+    )
+    parser_scan.add_argument(
+        "--prescreen", action="store_true", default=None,
+        help="Find where the video may have motion from the sizes of its compressed frames without"
+             " decoding them, and only scan there (padded by --window-margin). Requires PyAV."
+             f"{user_config.get_help_string('prescreen', show_default=False)}"
+    )
     parser_scan.add_argument(
         "-fs", "--frame-skip", metavar="num_frames", type=int_type_check(0, None, "num_frames"),
         help=f"Number of frames to skip between processing.{user_config.get_help_string('frame-skip')}"
     )
+    parser_scan.add_argument(
+        "--decoder-skip", metavar="type", type=string_type_check(CHOICE_MAP["decoder-skip"], False, "type"),
+        help="Frames to drop in the decoder without decoding them (uses PyAV): none, nonref (non-reference"
+             " frames), or nonkey (all but keyframes). Can't be used with -fs or -afs."
+             f"{user_config.get_help_string('decoder-skip')}"
+    )
     parser_scan.add_argument(
         "-q", "--quiet", dest="quiet_mode", action="store_true",
         help=f"Suppress all console output except final results.{user_config.get_help_string('quiet-mode')}"
@@ -804,6 +908,7 @@ def get_cli_parser(user_config: ConfigRegistry):
     parser_master = hik_subparsers.add_parser("master", help="Parse the master sector from a disk image.")
     parser_master.add_argument("--image", required=True, help="Path to the disk image file (.dd, .E01, etc.).")
     parser_master.add_argument("-o", "--output-file", required=True, help="Path to save the master_sector.json output file.")
+    parser_master.add_argument("--case-db", help="Also store the results in this case database (SQLite), for use with the 'query' command.")
 
     # --- HIKVISION HIKBTREE ---
     parser_hikbtree = hik_subparsers.add_parser("hikbtree", help="Parse the HIKBTREE file index from a disk image.")
@@ -811,6 +916,7 @@ def get_cli_parser(user_config: ConfigRegistry):
     parser_hikbtree.add_argument("--master-file", required=True, help="Path to the master_sector.json file generated by the 'master' command.")
     parser_hikbtree.add_argument("--extra-offset", type=int, default=0, help="Extra offset value from master sector parsing.")
     parser_hikbtree.add_argument("-o", "--output-file", required=True, help="Path to save the hikbtree.json output file.")
+    parser_hikbtree.add_argument("--case-db", help="Also store the results in this case database (SQLite), for use with the 'query' command.")
     
     # --- HIKVISION LOGS ---
     parser_logs = hik_subparsers.add_parser("logs", help="Parse the system logs from a disk image.")
@@ -818,13 +924,89 @@ def get_cli_parser(user_config: ConfigRegistry):
     parser_logs.add_argument("--master-file", required=True, help="Path to the master_sector.json file.")
     parser_logs.add_argument("--extra-offset", type=int, default=0, help="Extra offset value from master sector parsing.")
     parser_logs.add_argument("-o", "--output-file", required=True, help="Path to save the system_logs.json output file.")
+    parser_logs.add_argument("--case-db", help="Also store the results in this case database (SQLite), for use with the 'query' command.")
+    parser_logs.add_argument("--no-hex-preview", action="store_true", help="Don't include raw hex previews of each entry in the output.")
+
+    # --- HIKVISION ANALYZE ---
+    parser_analyze = hik_subparsers.add_parser("analyze", help="Parse the master sector, HIKBTREE and system logs in one pass over a disk image.")
+    parser_analyze.add_argument("--image", required=True, help="Path to the disk image file (.dd, .E01, etc.).")
+    parser_analyze.add_argument("-d", "--output-dir", required=True, help="Directory to save master_sector.json, hikbtree.json and system_logs.json in.")
+    parser_analyze.add_argument("--case-db", help="Also store the results in this case database (SQLite), for use with the 'query' command.")
+    parser_analyze.add_argument("--no-hex-preview", action="store_true", help="Don't include raw hex previews of each log entry in the output.")
+    parser_analyze.add_argument("--no-cache", action="store_true", help="Re-analyse the image even if it hasn't changed since the results were cached.")
+
+    # --- HIKVISION CASE-ANALYZE ---
+    parser_case = hik_subparsers.add_parser("case-analyze", help="Analyse and catalogue every disk image of a multi-disk case in parallel.")
+    parser_case.add_argument("--image", required=True, action="append", nargs="+", help="Paths to the disk images of the case (one per drive).")
+    parser_case.add_argument("-d", "--output-dir", required=True, help="Directory to save the per-disk results and the merged case_catalogue.db in.")
+    parser_case.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per disk).")
+    parser_case.add_argument("--no-hex-preview", action="store_true", help="Don't include raw hex previews of each log entry in the output.")
+    parser_case.add_argument("--no-cache", action="store_true", help="Re-analyse disks even if they haven't changed since the results were cached.")
 
     # --- HIKVISION EXTRACT ---
     parser_extract = hik_subparsers.add_parser("extract", help="Extract a single video block from a disk image.")
     parser_extract.add_argument("--image", required=True, help="Path to the disk image file.")
     parser_extract.add_argument("--master-file", required=True, help="Path to the master_sector.json file.")
     parser_extract.add_argument("--offset", required=True, help="The hex offset of the data block to extract (e.g., '0xfc4c5e000').")
-    parser_extract.add_argument("-d", "--output-dir", required=True, help="Directory to save the extracted .h264 file.")
+    parser_extract.add_argument("-d", "--output-dir", required=True, help="Directory to save the extracted video file.")
     parser_extract.add_argument("--extra-offset", type=int, default=0, help="Extra offset value from master sector parsing.")
+    parser_extract.add_argument("--container", choices=["h264", "mp4", "mkv"], default="h264", help="Output format. mp4/mkv remux the video (no re-encode) with timestamps from the IDR table and a seek index (default: h264).")
+    parser_extract.add_argument("--case-db", help="Case database (SQLite) to record the SHA-256 of the source range and output in.")
+    parser_extract.add_argument("--md5", action="store_true", help="Also compute MD5 digests.")
+
+    # --- HIKVISION CATALOGUE ---
+    parser_catalogue = hik_subparsers.add_parser("catalogue", help="Build a time-indexed recording catalogue (SQLite) for a disk image.")
+    parser_catalogue.add_argument("--image", required=True, help="Path to the disk image file.")
+    parser_catalogue.add_argument("--master-file", required=True, help="Path to the master_sector.json file.")
+    parser_catalogue.add_argument("--hikbtree-file", required=True, help="Path to the hikbtree.json file generated by the 'hikbtree' command.")
+    parser_catalogue.add_argument("--extra-offset", type=int, default=0, help="Extra offset value from master sector parsing.")
+    parser_catalogue.add_argument("-o", "--output-file", required=True, help="Path to save the catalogue database.")
+
+    # --- HIKVISION LOCATE ---
+    parser_locate = hik_subparsers.add_parser("locate", help="Find the byte ranges recorded on a channel within a time range.")
+    parser_locate.add_argument("--catalogue", required=True, help="Path to the catalogue database generated by the 'catalogue' command.")
+    parser_locate.add_argument("--channel", required=True, type=int, help="Channel number to query.")
+    parser_locate.add_argument("--start", required=True, type=parse_timestamp, help="Start of the time range (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_locate.add_argument("--end", required=True, type=parse_timestamp, help="End of the time range (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_locate.add_argument("-d", "--output-dir", help="If set, carve each byte range to a .h264 file in this directory.")
+    parser_locate.add_argument("--image", help="Path to the disk image file (defaults to the image(s) the catalogue was built from).")
+    parser_locate.add_argument("--case-db", help="Case database (SQLite) to record the SHA-256 of the source range and output in.")
+    parser_locate.add_argument("--md5", action="store_true", help="Also compute MD5 digests.")
+
+    # --- HIKVISION TIMELINE ---
+    parser_timeline = hik_subparsers.add_parser("timeline", help="Reconstruct one continuous video stream for a channel and time range.")
+    parser_timeline.add_argument("--catalogue", required=True, help="Path to the catalogue database generated by the 'catalogue' command.")
+    parser_timeline.add_argument("--channel", required=True, type=int, help="Channel number to reconstruct.")
+    parser_timeline.add_argument("--start", required=True, type=parse_timestamp, help="Start of the time range (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_timeline.add_argument("--end", required=True, type=parse_timestamp, help="End of the time range (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_timeline.add_argument("-o", "--output-file", required=True, help="Path to save the reconstructed .h264 stream.")
+    parser_timeline.add_argument("--image", help="Path to the disk image file (defaults to the image(s) the catalogue was built from).")
+    parser_timeline.add_argument("--gap-threshold", type=int, default=2, help="Insert a gap marker where consecutive segments are more than this many seconds apart (default: 2).")
+    parser_timeline.add_argument("--workers", type=int, default=None, help="Number of concurrent reads (default: 4).")
+    parser_timeline.add_argument("--case-db", help="Case database (SQLite) to record the SHA-256 of the source range and output in.")
+    parser_timeline.add_argument("--md5", action="store_true", help="Also compute MD5 digests.")
+
+    # --- HIKVISION QUERY ---
+    parser_query = hik_subparsers.add_parser("query", help="Return one page of filtered rows from a case database.")
+    parser_query.add_argument("--case-db", required=True, help="Path to the case database written with --case-db.")
+    parser_query.add_argument("--table", required=True, choices=["master", "pages", "entries", "logs", "carve", "exports"], help="Which artefact to query.")
+    parser_query.add_argument("--channel", type=int, help="Only return HIKBTREE entries for this channel.")
+    parser_query.add_argument("--start", type=parse_timestamp, help="Only return rows at or after this time (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_query.add_argument("--end", type=parse_timestamp, help="Only return rows at or before this time (unix timestamp or 'YYYY-MM-DD HH:MM:SS').")
+    parser_query.add_argument("--log-type", type=lambda value: int(value, 0), help="Only return system logs of this type code (e.g. 1 or 0x01).")
+    parser_query.add_argument("--page-number", type=int, help="Only return rows from this HIKBTREE page.")
+    parser_query.add_argument("--video-only", action="store_true", help="Only return HIKBTREE entries that have video data.")
+    parser_query.add_argument("--kind", help="Only return carve-scan hits or exports of this kind (e.g. 'h264_sps', 'extract').")
+    parser_query.add_argument("--limit", type=int, default=100, help="Maximum number of rows to return.")
+    parser_query.add_argument("--offset", type=int, default=0, help="Number of matching rows to skip.")
+
+    # --- HIKVISION CARVE-SCAN ---
+    parser_carve = hik_subparsers.add_parser("carve-scan", help="Sweep the whole image for HIKBTREE, IDR table, log and H.264 signatures.")
+    parser_carve.add_argument("--image", required=True, help="Path to the disk image file.")
+    parser_carve.add_argument("--case-db", required=True, help="Case database (SQLite) to record the hits in, query them with 'query --table carve'.")
+    parser_carve.add_argument("--start-offset", type=lambda value: int(value, 0), default=0, help="Address to start the sweep at (default: 0).")
+    parser_carve.add_argument("--end-offset", type=lambda value: int(value, 0), default=None, help="Address to stop the sweep at (default: end of image).")
+    parser_carve.add_argument("--chunk-size", type=int, default=64, help="Size of each read in MB (default: 64).")
+    parser_carve.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs).")
 
     return parser
\ No newline at end of file
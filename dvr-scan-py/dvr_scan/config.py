@@ -346,10 +346,25 @@ CONFIG_MAP: ConfigDict = {
     "kernel-size": KernelSizeValue(),
     "downscale-factor": 0,
     "learning-rate": float(-1),
+    "tile-count": 0,
+    "cascade-gate": False,
+    "cascade-threshold": 10.0,
+    "cascade-interval": 10,
+    "skip-duplicates": False,
+    "load-background": "",
+    "save-background": "",
+    "prescreen": False,
+    "prescreen-threshold": 0.005,
+    "window-margin-before": TimecodeValue("5s"),
+    "window-margin-after": TimecodeValue("10s"),
+    "window-warmup": TimecodeValue("1s"),
     # TODO(1.9): Remove, has been replaced with region files.
     "region-of-interest": RegionValueDeprecated(),
     "load-region": "",
     "frame-skip": 0,
+    "adaptive-frame-skip": 0,
+    "decoder-skip": "none",
+    "two-pass": False,
     # Overlays
     # Text Overlays
     "time-code": False,
@@ -384,10 +399,11 @@ certain string options are stored in `CHOICE_MAP`."""
 
 CHOICE_MAP: ty.Dict[str, ty.List[str]] = {
     "input-mode": ["opencv", "pyav", "moviepy"],
+    "decoder-skip": ["none", "nonref", "nonkey"],
     "opencv-codec": ["XVID", "MP4V", "MP42", "H264"],
     "output-mode": ["scan_only", "opencv", "copy", "ffmpeg"],
     "verbosity": ["debug", "info", "warning", "error"],
-    "bg-subtractor": ["MOG2", "CNT", "MOG2_CUDA"],
+    "bg-subtractor": ["MOG2", "CNT", "MOG2_CUDA", "MOG2_TILED", "AVG"],
     "thumbnails": ["highscore"],
 }
 """Mapping of string options which can only be of a particular set of values. We use a list instead
@@ -13,6 +13,7 @@
 This module manages the DVR-Scan program control flow, starting with `run_dvr_scan()`.
 """
 
+import argparse
 import logging
 import time
 import typing as ty
@@ -20,6 +21,7 @@ from pathlib import Path
 import json
 from tqdm import tqdm 
 from scenedetect import FrameTimecode
+from scenedetect.backends import AVAILABLE_BACKENDS
 
 import dvr_scan
 from dvr_scan.cli import get_cli_parser
@@ -27,6 +29,10 @@ from dvr_scan.config import ConfigLoadFailure, ConfigRegistry, RegionValueDeprec
 from dvr_scan.scanner import DetectorType, OutputMode
 from dvr_scan.shared import ScanSettings, init_logging, init_scanner, logfile_path, setup_logger
 from dvr_scan.extractor import run_extractor
+from dvr_scan.hikvision.extractor import image_stream_inputs
+from dvr_scan.hikvision.helpers import ImageReader
+from dvr_scan.hikvision.system_logs import alarm_timestamps
+from dvr_scan.shared.cli import timecode_type_check
 
 logger = logging.getLogger("dvr_scan")
 
@@ -46,6 +52,23 @@ def _preprocess_args(args):
                     return False, None
                 input_files += expanded
     args.input = input_files
+    # --image: scan video carved directly from a disk image
+    if hasattr(args, "image"):
+        if input_files:
+            logger.error("Error: -i/--input and --image cannot be used together.")
+            return False, None
+        args.input = _image_inputs(args)
+        if not args.input:
+            return False, None
+    elif not input_files:
+        logger.error("Error: No input specified, use -i/--input or --image.")
+        return False, None
+
+    # --scan-windows/--alarm-logs
+    if hasattr(args, "scan_windows") or hasattr(args, "alarm_logs"):
+        args.scan_windows = _scan_windows(args)
+        if not args.scan_windows:
+            return False, None
 
     # -o/--output
     if hasattr(args, "output") and "." not in args.output:
@@ -68,6 +91,88 @@ def _preprocess_args(args):
     return True, args
 
 
+def _image_inputs(args):
+    """Builds the inputs for `scan --image`, returning None if they are invalid."""
+    blocks = getattr(args, "image_block", None) or []
+    ranges = getattr(args, "image_range", None) or []
+    if not blocks and not ranges:
+        logger.error("Error: --image requires at least one --image-block or --image-range.")
+        return None
+    data_block_size = None
+    if blocks:
+        if not hasattr(args, "master_file"):
+            logger.error("Error: --image-block requires --master-file.")
+            return None
+        try:
+            with open(args.master_file, "r") as f:
+                data_block_size = json.load(f)["master_sector"]["data_block_size"]["value"]
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            # Also covers JSON which isn't the master sector saved by the master sector parser.
+            logger.error("Error: Could not read data block size from %s: %s", args.master_file, ex)
+            return None
+    # The reader stays open for the rest of the scan, inputs are carved as they are decoded.
+    reader = ImageReader(args.image)
+    try:
+        reader.open()
+    except (OSError, ImportError) as ex:
+        logger.error("Error: Could not open image %s: %s", args.image, ex)
+        return None
+    try:
+        return image_stream_inputs(
+            reader, blocks, ranges, data_block_size, getattr(args, "extra_offset", 0)
+        )
+    except (OSError, ValueError) as ex:
+        logger.error("Error: %s", str(ex))
+        reader.close()
+        return None
+
+
+def _scan_windows(args):
+    """Reads the windows for `scan --scan-windows/--alarm-logs`, returning None if they are invalid."""
+    windows = []
+    if hasattr(args, "scan_windows"):
+        check_time = timecode_type_check("time")
+        try:
+            with open(args.scan_windows, "r") as f:
+                lines = f.readlines()
+        except (OSError, ValueError) as ex:
+            logger.error("Error: Could not read scan windows from %s: %s", args.scan_windows, ex)
+            return None
+        for line_num, line in enumerate(lines, 1):
+            fields = line.split("#")[0].replace(",", " ").split()
+            if not fields:
+                continue
+            try:
+                if len(fields) != 2:
+                    raise ValueError("expected a start and end time")
+                windows.append(tuple(check_time(field) for field in fields))
+            except (ValueError, argparse.ArgumentTypeError) as ex:
+                logger.error("Error: Invalid window on line %d of %s: %s", line_num, args.scan_windows, ex)
+                return None
+    if hasattr(args, "alarm_logs"):
+        if not hasattr(args, "video_start_time"):
+            logger.error("Error: --alarm-logs requires --video-start-time.")
+            return None
+        try:
+            with open(args.alarm_logs, "r") as f:
+                timestamps = alarm_timestamps(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            # Also covers JSON which isn't the system logs saved by the log parser.
+            logger.error("Error: Could not read alarm logs from %s: %s", args.alarm_logs, ex)
+            return None
+        # Alarms are instants, the window margins decide how much video around them is scanned.
+        offsets = [float(timestamp - args.video_start_time) for timestamp in timestamps]
+        windows += [(offset, offset) for offset in offsets if offset >= 0]
+        logger.info(
+            "Found %d motion alarm(s) in the logs, %d after the start of the video.",
+            len(offsets),
+            len(windows),
+        )
+    if not windows:
+        logger.error("Error: No windows to scan.")
+    return windows
+
+
 def parse_settings() -> ty.Optional[ScanSettings]:
     """Parse command line options and load config file settings."""
     init_log = []
@@ -152,6 +257,43 @@ def parse_settings() -> ty.Optional[ScanSettings]:
                     "`pip install opencv-contrib-python`"
                 )
             return None
+        skip_modes = [
+            settings.get("frame-skip") > 0,
+            settings.get("adaptive-frame-skip") > 0,
+            settings.get("decoder-skip") != "none",
+        ]
+        if sum(skip_modes) > 1:
+            logger.error(
+                "Error: only one of --frame-skip, --adaptive-frame-skip, and --decoder-skip can be"
+                " used."
+            )
+            return None
+        for option in ("prescreen", "two-pass"):
+            if not settings.get(option):
+                continue
+            if settings.get_arg("scan-windows"):
+                logger.error(f"Error: --{option} can't be used with --scan-windows/--alarm-logs.")
+                return None
+            if "pyav" not in AVAILABLE_BACKENDS:
+                logger.error(
+                    f"Error: --{option} requires PyAV, you may need to run: `pip install av`"
+                )
+                return None
+        if settings.get("prescreen") and settings.get("two-pass"):
+            logger.error("Error: --prescreen and --two-pass can't be used together.")
+            return None
+        if settings.get("two-pass") and settings.get_arg("image"):
+            # Frames can't be dropped in the decoder for carved inputs, so the first pass would
+            # decode every frame.
+            logger.error("Error: --two-pass can't be used with --image.")
+            return None
+        save_background = settings.get("save-background")
+        if save_background and not Path(save_background).parent.is_dir():
+            logger.error(
+                "Error: Directory to save background snapshot to does not exist: %s",
+                Path(save_background).parent,
+            )
+            return None
 
     return settings
 
@@ -206,7 +348,17 @@ def run_dvr_scan(
     if not result.event_list:
         logger.info("No motion events detected in input.")
         if settings.get_arg("json_output"):
-            print(json.dumps({"type": "complete", "events": []}), flush=True)
+            print(
+                json.dumps(
+                    {
+                        "type": "complete",
+                        "events": [],
+                        "framesGated": result.num_frames_gated,
+                        "framesDuplicate": result.num_frames_duplicate,
+                    }
+                ),
+                flush=True,
+            )
         return None
 
     logger.info("Detected %d motion events in input.", len(result.event_list))
@@ -221,7 +373,17 @@ def run_dvr_scan(
             }
             for i, event in enumerate(result.event_list)
         ]
-        print(json.dumps({"type": "complete", "events": event_data}), flush=True)
+        print(
+            json.dumps(
+                {
+                    "type": "complete",
+                    "events": event_data,
+                    "framesGated": result.num_frames_gated,
+                    "framesDuplicate": result.num_frames_duplicate,
+                }
+            ),
+            flush=True,
+        )
     else:
         if result.event_list:
             output_strs = [
@@ -17,7 +17,7 @@ represents the relative amount of movement of consecutive frames in a video.
 import logging
 import typing as ty
 from collections import namedtuple
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 import cv2
 import numpy as np
@@ -29,6 +29,10 @@ Rectangle = namedtuple("Rectangle", ["x", "y", "w", "h"])
 
 logger = logging.getLogger("dvr_scan")
 
+MAX_BATCH_FRAME_PIXELS = 640 * 360
+"""Largest (cropped and downscaled) frame size processed in batches. Batching avoids per-frame
+overhead, which dominates for small frames, but larger batches no longer fit in the CPU cache."""
+
 
 @dataclass
 class ProcessedFrame:
@@ -40,6 +44,86 @@ class ProcessedFrame:
     """The background mask with the specified ROIs applied."""
     score: float
     """Score representing relative amount of motion in this frame inside the specified ROIs."""
+    gated: bool = False
+    """True if the cascade gate found no motion, so the frame wasn't run through the subtractor."""
+    duplicate: bool = False
+    """True if the frame is identical to the previous one, so wasn't run through the subtractor."""
+
+
+class MotionGate:
+    """First stage of cascade detection. Compares a small grayscale thumbnail of each frame to a
+    running average of previous thumbnails, which is much cheaper than the full subtractor, and
+    only lets frames with differences through. Every `interval` frames are let through regardless,
+    so the full subtractor keeps learning the background while the scene is quiet."""
+
+    SIZE = (64, 36)
+    """Size of the thumbnails compared (width, height)."""
+
+    LEARNING_RATE = 0.05
+    """Weight of each new thumbnail in the running average."""
+
+    def __init__(self, threshold: float = 10.0, interval: int = 10):
+        """
+        Arguments:
+            threshold: Difference in intensity (0-255) of any thumbnail pixel from the average
+                which lets the frame through.
+            interval: Let every this many frames through while the scene is quiet.
+        """
+        if interval < 1:
+            raise ValueError("interval must be >= 1")
+        self._threshold = threshold
+        self._interval = interval
+        self._background = None
+        self._frames_since_passed = 0
+
+    def check(self, frame: np.ndarray) -> bool:
+        """Returns True if `frame` should be run through the full subtractor."""
+        thumbnail = cv2.resize(frame, self.SIZE, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        if self._background is None:
+            self._background = thumbnail.astype(np.float32)
+            return True
+        difference = cv2.absdiff(thumbnail, cv2.convertScaleAbs(self._background)).max()
+        cv2.accumulateWeighted(thumbnail, self._background, self.LEARNING_RATE)
+        self._frames_since_passed += 1
+        if difference > self._threshold or self._frames_since_passed >= self._interval:
+            self._frames_since_passed = 0
+            return True
+        return False
+
+
+class DuplicateFilter:
+    """Finds frames identical to the previous one, which some DVRs insert to pad low frame rate
+    recordings to a fixed rate. Encoders store those as frames which only repeat their reference,
+    so they decode to exactly the same pixels."""
+
+    ROW_STEP = 16
+    """Every this many rows are compared first, which rules out most frames which aren't duplicates
+    without comparing all of them."""
+
+    MAX_HELD = 8
+    """Duplicates in a row which keep the result of the frame they repeat. Longer runs are a static
+    scene rather than a low frame rate being padded, so the frames after those have no motion."""
+
+    def __init__(self):
+        self._previous: ty.Optional[np.ndarray] = None
+        self._repeats = 0
+
+    def check(self, frame: np.ndarray) -> int:
+        """Returns how many frames in a row up to `frame` were identical to the one before them, or
+        0 if `frame` isn't a duplicate."""
+        previous, self._previous = self._previous, frame
+        if (
+            previous is not None
+            and previous.shape == frame.shape
+            and np.array_equal(previous[:: self.ROW_STEP], frame[:: self.ROW_STEP])
+            and np.array_equal(previous, frame)
+        ):
+            self._repeats += 1
+        else:
+            self._repeats = 0
+        return self._repeats
 
 
 class MotionDetector:
@@ -51,8 +135,16 @@ class MotionDetector:
         frame_size: ty.Tuple[int, int],
         downscale: int,
         regions: ty.Optional[ty.Iterable[ty.Iterable[Rectangle]]],
+        gate: ty.Optional[MotionGate] = None,
+        duplicates: ty.Optional[DuplicateFilter] = None,
     ):
         self._subtractor = subtractor
+        self._gate = gate
+        self._duplicates = duplicates
+        # Result of the last frame, which duplicates of it share.
+        self._last_result: ty.Optional[ProcessedFrame] = None
+        # Result for frames stopped by the gate, created for the size of the first one.
+        self._gated_result: ty.Optional[ProcessedFrame] = None
         self._frame_size = frame_size
         self._downscale = downscale
         self._regions = list(regions) if regions is not None else []
@@ -110,15 +202,87 @@ class MotionDetector:
         return cropped
 
     def update(self, frame: np.ndarray) -> ProcessedFrame:
-        frame = self._preprocess(frame)
-        subtracted = self._subtractor.apply(frame)
+        return self.update_batch([frame])[0]
+
+    def update_batch(self, frames: ty.Sequence[np.ndarray]) -> ty.List[ProcessedFrame]:
+        """Process consecutive frames together, with the same results as calling `update` on each
+        in order. Lets subtractors which support it process the whole batch at once."""
+        cropped = [self._preprocess(frame) for frame in frames]
+        if self._gate is None and self._duplicates is None:
+            return self._detect(cropped)
+        duplicates = [
+            self._duplicates.check(frame) if self._duplicates is not None else 0
+            for frame in cropped
+        ]
+        passed = [
+            not duplicate and (self._gate is None or self._gate.check(frame))
+            for frame, duplicate in zip(cropped, duplicates)
+        ]
+        detected = iter(self._detect([frame for frame, check in zip(cropped, passed) if check]))
+        results = []
+        for frame, duplicate, check in zip(cropped, duplicates, passed):
+            # Duplicates aren't run through the subtractor, so they don't skew what it learns.
+            if duplicate > DuplicateFilter.MAX_HELD:
+                result = replace(self._gated(frame), gated=False, duplicate=True)
+            elif duplicate:
+                result = replace(self._last_result, gated=False, duplicate=True)
+            else:
+                result = next(detected) if check else self._gated(frame)
+            self._last_result = result
+            results.append(result)
+        return results
+
+    def train(self, frames: ty.Sequence[np.ndarray]):
+        """Run frames through the subtractor only to learn the background, e.g. from a snapshot
+        saved by a previous scan. Bypasses the cascade gate and duplicate filter."""
+        self._detect([self._preprocess(frame) for frame in frames])
+
+    def _detect(self, cropped: ty.List[np.ndarray]) -> ty.List[ProcessedFrame]:
+        if not cropped:
+            return []
+        # Frames with an unexpected size can't be stacked, and large frames are faster one at a time.
+        if (
+            len(cropped) == 1
+            or cropped[0].shape[0] * cropped[0].shape[1] > MAX_BATCH_FRAME_PIXELS
+            or any(frame.shape != cropped[0].shape for frame in cropped)
+        ):
+            return [self._score(self._subtractor.apply(frame)) for frame in cropped]
+        batch = np.empty((len(cropped), *cropped[0].shape), dtype=cropped[0].dtype)
+        for frame, batch_frame in zip(cropped, batch):
+            if frame.ndim == 3 and frame.shape[2] == 3 and frame.dtype == np.uint8:
+                # Copying each pixel as a single item is about twice as fast as copying the
+                # channels separately when the frame is downscaled (and so not contiguous).
+                batch_frame.view("V3")[...] = frame.view("V3")
+            else:
+                batch_frame[...] = frame
+        subtracted = self._subtractor.apply_batch(batch)
+        # Sums of the masks are exact, so scoring them together gives the same results as `update`.
+        if not self._regions:
+            scores = subtracted.mean(axis=(1, 2))
+        else:
+            active = np.logical_not(self._mask)
+            scores = subtracted[:, active].sum(axis=1) / float(active.sum())
+        return [self._score(mask, score) for mask, score in zip(subtracted, scores)]
+
+    def _gated(self, frame: np.ndarray) -> ProcessedFrame:
+        if self._gated_result is None or self._gated_result.subtracted.shape != frame.shape[:2]:
+            empty = np.zeros(frame.shape[:2], dtype=np.uint8)
+            self._gated_result = self._score(empty, score=0.0)
+            self._gated_result.gated = True
+        return self._gated_result
+
+    def _score(self, subtracted: np.ndarray, score: ty.Optional[float] = None) -> ProcessedFrame:
         if not self._regions:
             return ProcessedFrame(
-                subtracted=subtracted, masked=subtracted, score=np.average(subtracted)
+                subtracted=subtracted,
+                masked=subtracted,
+                score=np.average(subtracted) if score is None else score,
             )
         motion_mask = np.ma.array(subtracted, mask=self._mask)
         return ProcessedFrame(
             subtracted=subtracted,
             masked=motion_mask,
-            score=np.ma.sum(motion_mask) / float(np.ma.count(motion_mask)),
+            score=(
+                np.ma.sum(motion_mask) / float(np.ma.count(motion_mask)) if score is None else score
+            ),
         )
@@ -14,7 +14,7 @@ try:
 except ImportError:
     HAS_EWF = False
 
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+logger = logging.getLogger("dvr_scan")
 
 class ImageReader:
     def __init__(self, image_path):
@@ -38,7 +38,7 @@ class ImageReader:
             self.is_ewf = False
             self.handle.seek(0, 2)
             self.image_size = self.handle.tell()
-        logging.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
+        logger.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
         return True
 
     def close(self):
@@ -71,7 +71,7 @@ class VideoExtractor:
             with open(master_file, 'r') as f:
                 data_block_size = json.load(f)['master_sector']['data_block_size']['value']
         except (FileNotFoundError, KeyError) as e:
-            logging.error(f"FATAL: Could not read data block size from '{master_file}'. Error: {e}")
+            logger.error(f"FATAL: Could not read data block size from '{master_file}'. Error: {e}")
             return False, None
 
         block_start_addr = int(target_offset_str, 16) + extra_offset
@@ -79,7 +79,7 @@ class VideoExtractor:
         idr_records = self.idr_parser.parse_single_data_block(block_start_addr, data_block_size)
 
         if not idr_records:
-            logging.error(f"Could not parse IDR table for block {target_offset_str}. Cannot determine video boundaries.")
+            logger.error(f"Could not parse IDR table for block {target_offset_str}. Cannot determine video boundaries.")
             return False, None
 
         video_end_addr = idr_records[0]['address']
@@ -97,13 +97,13 @@ class VideoExtractor:
         carve_size = block_info['end'] - block_info['start']
 
         if carve_size <= 0:
-            logging.error("Calculated video data size is zero or negative. Cannot extract.")
+            logger.error("Calculated video data size is zero or negative. Cannot extract.")
             return False
             
-        logging.info(f"Carving {carve_size / 1024**2:.2f} MB of raw video data...")
+        logger.info(f"Carving {carve_size / 1024**2:.2f} MB of raw video data...")
         raw_video_data = self.reader.read(carve_start, carve_size)
         
-        logging.info("Cleaning stream: isolating all standard H.264 NAL units...")
+        logger.info("Cleaning stream: isolating all standard H.264 NAL units...")
         
         cleaned_data = bytearray()
         current_pos = 0
@@ -126,19 +126,19 @@ class VideoExtractor:
             nal_unit_count += 1
             
         if not cleaned_data:
-            logging.error("No H.264 NAL units could be found in the data block.")
+            logger.error("No H.264 NAL units could be found in the data block.")
             return False
 
-        logging.info(f"Found and stitched together {nal_unit_count} NAL units.")
+        logger.info(f"Found and stitched together {nal_unit_count} NAL units.")
         
         try:
-            logging.info(f"Saving cleaned video stream to '{output_filename}'...")
+            logger.info(f"Saving cleaned video stream to '{output_filename}'...")
             with open(output_filename, 'wb') as f:
                 f.write(cleaned_data)
-            logging.info(f"SUCCESS! File saved. Try opening it with a media player like VLC.")
+            logger.info(f"SUCCESS! File saved. Try opening it with a media player like VLC.")
             return True
         except IOError as e:
-            logging.error(f"Failed to write video file. Error: {e}")
+            logger.error(f"Failed to write video file. Error: {e}")
             return False
 
 def run_extractor(args):
@@ -159,7 +159,7 @@ def run_extractor(args):
             print(json.dumps({"type": "error", "message": "Video extraction failed."}), flush=True)
 
     except Exception as e:
-        logging.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
+        logger.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
         print(json.dumps({"type": "error", "message": f"An unexpected error occurred: {e}"}), flush=True)
         sys.exit(1)
     finally:
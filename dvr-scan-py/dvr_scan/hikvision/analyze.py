@@ -0,0 +1,168 @@
+# dvr-scan-py/dvr_scan/hikvision/analyze.py
+
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dvr_scan.hikvision.case_store import CaseStore
+from dvr_scan.hikvision.helpers import ProgressReporter
+from dvr_scan.hikvision.hikbtree import HikbtreeParser
+from dvr_scan.hikvision.master_sector import MasterSectorParser
+from dvr_scan.hikvision.system_logs import SystemLogParser
+
+logger = logging.getLogger("dvr_scan")
+
+# Size of each of the regions hashed to fingerprint an image (start, middle and end).
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+
+def image_fingerprint(reader):
+    """
+    Identifies an image by its size, modification time and a SHA-256 over samples of
+    its start, middle and end. Hashing the whole image would take as long as analysing
+    it, the samples are enough to tell a different or modified image apart.
+    """
+    size = reader.image_size
+    sample = hashlib.sha256()
+    for offset in sorted({0, max(0, size // 2 - FINGERPRINT_SAMPLE_SIZE // 2), max(0, size - FINGERPRINT_SAMPLE_SIZE)}):
+        sample.update(reader.read(offset, min(FINGERPRINT_SAMPLE_SIZE, size - offset)))
+    return {
+        "size": size,
+        "mtime": int(os.path.getmtime(reader.image_path)),
+        "sample_sha256": sample.hexdigest(),
+    }
+
+
+class AnalysisPipeline:
+    """
+    Runs master sector, HIKBTREE and system log parsing on an image in one process,
+    sharing a single open image and passing the master sector results in memory. The
+    HIKBTREE and logs only depend on the master sector, so they are parsed concurrently.
+
+    Results are cached in the output directory keyed by the image fingerprint, so
+    re-opening a case that has already been analysed returns immediately.
+    """
+
+    MASTER_FILE = "master_sector.json"
+    HIKBTREE_FILE = "hikbtree.json"
+    LOGS_FILE = "system_logs.json"
+    CACHE_FILE = "analysis_cache.json"
+    STAGES = ("master", "hikbtree", "logs")
+
+    def __init__(self, image_reader, output_dir, case_db=None, include_previews=True, on_stage=None,
+                 report_progress=False):
+        self.reader = image_reader
+        self.output_dir = output_dir
+        self.case_db = case_db
+        self.include_previews = include_previews
+        # Called with (stage, success, output_file) as each stage finishes.
+        self.on_stage = on_stage
+        # Print `hik_progress` events for the HIKBTREE and log stages (see ProgressReporter).
+        self.report_progress = report_progress
+        self.outputs = {
+            "master": os.path.join(output_dir, self.MASTER_FILE),
+            "hikbtree": os.path.join(output_dir, self.HIKBTREE_FILE),
+            "logs": os.path.join(output_dir, self.LOGS_FILE),
+        }
+
+    def run(self, use_cache=True):
+        """Runs (or loads from the cache) every stage. Returns a summary dict."""
+        start = time.time()
+        os.makedirs(self.output_dir, exist_ok=True)
+        fingerprint = image_fingerprint(self.reader)
+        cache_key = {"fingerprint": fingerprint, "case_db": self.case_db, "include_previews": self.include_previews}
+
+        cached = self._load_cache(cache_key) if use_cache else None
+        if cached is not None:
+            logger.info("Image has not changed since it was last analysed, using the cached results.")
+            for stage in self.STAGES:
+                self._stage_done(stage, True)
+            return self._summary(cached['extra_offset'], dict.fromkeys(self.STAGES, True), fingerprint, True, start)
+
+        stages = dict.fromkeys(self.STAGES, False)
+        master = MasterSectorParser(self.reader)
+        case_store = CaseStore(self.case_db) if self.case_db else None
+        try:
+            extra_offset = master.run_parser(self.outputs['master'], case_store)
+        finally:
+            if case_store: case_store.close()
+        stages['master'] = extra_offset is not None
+        self._stage_done('master', stages['master'])
+        if not stages['master']:
+            return self._summary(None, stages, fingerprint, False, start)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = {
+                'hikbtree': executor.submit(self._run_hikbtree, master.analysis_results, extra_offset),
+                'logs': executor.submit(self._run_logs, master.analysis_results, extra_offset),
+            }
+            for stage, future in futures.items():
+                try:
+                    stages[stage] = bool(future.result())
+                except Exception as e:
+                    logger.error(f"The {stage} stage failed: {e}", exc_info=True)
+                self._stage_done(stage, stages[stage])
+
+        if all(stages.values()):
+            self._save_cache(cache_key, extra_offset)
+        return self._summary(extra_offset, stages, fingerprint, False, start)
+
+    def _run_hikbtree(self, master_data, extra_offset):
+        # SQLite connections can't be shared between threads, each stage opens its own.
+        case_store = CaseStore(self.case_db) if self.case_db else None
+        try:
+            parser = HikbtreeParser(self.reader, progress=self._progress('hikbtree'))
+            return parser.parse(master_data, self.outputs['hikbtree'], extra_offset, case_store)
+        finally:
+            if case_store: case_store.close()
+
+    def _run_logs(self, master_data, extra_offset):
+        case_store = CaseStore(self.case_db) if self.case_db else None
+        try:
+            parser = SystemLogParser(self.reader, include_previews=self.include_previews, progress=self._progress('logs'))
+            return parser.parse(master_data, self.outputs['logs'], extra_offset, case_store)
+        finally:
+            if case_store: case_store.close()
+
+    def _progress(self, stage):
+        return ProgressReporter(stage, self.reader) if self.report_progress else None
+
+    def _stage_done(self, stage, success):
+        if self.on_stage is not None:
+            self.on_stage(stage, success, self.outputs[stage])
+
+    def _load_cache(self, cache_key):
+        cache_file = os.path.join(self.output_dir, self.CACHE_FILE)
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if cached.get('key') != cache_key:
+            return None
+        outputs = list(self.outputs.values()) + ([self.case_db] if self.case_db else [])
+        if not all(os.path.exists(path) for path in outputs):
+            return None
+        return cached
+
+    def _save_cache(self, cache_key, extra_offset):
+        cache_file = os.path.join(self.output_dir, self.CACHE_FILE)
+        with open(cache_file, 'w') as f:
+            json.dump({"key": cache_key, "extra_offset": extra_offset, "outputs": self.outputs}, f, indent=4)
+
+    def _summary(self, extra_offset, stages, fingerprint, cached, start):
+        return {
+            "success": all(stages.values()),
+            "cached": cached,
+            "elapsed_seconds": round(time.time() - start, 3),
+            "extra_offset": extra_offset,
+            "stages": stages,
+            "master_file": self.outputs['master'],
+            "hikbtree_file": self.outputs['hikbtree'],
+            "logs_file": self.outputs['logs'],
+            "case_db": self.case_db,
+            "fingerprint": fingerprint,
+        }
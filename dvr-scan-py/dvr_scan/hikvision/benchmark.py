@@ -0,0 +1,135 @@
+# dvr-scan-py/dvr_scan/hikvision/benchmark.py
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from dvr_scan.hikvision.synthetic import SyntheticImageBuilder, parse_size
+
+logger = logging.getLogger("dvr_scan")
+
+
+class HikvisionBenchmark:
+    """
+    Times every `hikvision` subcommand end to end (as a subprocess, exactly as the UI
+    runs them) against a synthetic image written by `SyntheticImageBuilder`, so parser
+    changes can be checked for speed regressions at disk sizes we don't have images of.
+    """
+
+    def __init__(self, work_dir, builder, repeat=1):
+        self.work_dir = work_dir
+        self.builder = builder
+        self.repeat = repeat
+        self.image = os.path.join(work_dir, "synthetic.dd")
+
+    def _commands(self, image_info):
+        """Returns (name, args) for each subcommand, in the order they depend on each other."""
+        out = lambda name: os.path.join(self.work_dir, name)
+        master, hikbtree, extra = out("master_sector.json"), out("hikbtree.json"), str(image_info['extra_offset'])
+        # A window inside the first block of channel 1, so locate/timeline only read a few keyframes.
+        start = image_info['start_time'] + self.builder.block_duration // 4
+        end = start + self.builder.block_duration // 4
+        return [
+            ("master", ["master", "--image", self.image, "-o", master, "--case-db", out("case.db")]),
+            ("hikbtree", ["hikbtree", "--image", self.image, "--master-file", master, "--extra-offset", extra,
+                          "-o", hikbtree, "--case-db", out("case.db")]),
+            ("logs", ["logs", "--image", self.image, "--master-file", master, "--extra-offset", extra,
+                      "-o", out("system_logs.json"), "--case-db", out("case.db"), "--no-hex-preview"]),
+            ("analyze", ["analyze", "--image", self.image, "-d", out("analyze"), "--no-cache", "--no-hex-preview"]),
+            ("catalogue", ["catalogue", "--image", self.image, "--master-file", master, "--hikbtree-file", hikbtree,
+                           "--extra-offset", extra, "-o", out("catalogue.db")]),
+            ("locate", ["locate", "--catalogue", out("catalogue.db"), "--channel", "1", "--start", str(start),
+                        "--end", str(end), "-d", out("locate")]),
+            ("timeline", ["timeline", "--catalogue", out("catalogue.db"), "--channel", "1", "--start", str(start),
+                          "--end", str(end), "-o", out("timeline.h264")]),
+            ("extract", ["extract", "--image", self.image, "--master-file", master,
+                         "--offset", hex(image_info['video_data_offset']), "--extra-offset", extra, "-d", out("extract")]),
+            ("query", ["query", "--case-db", out("case.db"), "--table", "entries", "--channel", "1", "--limit", "1000"]),
+            # Sweeping the whole (mostly sparse) image would only time reading zeros.
+            ("carve-scan", ["carve-scan", "--image", self.image, "--case-db", out("case.db"),
+                            "--end-offset", hex(image_info['video_data_offset'] + 2 * image_info['data_block_size'])]),
+            ("case-analyze", ["case-analyze", "--image", self.image, "-d", out("case"), "--no-cache", "--no-hex-preview"]),
+        ]
+
+    def run(self, commands=None, reuse_image=False):
+        """Writes the image (unless reusing one) and times each subcommand. Returns a results dict."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        if reuse_image and os.path.exists(self.image):
+            image_info = {"path": self.image, **self.builder.layout(), "extra_offset": self.builder.extra_offset,
+                          "data_block_size": self.builder.data_block_size, "start_time": self.builder.start_time}
+        else:
+            image_info = self.builder.write(self.image)
+
+        results = {}
+        for name, args in self._commands(image_info):
+            if commands and name not in commands:
+                continue
+            timings = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                proc = subprocess.run([sys.executable, "-m", "dvr_scan", "hikvision", *args],
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                timings.append(time.perf_counter() - start)
+                if proc.returncode != 0:
+                    logger.error(f"'{name}' failed (exit code {proc.returncode}):\n{proc.stderr[-2000:]}")
+                    break
+            results[name] = {"success": proc.returncode == 0, "seconds": round(min(timings), 3)}
+            logger.info(f"{name}: {results[name]['seconds']:.3f}s")
+        return {"image": image_info, "results": results}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the commands in `results` that are more than `tolerance` (a fraction) slower
+    than in `baseline`, or that failed, as a list of dicts.
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        previous = baseline['results'].get(name)
+        if not result['success']:
+            regressions.append({"command": name, "reason": "failed"})
+        elif previous and previous['success'] and result['seconds'] > previous['seconds'] * (1 + tolerance):
+            regressions.append({"command": name, "reason": "slower", "seconds": result['seconds'],
+                                "baseline_seconds": previous['seconds']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hikvision subcommands against a synthetic disk image.")
+    parser.add_argument("-d", "--work-dir", required=True, help="Directory to write the image and command outputs to.")
+    parser.add_argument("--disk-size", type=parse_size, default=parse_size("4T"), help="Logical size of the image (default: 4T).")
+    parser.add_argument("--pages", type=int, default=8, help="Number of HIKBTREE pages (default: 8).")
+    parser.add_argument("--entries-per-page", type=int, default=64, help="Data blocks listed per page (default: 64).")
+    parser.add_argument("--block-size", type=parse_size, default=parse_size("256M"), help="Size of each data block (default: 256M).")
+    parser.add_argument("--logs", type=int, default=10000, help="Number of system log entries (default: 10000).")
+    parser.add_argument("--extra-offset", type=int, default=0, help="Bytes to shift the whole layout by (default: 0).")
+    parser.add_argument("--commands", nargs="+", help="Only run these subcommands.")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each command this many times and keep the fastest (default: 1).")
+    parser.add_argument("--reuse-image", action="store_true", help="Reuse an image already in the work directory.")
+    parser.add_argument("--save", help="Save the results to this JSON file, for use with --compare.")
+    parser.add_argument("--compare", help="Fail if any command is slower than in this saved results file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against --compare, as a fraction (default: 0.25).")
+    args = parser.parse_args()
+
+    builder = SyntheticImageBuilder(num_pages=args.pages, entries_per_page=args.entries_per_page,
+                                    data_block_size=args.block_size, num_logs=args.logs,
+                                    extra_offset=args.extra_offset, disk_size=args.disk_size)
+    results = HikvisionBenchmark(args.work_dir, builder, repeat=args.repeat).run(args.commands, args.reuse_image)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    print(json.dumps({"type": "hik_benchmark_complete", **results, "regressions": regressions}), flush=True)
+    if regressions or not all(result['success'] for result in results['results'].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# dvr-scan-py/dvr_scan/hikvision/carver.py
+
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from dvr_scan.hikvision.helpers import ImageReader
+
+logger = logging.getLogger("dvr_scan")
+
+# Hit kinds, the signature searched for, and the size of one matching structure.
+HIKBTREE = "hikbtree"
+IDR_TABLE = "idr_table"
+SYSTEM_LOG = "system_log"
+H264_SPS = "h264_sps"
+H264_IDR = "h264_idr"
+
+H264_START_CODE = b'\x00\x00\x00\x01'
+SIGNATURES = {
+    HIKBTREE: b'HIKBTREE',
+    # 'OFNI' followed by the 56 byte record size, so stray 'OFNI' bytes in video don't match.
+    IDR_TABLE: b'OFNI\x38\x00\x00\x00',
+    SYSTEM_LOG: b'RATS\x14\x00\x00\x00',
+}
+RECORD_SIZES = {HIKBTREE: 8, IDR_TABLE: 56, SYSTEM_LOG: 14, H264_SPS: 5, H264_IDR: 5}
+# Hits of the same kind closer than this are merged into a single run in the index, so
+# a 4 TB disk produces runs (tables, log regions, video streams) rather than billions of rows.
+MAX_RUN_GAP = {HIKBTREE: 0, IDR_TABLE: 0, SYSTEM_LOG: 4096, H264_SPS: 4 * 1024 * 1024, H264_IDR: 4 * 1024 * 1024}
+# Every pattern is shorter than this, chunks overlap by it so boundary hits aren't missed.
+CHUNK_OVERLAP = 8
+
+
+def sweep_chunk(data, base_addr, limit):
+    """
+    Finds every signature starting in `data[:limit]`, returning a dict mapping each hit
+    kind to a list of [start, end, count] runs (absolute addresses, `base_addr` being
+    the address of `data[0]`).
+    """
+    runs = {kind: [] for kind in RECORD_SIZES}
+
+    def add_hit(kind, pos):
+        start = base_addr + pos
+        end = start + RECORD_SIZES[kind]
+        kind_runs = runs[kind]
+        if kind_runs and start - kind_runs[-1][1] <= MAX_RUN_GAP[kind]:
+            kind_runs[-1][1] = end
+            kind_runs[-1][2] += 1
+        else:
+            kind_runs.append([start, end, 1])
+
+    for kind, signature in SIGNATURES.items():
+        pos = data.find(signature, 0, limit + len(signature) - 1)
+        while pos != -1:
+            add_hit(kind, pos)
+            pos = data.find(signature, pos + 1, limit + len(signature) - 1)
+
+    # One pass for all start codes, classified by the NAL unit type that follows.
+    pos = data.find(H264_START_CODE, 0, limit + 3)
+    while pos != -1:
+        if pos + 4 < len(data):
+            nal_header = data[pos + 4]
+            # The forbidden zero bit must be clear and SPS/IDR NALs are always referenced.
+            if not nal_header & 0x80 and nal_header & 0x60:
+                if nal_header & 0x1F == 7:
+                    add_hit(H264_SPS, pos)
+                elif nal_header & 0x1F == 5:
+                    add_hit(H264_IDR, pos)
+        pos = data.find(H264_START_CODE, pos + 1, limit + 3)
+    return runs
+
+
+_worker_readers = {}
+
+def _sweep_image_chunk(image_path, start, size):
+    """Reads and sweeps one chunk of an image, run on a worker process."""
+    reader = _worker_readers.get(image_path)
+    if reader is None:
+        reader = _worker_readers[image_path] = ImageReader(image_path)
+        reader.open()
+    data = reader.read(start, size + CHUNK_OVERLAP)
+    return start, size, sweep_chunk(data, start, min(size, len(data)))
+
+
+class CarveScanner:
+    """
+    Sweeps a whole disk image for Hikvision structures and H.264 video independently of
+    the HIKBTREE, so recordings that are no longer indexed (overwritten index pages,
+    damaged trees, deleted data) can still be found. The image is read in large chunks
+    which are searched on a pool of worker processes, and hits are merged into runs.
+    """
+
+    CHUNK_SIZE = 64 * 1024 * 1024
+    WORKERS = os.cpu_count() or 1
+
+    def __init__(self, image_reader, chunk_size=None, workers=None):
+        self.reader = image_reader
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.workers = workers or self.WORKERS
+
+    def iter_runs(self, start=0, end=None):
+        """
+        Sweeps [start, end) and yields (kind, start, end, count) runs. Runs of a kind are
+        yielded in address order once no later hit could extend them.
+        """
+        end = self.reader.image_size if end is None else min(end, self.reader.image_size)
+        chunks = ((addr, min(self.chunk_size, end - addr)) for addr in range(start, end, self.chunk_size))
+        open_runs = {}
+        for chunk_start, chunk_size, chunk_runs in self._sweep_chunks(chunks):
+            chunk_end = chunk_start + chunk_size
+            for kind, kind_runs in chunk_runs.items():
+                for run in kind_runs:
+                    current = open_runs.get(kind)
+                    if current is not None and run[0] - current[1] <= MAX_RUN_GAP[kind]:
+                        current[1] = run[1]
+                        current[2] += run[2]
+                        continue
+                    if current is not None:
+                        yield (kind, *current)
+                    open_runs[kind] = run
+            # Close any runs which can no longer be extended by the next chunk.
+            for kind, current in list(open_runs.items()):
+                if chunk_end - current[1] > MAX_RUN_GAP[kind]:
+                    yield (kind, *current)
+                    del open_runs[kind]
+        for kind, current in open_runs.items():
+            yield (kind, *current)
+
+    def _sweep_chunks(self, chunks):
+        """Yields (chunk_start, chunk_size, runs) for each chunk in address order."""
+        if self.workers < 2:
+            for chunk_start, chunk_size in chunks:
+                data = self.reader.read(chunk_start, chunk_size + CHUNK_OVERLAP)
+                yield chunk_start, chunk_size, sweep_chunk(data, chunk_start, min(chunk_size, len(data)))
+            return
+        # Each worker opens the image itself, only the (small) run lists are sent back.
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for chunk_start, chunk_size in chunks:
+                pending.append(executor.submit(_sweep_image_chunk, self.reader.image_path, chunk_start, chunk_size))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def run(self, case_store, start=0, end=None):
+        """Sweeps the image, storing every run in `case_store`. Returns a summary dict."""
+        end = self.reader.image_size if end is None else min(end, self.reader.image_size)
+        logger.info(f"Sweeping {(end - start) / 1024**3:.2f} GB for signatures using {self.workers} worker(s)...")
+        start_time = time.time()
+        counts = {kind: {"runs": 0, "hits": 0} for kind in RECORD_SIZES}
+        for kind, _, _, count in case_store.store_carve_hits(self.iter_runs(start, end)):
+            counts[kind]["runs"] += 1
+            counts[kind]["hits"] += count
+        elapsed = time.time() - start_time
+        rate = (end - start) / elapsed / 1024**2 if elapsed > 0 else 0.0
+        logger.info(f"Swept {(end - start) / 1024**3:.2f} GB in {elapsed:.1f}s ({rate:.0f} MB/s).")
+        return {"bytes_scanned": end - start, "elapsed_seconds": round(elapsed, 3),
+                "mb_per_second": round(rate, 1), "hits": counts}
@@ -0,0 +1,305 @@
+# dvr-scan-py/dvr_scan/hikvision/case_store.py
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from dvr_scan.hikvision.helpers import format_timestamp
+from dvr_scan.hikvision.system_logs import SystemLogParser
+
+logger = logging.getLogger("dvr_scan")
+
+class CaseStore:
+    """
+    A single indexed SQLite database holding all of the artefacts parsed from a disk
+    image (master sector, HIKBTREE pages and entries, system logs). Unlike the JSON
+    outputs, rows can be queried a page at a time, filtered by channel, time or log
+    type, so the UI never has to load a whole document.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS case_info (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS master_sector (
+            field TEXT PRIMARY KEY,
+            value INTEGER,
+            address INTEGER,
+            data TEXT
+        );
+        CREATE TABLE IF NOT EXISTS hikbtree_pages (
+            page_number INTEGER PRIMARY KEY,
+            next_page_address TEXT,
+            is_last_page INTEGER,
+            entry_count INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS hikbtree_entries (
+            page_number INTEGER,
+            entry_number INTEGER,
+            address INTEGER,
+            channel INTEGER,
+            start_time INTEGER,
+            end_time INTEGER,
+            has_video INTEGER,
+            data_block_offset INTEGER,
+            PRIMARY KEY (page_number, entry_number)
+        );
+        CREATE TABLE IF NOT EXISTS system_logs (
+            entry_number INTEGER PRIMARY KEY,
+            address INTEGER,
+            timestamp INTEGER,
+            log_type INTEGER,
+            description TEXT
+        );
+        CREATE TABLE IF NOT EXISTS carve_hits (
+            kind TEXT,
+            start INTEGER,
+            end INTEGER,
+            count INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS exports (
+            path TEXT,
+            kind TEXT,
+            source_start INTEGER,
+            source_end INTEGER,
+            output_size INTEGER,
+            source_sha256 TEXT,
+            source_md5 TEXT,
+            output_sha256 TEXT,
+            output_md5 TEXT,
+            created INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS entries_channel_time ON hikbtree_entries (channel, start_time);
+        CREATE INDEX IF NOT EXISTS entries_time ON hikbtree_entries (start_time);
+        CREATE INDEX IF NOT EXISTS logs_type_time ON system_logs (log_type, timestamp);
+        CREATE INDEX IF NOT EXISTS logs_time ON system_logs (timestamp);
+        CREATE INDEX IF NOT EXISTS carve_kind_start ON carve_hits (kind, start);
+        CREATE INDEX IF NOT EXISTS exports_path ON exports (path);
+    """
+
+    TABLES = ("master", "pages", "entries", "logs", "carve", "exports")
+    # Rows are inserted in batches of this size so large artefacts are never held in memory.
+    BATCH_SIZE = 10000
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def set_info(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO case_info VALUES (?, ?)", (key, str(value)))
+
+    def info(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM case_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def store_master(self, analysis_results):
+        """Stores the master sector fields from `MasterSectorParser.analysis_results`."""
+        master = analysis_results.get('master_sector', {})
+        rows = []
+        for field, data in master.items():
+            if isinstance(data, dict):
+                value = data.get('value', data.get('value_unix'))
+                rows.append((field, value, data.get('address'), json.dumps(data)))
+            else:
+                rows.append((field, data, None, json.dumps(data)))
+        with self.conn:
+            self.conn.execute("DELETE FROM master_sector")
+            self.conn.executemany("INSERT INTO master_sector VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO case_info VALUES (?, ?)",
+                              ("image", analysis_results.get('image_info', {}).get('full_path')))
+        logger.info(f"Stored {len(rows)} master sector fields in {self.path}")
+
+    def store_hikbtree_pages(self, pages):
+        """
+        Stores (page_key, page_info) pairs as produced by `HikbtreeParser`, passing each
+        one through unchanged so this can be chained with the JSON writer.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM hikbtree_pages")
+            self.conn.execute("DELETE FROM hikbtree_entries")
+        page_rows, entry_rows = [], []
+        for page_key, page_info in pages:
+            page_number = int(page_key.rsplit('_', 1)[-1])
+            entries = page_info.get('entries', [])
+            page_rows.append((page_number, page_info.get('next_page_address'),
+                              int(page_info.get('is_last_page', False)), len(entries)))
+            for entry in entries:
+                entry_rows.append((
+                    page_number, entry['entry_number_in_page'], int(entry['address'], 16),
+                    entry['channel'], entry['start_time']['value'], entry['end_time']['value'],
+                    int(entry['existence'] == "Has Video Data"), int(entry['data_block_offset'], 16)))
+            if len(entry_rows) >= self.BATCH_SIZE:
+                self._insert_hikbtree_rows(page_rows, entry_rows)
+                page_rows, entry_rows = [], []
+            yield page_key, page_info
+        self._insert_hikbtree_rows(page_rows, entry_rows)
+
+    def _insert_hikbtree_rows(self, page_rows, entry_rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO hikbtree_pages VALUES (?, ?, ?, ?)", page_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO hikbtree_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", entry_rows)
+
+    def store_logs(self, log_entries):
+        """Stores system log entries in the form produced by `SystemLogParser`."""
+        for _ in self.store_log_entries(log_entries):
+            pass
+
+    def store_log_entries(self, log_entries):
+        """
+        Stores system log entries as they are parsed, passing each one through unchanged
+        so this can be chained with the JSON writer.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM system_logs")
+        rows = []
+        for entry in log_entries:
+            rows.append((entry['entry_number'], entry['address'], entry['timestamp_unix'],
+                         entry['log_type_code'], json.dumps(entry['description'])))
+            if len(rows) >= self.BATCH_SIZE:
+                self._insert_log_rows(rows)
+                rows = []
+            yield entry
+        self._insert_log_rows(rows)
+
+    def _insert_log_rows(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO system_logs VALUES (?, ?, ?, ?, ?)", rows)
+
+    def store_carve_hits(self, runs):
+        """
+        Stores (kind, start, end, count) signature runs from `CarveScanner` as they are
+        found, passing each one through unchanged.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM carve_hits")
+        rows = []
+        for run in runs:
+            rows.append(run)
+            if len(rows) >= self.BATCH_SIZE:
+                self._insert_carve_rows(rows)
+                rows = []
+            yield run
+        self._insert_carve_rows(rows)
+
+    def _insert_carve_rows(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT INTO carve_hits VALUES (?, ?, ?, ?)", rows)
+
+    def store_export(self, path, kind, hashes, segments=()):
+        """
+        Records the digests of an exported file for chain of custody. `hashes` is the
+        dict recorded by `VideoExtractor.hashes` (source range, output size and digests),
+        `segments` the per-range digests of a file stitched together from several ranges.
+        """
+        now = int(time.time())
+        source, output = hashes.get('source') or {}, hashes.get('output') or {}
+        rows = [(path, kind, hashes.get('source_start'), hashes.get('source_end'), hashes.get('output_size'),
+                 source.get('sha256'), source.get('md5'), output.get('sha256'), output.get('md5'), now)]
+        for segment in segments:
+            rows.append((path, f"{kind}_segment", segment['start'], segment['end'], None,
+                         segment['hashes'].get('sha256'), segment['hashes'].get('md5'), None, None, now))
+        with self.conn:
+            self.conn.execute("DELETE FROM exports WHERE path = ?", (path,))
+            self.conn.executemany("INSERT INTO exports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def query(self, table, channel=None, start_time=None, end_time=None, log_type=None,
+              page_number=None, video_only=False, kind=None, limit=100, offset=0):
+        """
+        Returns one page of rows from `table` (one of TABLES) matching the given filters,
+        as a dict with the total number of matching rows and the rows themselves.
+        Time filters select rows overlapping [start_time, end_time].
+        """
+        if table not in self.TABLES:
+            raise ValueError(f"Unknown table '{table}', expected one of {', '.join(self.TABLES)}.")
+        if table == "master":
+            rows = self.conn.execute("SELECT field, data FROM master_sector ORDER BY address").fetchall()
+            return {"total": len(rows), "rows": [{"field": field, **self._as_dict(json.loads(data))} for field, data in rows]}
+
+        clauses, params = [], []
+        if table == "logs":
+            sql_table, order, time_start, time_end = "system_logs", "entry_number", "timestamp", "timestamp"
+            if log_type is not None:
+                clauses.append("log_type = ?"); params.append(log_type)
+        elif table == "entries":
+            sql_table, order, time_start, time_end = "hikbtree_entries", "start_time, page_number, entry_number", "start_time", "end_time"
+            if channel is not None:
+                clauses.append("channel = ?"); params.append(channel)
+            if video_only:
+                clauses.append("has_video")
+            if page_number is not None:
+                clauses.append("page_number = ?"); params.append(page_number)
+        elif table == "carve":
+            sql_table, order, time_start, time_end = "carve_hits", "start", None, None
+            if kind is not None:
+                clauses.append("kind = ?"); params.append(kind)
+        elif table == "exports":
+            sql_table, order, time_start, time_end = "exports", "rowid", "created", "created"
+            if kind is not None:
+                clauses.append("kind = ?"); params.append(kind)
+        else:
+            sql_table, order, time_start, time_end = "hikbtree_pages", "page_number", None, None
+            if page_number is not None:
+                clauses.append("page_number = ?"); params.append(page_number)
+
+        if time_start and start_time is not None:
+            clauses.append(f"{time_end} >= ?"); params.append(start_time)
+        if time_start and end_time is not None:
+            clauses.append(f"{time_start} <= ?"); params.append(end_time)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        total = self.conn.execute(f"SELECT COUNT(*) FROM {sql_table}{where}", params).fetchone()[0]
+        cursor = self.conn.execute(
+            f"SELECT * FROM {sql_table}{where} ORDER BY {order} LIMIT ? OFFSET ?", params + [limit, offset])
+        columns = [column[0] for column in cursor.description]
+        rows = [self._format_row(table, dict(zip(columns, row))) for row in cursor]
+        return {"total": total, "rows": rows}
+
+    @staticmethod
+    def _as_dict(data):
+        return data if isinstance(data, dict) else {"value": data}
+
+    @staticmethod
+    def _format_row(table, row):
+        """Converts a database row back to the shape used in the JSON outputs."""
+        if table == "entries":
+            return {
+                "page_number": row['page_number'],
+                "entry_number_in_page": row['entry_number'],
+                "address": hex(row['address']),
+                "existence": "Has Video Data" if row['has_video'] else "No Video/Recording",
+                "channel": row['channel'],
+                "start_time": {"value": row['start_time'], "readable": format_timestamp(row['start_time'])},
+                "end_time": {"value": row['end_time'], "readable": format_timestamp(row['end_time'])},
+                "data_block_offset": hex(row['data_block_offset']),
+            }
+        if table == "logs":
+            return {
+                "entry_number": row['entry_number'],
+                "address": row['address'],
+                "address_hex": hex(row['address']),
+                "timestamp_unix": row['timestamp'],
+                "timestamp_readable": format_timestamp(row['timestamp']),
+                "log_type_code": row['log_type'],
+                "log_type_name": SystemLogParser.LOG_TYPES.get(row['log_type'], "Unknown"),
+                "description": json.loads(row['description']),
+            }
+        if table == "exports":
+            row['created_readable'] = format_timestamp(row['created'])
+            return row
+        if table == "carve":
+            row['start_hex'] = hex(row['start'])
+            row['size_bytes'] = row['end'] - row['start']
+            return row
+        row['is_last_page'] = bool(row['is_last_page'])
+        return row
@@ -0,0 +1,236 @@
+# dvr-scan-py/dvr_scan/hikvision/catalogue.py
+
+import logging
+import os
+import sqlite3
+
+from dvr_scan.hikvision.helpers import format_timestamp
+from dvr_scan.hikvision.idr_parser import IdrParser
+
+logger = logging.getLogger("dvr_scan")
+
+class RecordingCatalogue:
+    """
+    A time-indexed catalogue of the recordings on a disk image, stored as a SQLite
+    database. Combines the HIKBTREE entries (which data block holds which channel and
+    time span) with the per-block IDR tables (where each keyframe sits within a block),
+    so a channel/time query can be answered with the exact byte ranges to carve.
+
+    The `frame_index` field of an IDR record is the byte offset of its keyframe from the
+    start of the data block, which is what lets us carve at keyframe granularity. This is
+    checked for every block, and blocks where it doesn't hold are only carved whole.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS catalogue_info (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS disks (
+            disk INTEGER PRIMARY KEY,
+            image TEXT,
+            extra_offset INTEGER,
+            data_block_size INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS blocks (
+            disk INTEGER DEFAULT 0,
+            block_offset INTEGER,
+            channel INTEGER,
+            start_time INTEGER,
+            end_time INTEGER,
+            has_video INTEGER,
+            video_end INTEGER,
+            PRIMARY KEY (disk, block_offset)
+        );
+        CREATE TABLE IF NOT EXISTS keyframes (
+            disk INTEGER DEFAULT 0,
+            block_offset INTEGER,
+            channel INTEGER,
+            timestamp INTEGER,
+            frame_offset INTEGER
+        );
+    """
+    INDEXES = """
+        CREATE INDEX IF NOT EXISTS blocks_channel_time ON blocks (channel, start_time, end_time);
+        CREATE INDEX IF NOT EXISTS keyframes_disk_block_time ON keyframes (disk, block_offset, timestamp);
+        CREATE INDEX IF NOT EXISTS keyframes_channel_time ON keyframes (channel, timestamp);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(self.SCHEMA)
+        # Catalogues from before multi-disk cases have no disk columns, all their blocks are disk 0.
+        for table in ("blocks", "keyframes"):
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if "disk" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN disk INTEGER DEFAULT 0")
+        self.conn.executescript(self.INDEXES)
+
+    def close(self):
+        self.conn.close()
+
+    def build(self, reader, hikbtree_data, data_block_size, extra_offset=0):
+        """
+        Populates the catalogue from parsed HIKBTREE output (the contents of hikbtree.json)
+        and the IDR tables of every data block with video. Returns a dict of counts.
+        """
+        blocks = {}
+        for page in hikbtree_data.get('pages', {}).values():
+            for entry in page.get('entries', []):
+                block_offset = int(entry['data_block_offset'], 16)
+                blocks[block_offset] = (
+                    entry['channel'],
+                    entry['start_time']['value'],
+                    entry['end_time']['value'],
+                    entry['existence'] == "Has Video Data",
+                )
+        logger.info(f"Cataloguing {len(blocks)} data blocks from the HIKBTREE...")
+
+        video_blocks = [offset for offset, block in blocks.items() if block[3]]
+        parser = IdrParser(reader)
+        tables = parser.parse_data_blocks(
+            [offset + extra_offset for offset in video_blocks], data_block_size)
+        unverified = parser.unverified_blocks(
+            {addr: table[1]['frame_index'] for addr, table in tables.items() if table is not None})
+
+        num_keyframes = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM blocks")
+            self.conn.execute("DELETE FROM keyframes")
+            self.conn.execute("DELETE FROM disks")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO catalogue_info VALUES (?, ?)", [
+                    ("image", reader.image_path),
+                    ("extra_offset", str(extra_offset)),
+                    ("data_block_size", str(data_block_size)),
+                ])
+            self.conn.execute("INSERT INTO disks VALUES (0, ?, ?, ?)", (reader.image_path, extra_offset, data_block_size))
+            for block_offset, (channel, start_time, end_time, has_video) in blocks.items():
+                table = tables.get(block_offset + extra_offset) if has_video else None
+                video_end = None
+                if table is not None:
+                    table_addr, records = table
+                    video_end = table_addr - extra_offset
+                    if block_offset + extra_offset in unverified:
+                        # Carving from these offsets would start mid-frame, use the whole block instead.
+                        logger.warning(f"  IDR keyframe offsets of block {hex(block_offset)} don't point at H.264 "
+                                       f"start codes, falling back to whole-block ranges.")
+                        records = records[:0]
+                    self.conn.executemany(
+                        "INSERT INTO keyframes (disk, block_offset, channel, timestamp, frame_offset)"
+                        " VALUES (0, ?, ?, ?, ?)",
+                        zip([block_offset] * len(records),
+                            records['channel'].tolist(),
+                            records['timestamp'].tolist(),
+                            records['frame_index'].tolist()))
+                    num_keyframes += len(records)
+                self.conn.execute(
+                    "INSERT INTO blocks (disk, block_offset, channel, start_time, end_time, has_video, video_end)"
+                    " VALUES (0, ?, ?, ?, ?, ?, ?)",
+                    (block_offset, channel, start_time, end_time, int(has_video), video_end))
+
+        logger.info(f"Catalogued {len(blocks)} data blocks and {num_keyframes} keyframes.")
+        return {"blocks": len(blocks), "video_blocks": len(video_blocks), "keyframes": num_keyframes,
+                "unverified_blocks": len(unverified)}
+
+    def merge(self, catalogue_paths):
+        """
+        Replaces the contents of this catalogue with the single-disk catalogues at
+        `catalogue_paths` (one per disk of a multi-disk case, numbered in that order), so
+        a channel can be located across every disk at once. Returns a dict of counts.
+        """
+        counts = {"disks": 0, "blocks": 0, "keyframes": 0}
+        with self.conn:
+            self.conn.execute("DELETE FROM blocks")
+            self.conn.execute("DELETE FROM keyframes")
+            self.conn.execute("DELETE FROM disks")
+        for disk, path in enumerate(catalogue_paths):
+            self.conn.execute("ATTACH DATABASE ? AS disk_catalogue", (path,))
+            try:
+                with self.conn:
+                    info = dict(self.conn.execute("SELECT key, value FROM disk_catalogue.catalogue_info"))
+                    self.conn.execute("INSERT INTO disks VALUES (?, ?, ?, ?)", (
+                        disk, info.get("image"), int(info.get("extra_offset", 0)), int(info.get("data_block_size", 0))))
+                    counts["blocks"] += self.conn.execute(
+                        "INSERT INTO blocks (disk, block_offset, channel, start_time, end_time, has_video, video_end)"
+                        " SELECT ?, block_offset, channel, start_time, end_time, has_video, video_end"
+                        " FROM disk_catalogue.blocks", (disk,)).rowcount
+                    counts["keyframes"] += self.conn.execute(
+                        "INSERT INTO keyframes (disk, block_offset, channel, timestamp, frame_offset)"
+                        " SELECT ?, block_offset, channel, timestamp, frame_offset FROM disk_catalogue.keyframes",
+                        (disk,)).rowcount
+            finally:
+                self.conn.execute("DETACH DATABASE disk_catalogue")
+            counts["disks"] += 1
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO catalogue_info VALUES ('disks', ?)", (str(counts["disks"]),))
+        logger.info(f"Merged {counts['blocks']} data blocks and {counts['keyframes']} keyframes from {counts['disks']} disk(s).")
+        return counts
+
+    def info(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM catalogue_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def locate(self, channel, start_time, end_time):
+        """
+        Returns the byte ranges (absolute image addresses) holding video for `channel`
+        between the unix timestamps `start_time` and `end_time`, in chronological order
+        of their first keyframe (the HIKBTREE times are only used for blocks without an
+        IDR table). Each range starts on the last keyframe at or before `start_time` so it
+        can be decoded. In a multi-disk catalogue ranges may come from any disk, each one
+        names the image it is on.
+        """
+        disks = {disk: (image, extra_offset, data_block_size) for disk, image, extra_offset, data_block_size
+                 in self.conn.execute("SELECT disk, image, extra_offset, data_block_size FROM disks")}
+        if not disks:
+            # Catalogues from before multi-disk cases only record their image in catalogue_info.
+            disks[0] = (self.info("image"), int(self.info("extra_offset", 0)), int(self.info("data_block_size", 0)))
+        blocks = self.conn.execute(
+            "SELECT disk, block_offset, start_time, end_time, video_end FROM blocks"
+            " WHERE channel = ? AND has_video AND start_time <= ? AND end_time >= ?"
+            " ORDER BY start_time, disk, block_offset",
+            (channel, end_time, start_time)).fetchall()
+
+        ranges = []
+        for disk, block_offset, block_start_time, block_end_time, video_end in blocks:
+            image, extra_offset, data_block_size = disks[disk]
+            if video_end is None:
+                # Without an IDR table we can only fall back to carving the whole block.
+                video_end = block_offset + data_block_size
+            first = self.conn.execute(
+                "SELECT timestamp, frame_offset FROM keyframes WHERE disk = ? AND block_offset = ? AND timestamp <= ?"
+                " ORDER BY timestamp DESC, frame_offset DESC LIMIT 1",
+                (disk, block_offset, start_time)).fetchone()
+            last = self.conn.execute(
+                "SELECT timestamp, frame_offset FROM keyframes WHERE disk = ? AND block_offset = ? AND timestamp > ?"
+                " ORDER BY timestamp, frame_offset LIMIT 1",
+                (disk, block_offset, end_time)).fetchone()
+            if first:
+                keyframe_time = first[0]
+            else:
+                keyframe_time = self.conn.execute(
+                    "SELECT MIN(timestamp) FROM keyframes WHERE disk = ? AND block_offset = ?", (disk, block_offset)
+                ).fetchone()[0] or block_start_time
+            range_start = block_offset + first[1] if first else block_offset
+            range_end = block_offset + last[1] if last else video_end
+            if range_end <= range_start:
+                continue
+            range_start_time = max(first[0], block_start_time) if first else keyframe_time
+            range_end_time = min(last[0] if last else block_end_time, block_end_time)
+            ranges.append((keyframe_time, disk, range_start, {
+                "disk": disk,
+                "image": image,
+                "block_offset": hex(block_offset),
+                "channel": channel,
+                "start": range_start + extra_offset,
+                "end": range_end + extra_offset,
+                "size_bytes": range_end - range_start,
+                "start_time": {"value": range_start_time, "readable": format_timestamp(range_start_time)},
+                "end_time": {"value": range_end_time, "readable": format_timestamp(range_end_time)},
+            }))
+        ranges.sort(key=lambda item: item[:3])
+        return [rng for _, _, _, rng in ranges]
@@ -2,13 +2,20 @@
 
 import json
 import logging
+import os
 import sys
 
-from dvr_scan.hikvision.helpers import ImageReader
+from dvr_scan.hikvision.helpers import ImageReader, ProgressReporter
 from dvr_scan.hikvision.master_sector import MasterSectorParser
 from dvr_scan.hikvision.hikbtree import HikbtreeParser
 from dvr_scan.hikvision.system_logs import SystemLogParser
 from dvr_scan.hikvision.extractor import VideoExtractor
+from dvr_scan.hikvision.catalogue import RecordingCatalogue
+from dvr_scan.hikvision.case_store import CaseStore
+from dvr_scan.hikvision.carver import CarveScanner
+from dvr_scan.hikvision.timeline import TimelineBuilder
+from dvr_scan.hikvision.analyze import AnalysisPipeline
+from dvr_scan.hikvision.multi_disk import CaseProcessor
 
 logger = logging.getLogger("dvr_scan")
 
@@ -20,18 +27,43 @@ def run_hikvision_command(args):
         run_hikbtree_parser(args)
     elif args.subcommand == "logs":
         run_system_logs_parser(args)
+    elif args.subcommand == "analyze":
+        run_analysis_pipeline(args)
+    elif args.subcommand == "case-analyze":
+        run_case_processor(args)
     elif args.subcommand == "extract":
         run_video_extractor(args)
+    elif args.subcommand == "catalogue":
+        run_catalogue_builder(args)
+    elif args.subcommand == "locate":
+        run_catalogue_query(args)
+    elif args.subcommand == "timeline":
+        run_timeline_builder(args)
+    elif args.subcommand == "query":
+        run_case_query(args)
+    elif args.subcommand == "carve-scan":
+        run_carve_scan(args)
+
+def _open_case_store(args):
+    """Returns the CaseStore for `--case-db` if one was requested, otherwise None."""
+    case_db = getattr(args, 'case_db', None)
+    return CaseStore(case_db) if case_db else None
+
+def _hash_algorithms(args):
+    """Returns the digests to compute for exported files (SHA-256, and MD5 with `--md5`)."""
+    return ("sha256", "md5") if getattr(args, 'md5', False) else ("sha256",)
 
 def run_master_parser(args):
     reader = None
+    case_store = None
     try:
         reader = ImageReader(args.image)
         if not reader.open():
             sys.exit(1)
         
+        case_store = _open_case_store(args)
         parser = MasterSectorParser(reader)
-        extra_offset = parser.run_parser(args.output_file)
+        extra_offset = parser.run_parser(args.output_file, case_store)
 
         if extra_offset is not None:
             # CORRECTED: Standardized JSON message type
@@ -39,6 +71,7 @@ def run_master_parser(args):
                 "type": "hik_master_complete",
                 "success": True,
                 "output_file": args.output_file,
+                "case_db": args.case_db,
                 "extra_offset": extra_offset
             }), flush=True)
         else:
@@ -49,25 +82,30 @@ def run_master_parser(args):
         print(json.dumps({"type": "error", "message": str(e)}), flush=True)
         sys.exit(1)
     finally:
+        if case_store:
+            case_store.close()
         if reader:
             reader.close()
 
 def run_hikbtree_parser(args):
     """Handles parsing of the HIKBTREE structure."""
     reader = None
+    case_store = None
     try:
         reader = ImageReader(args.image)
         if not reader.open():
             sys.exit(1)
 
-        parser = HikbtreeParser(reader)
-        success = parser.run_parser(args.master_file, args.output_file, args.extra_offset)
+        case_store = _open_case_store(args)
+        parser = HikbtreeParser(reader, progress=ProgressReporter("hikbtree", reader))
+        success = parser.run_parser(args.master_file, args.output_file, args.extra_offset, case_store)
 
         if success:
             print(json.dumps({
                 "type": "hik_hikbtree_complete",
                 "success": True,
-                "output_file": args.output_file
+                "output_file": args.output_file,
+                "case_db": args.case_db
             }), flush=True)
         else:
             raise Exception("HIKBTREE parsing failed.")
@@ -77,6 +115,8 @@ def run_hikbtree_parser(args):
         print(json.dumps({"type": "error", "message": str(e)}), flush=True)
         sys.exit(1)
     finally:
+        if case_store:
+            case_store.close()
         if reader:
             reader.close()
 
@@ -84,19 +124,23 @@ def run_hikbtree_parser(args):
 def run_system_logs_parser(args):
     """Handles parsing of the system logs."""
     reader = None
+    case_store = None
     try:
         reader = ImageReader(args.image)
         if not reader.open():
             sys.exit(1)
 
-        parser = SystemLogParser(reader)
-        success = parser.run_parser(args.master_file, args.output_file, args.extra_offset)
+        case_store = _open_case_store(args)
+        parser = SystemLogParser(reader, include_previews=not args.no_hex_preview,
+                                 progress=ProgressReporter("logs", reader))
+        success = parser.run_parser(args.master_file, args.output_file, args.extra_offset, case_store)
 
         if success:
             print(json.dumps({
                 "type": "hik_logs_complete",
                 "success": True,
-                "output_file": args.output_file
+                "output_file": args.output_file,
+                "case_db": args.case_db
             }), flush=True)
         else:
             raise Exception("System log parsing failed.")
@@ -105,29 +149,291 @@ def run_system_logs_parser(args):
         logger.critical(f"A critical error occurred during log parsing: {e}", exc_info=True)
         print(json.dumps({"type": "error", "message": str(e)}), flush=True)
         sys.exit(1)
+    finally:
+        if case_store:
+            case_store.close()
+        if reader:
+            reader.close()
+
+
+def run_analysis_pipeline(args):
+    """Runs master sector, HIKBTREE and log parsing in one process, opening the image once."""
+    reader = None
+    try:
+        reader = ImageReader(args.image)
+        if not reader.open():
+            sys.exit(1)
+
+        def on_stage(stage, success, output_file):
+            print(json.dumps({
+                "type": "hik_analyze_stage",
+                "stage": stage,
+                "success": success,
+                "output_file": output_file
+            }), flush=True)
+
+        pipeline = AnalysisPipeline(reader, args.output_dir, case_db=args.case_db,
+                                    include_previews=not args.no_hex_preview, on_stage=on_stage,
+                                    report_progress=True)
+        summary = pipeline.run(use_cache=not args.no_cache)
+        if not summary['success']:
+            failed = [stage for stage, success in summary['stages'].items() if not success]
+            raise Exception(f"Analysis failed at stage(s): {', '.join(failed)}.")
+        print(json.dumps({"type": "hik_analyze_complete", **summary}), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred during analysis: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
     finally:
         if reader:
             reader.close()
 
 
+def run_case_processor(args):
+    """Analyses and catalogues every disk of a multi-disk case in parallel."""
+    try:
+        image_paths = [path for paths in args.image for path in paths]
+
+        def on_disk(result):
+            print(json.dumps({"type": "hik_case_disk_complete", **result}), flush=True)
+
+        processor = CaseProcessor(image_paths, args.output_dir, workers=args.workers,
+                                  include_previews=not args.no_hex_preview, on_disk=on_disk)
+        summary = processor.run(use_cache=not args.no_cache)
+        if not summary['success']:
+            failed = [result['image'] for result in summary['disks'] if not result['success']]
+            raise Exception(f"Processing failed for: {', '.join(failed)}.")
+        print(json.dumps({"type": "hik_case_complete", **summary}), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred while processing the case: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+
+
+def _open_range_readers(ranges, image=None):
+    """
+    Opens a reader for every image the ranges are on (more than one for multi-disk
+    catalogues). If `image` is given, it is used for every range instead.
+    Returns a dict mapping each range's `image` to its reader.
+    """
+    readers = {}
+    for rng in ranges:
+        if rng['image'] in readers:
+            continue
+        reader = ImageReader(image or rng['image'])
+        readers[rng['image']] = reader
+        reader.open()
+    return readers
+
+
 def run_video_extractor(args):
     reader = None
+    case_store = None
     try:
         reader = ImageReader(args.image)
         if not reader.open(): sys.exit(1)
         
-        extractor = VideoExtractor(reader, output_dir=args.output_dir)
-        success, filepath = extractor.extract_single_block(args.offset, args.master_file, args.extra_offset)
+        progress = ProgressReporter("extract", reader)
+        extractor = VideoExtractor(reader, output_dir=args.output_dir, hash_algorithms=_hash_algorithms(args),
+                                   progress=progress)
+        success, filepath = extractor.extract_single_block(args.offset, args.master_file, args.extra_offset, args.container)
         
         if success:
+            progress.finish()
+            hashes = extractor.hashes.get(filepath)
+            case_store = _open_case_store(args)
+            if case_store and hashes:
+                case_store.store_export(filepath, "extract", hashes)
             # CORRECTED: Standardized JSON message type
-            print(json.dumps({"type": "hik_extract_complete", "path": filepath}), flush=True)
+            print(json.dumps({"type": "hik_extract_complete", "path": filepath, "hashes": hashes}), flush=True)
         else:
             raise Exception("Video extraction failed.")
 
     except Exception as e:
-        logging.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
+        logger.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        if case_store: case_store.close()
+        if reader: reader.close()
+
+
+def run_catalogue_builder(args):
+    """Builds the time-indexed recording catalogue from the HIKBTREE and IDR tables."""
+    reader = None
+    catalogue = None
+    try:
+        with open(args.master_file, 'r') as f:
+            data_block_size = json.load(f)['master_sector']['data_block_size']['value']
+        with open(args.hikbtree_file, 'r') as f:
+            hikbtree_data = json.load(f)
+
+        reader = ImageReader(args.image)
+        if not reader.open(): sys.exit(1)
+
+        catalogue = RecordingCatalogue(args.output_file)
+        counts = catalogue.build(reader, hikbtree_data, data_block_size, args.extra_offset)
+        print(json.dumps({
+            "type": "hik_catalogue_complete",
+            "success": True,
+            "output_file": args.output_file,
+            **counts
+        }), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred while building the catalogue: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        if catalogue: catalogue.close()
+        if reader: reader.close()
+
+
+def run_catalogue_query(args):
+    """Returns (and optionally carves) the byte ranges for a channel and time range."""
+    readers = {}
+    catalogue = None
+    case_store = None
+    try:
+        if not os.path.exists(args.catalogue):
+            raise FileNotFoundError(f"Catalogue not found: {args.catalogue}")
+        catalogue = RecordingCatalogue(args.catalogue)
+        ranges = catalogue.locate(args.channel, args.start, args.end)
+        logger.info(f"Found {len(ranges)} byte range(s) for channel {args.channel}.")
+
+        if args.output_dir:
+            readers = _open_range_readers(ranges, args.image)
+            case_store = _open_case_store(args)
+            # I/O time is only reported for a single image, the readers of a case each keep their own.
+            progress = ProgressReporter("locate", next(iter(readers.values())) if len(readers) == 1 else None)
+            progress.begin(sum(rng['size_bytes'] for rng in ranges), len(ranges), "blocks")
+            extractors = {image: VideoExtractor(reader, output_dir=args.output_dir, hash_algorithms=_hash_algorithms(args),
+                                                progress=progress)
+                          for image, reader in readers.items()}
+            for rng in ranges:
+                extractor = extractors[rng['image']]
+                disk = f"d{rng['disk']}_" if len(extractors) > 1 else ""
+                name = f"ch{args.channel:02d}_{rng['start_time']['value']}_{disk}{rng['block_offset'].replace('0x', '')}"
+                success, filepath = extractor.extract_range(rng['start'], rng['end'], name)
+                rng['path'] = filepath if success else None
+                rng['hashes'] = extractor.hashes.get(filepath) if success else None
+                if case_store and rng['hashes']:
+                    case_store.store_export(filepath, "locate", rng['hashes'])
+            progress.finish()
+
+        print(json.dumps({
+            "type": "hik_locate_complete",
+            "channel": args.channel,
+            "start_time": args.start,
+            "end_time": args.end,
+            "total_bytes": sum(rng['size_bytes'] for rng in ranges),
+            "ranges": ranges
+        }), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred while querying the catalogue: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        if case_store: case_store.close()
+        if catalogue: catalogue.close()
+        for reader in readers.values(): reader.close()
+
+
+def run_timeline_builder(args):
+    """Reconstructs one continuous stream for a channel and time range."""
+    readers = {}
+    catalogue = None
+    case_store = None
+    try:
+        if not os.path.exists(args.catalogue):
+            raise FileNotFoundError(f"Catalogue not found: {args.catalogue}")
+        catalogue = RecordingCatalogue(args.catalogue)
+        ranges = catalogue.locate(args.channel, args.start, args.end)
+        if not ranges:
+            raise ValueError(f"No video found for channel {args.channel} in the requested time range.")
+
+        readers = _open_range_readers(ranges, args.image)
+        builder = TimelineBuilder(next(iter(readers.values())), workers=args.workers, gap_threshold=args.gap_threshold,
+                                  hash_algorithms=_hash_algorithms(args), readers=readers)
+        summary = builder.build(ranges, args.output_file)
+        case_store = _open_case_store(args)
+        if case_store:
+            # The sources are recorded per segment, they aren't one contiguous range.
+            case_store.store_export(args.output_file, "timeline", {
+                "output_size": summary['output_size'],
+                "output": summary['hashes'],
+            }, summary['segments'])
+        print(json.dumps({
+            "type": "hik_timeline_complete",
+            "success": True,
+            "channel": args.channel,
+            "start_time": args.start,
+            "end_time": args.end,
+            **summary
+        }), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred while reconstructing the timeline: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        if case_store: case_store.close()
+        if catalogue: catalogue.close()
+        for reader in readers.values(): reader.close()
+
+
+def run_case_query(args):
+    """Returns one page of filtered rows from a case database."""
+    case_store = None
+    try:
+        if not os.path.exists(args.case_db):
+            raise FileNotFoundError(f"Case database not found: {args.case_db}")
+        case_store = CaseStore(args.case_db)
+        result = case_store.query(
+            args.table, channel=args.channel, start_time=args.start, end_time=args.end,
+            log_type=args.log_type, page_number=args.page_number, video_only=args.video_only,
+            kind=args.kind, limit=args.limit, offset=args.offset)
+        print(json.dumps({
+            "type": "hik_query_complete",
+            "table": args.table,
+            "limit": args.limit,
+            "offset": args.offset,
+            **result
+        }), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred while querying the case database: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        if case_store: case_store.close()
+
+
+def run_carve_scan(args):
+    """Sweeps the whole image for signatures, independent of the HIKBTREE index."""
+    reader = None
+    case_store = None
+    try:
+        reader = ImageReader(args.image)
+        if not reader.open(): sys.exit(1)
+
+        case_store = CaseStore(args.case_db)
+        scanner = CarveScanner(reader, chunk_size=args.chunk_size * 1024 * 1024, workers=args.workers)
+        summary = scanner.run(case_store, args.start_offset, args.end_offset)
+        print(json.dumps({
+            "type": "hik_carve_scan_complete",
+            "success": True,
+            "case_db": args.case_db,
+            **summary
+        }), flush=True)
+
+    except Exception as e:
+        logger.critical(f"A critical error occurred during the carve scan: {e}", exc_info=True)
         print(json.dumps({"type": "error", "message": str(e)}), flush=True)
         sys.exit(1)
     finally:
-        if reader: reader.close()
\ No newline at end of file
+        if case_store: case_store.close()
+        if reader: reader.close()
@@ -6,7 +6,9 @@ import json
 import struct
 
 from dvr_scan.hikvision.idr_parser import IdrParser
-from dvr_scan.hikvision.helpers import ImageReader
+from dvr_scan.hikvision.helpers import ImageRangeStream, ImageReader, StreamHasher
+from dvr_scan.hikvision.remux import remux_h264
+from dvr_scan.video_joiner import StreamInput
 
 logger = logging.getLogger("dvr_scan")
 
@@ -17,15 +19,26 @@ class VideoExtractor:
     """
     
     H264_START_CODE = b'\x00\x00\x00\x01'
+    COPY_CHUNK_SIZE = 4 * 1024 * 1024
 
-    def __init__(self, image_reader, output_dir="video_exports"):
+    def __init__(self, image_reader, output_dir="video_exports", hash_algorithms=("sha256",), progress=None):
         self.reader = image_reader
+        # ProgressReporter advanced as each block or range is read, counting one item per file written.
+        self.progress = progress
         self.idr_parser = IdrParser(self.reader)
         self.output_dir = output_dir
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.hash_algorithms = hash_algorithms
+        # Digests of the source range and output of every file written, keyed by path.
+        self.hashes = {}
+        # Streaming straight to the scanner (see `stream_input`) doesn't need an output directory.
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
 
-    def extract_single_block(self, target_offset_str, master_file, extra_offset=0):
-        """Main workflow to extract a single video block."""
+    def extract_single_block(self, target_offset_str, master_file, extra_offset=0, container="h264"):
+        """
+        Main workflow to extract a single video block. With `container` set to "mp4" or
+        "mkv" the video is remuxed, timestamped from the block's IDR table.
+        """
         
         try:
             with open(master_file, 'r') as f:
@@ -36,30 +49,162 @@ class VideoExtractor:
             return False, None
 
         block_start_addr = int(target_offset_str, 16) + extra_offset
-
-        idr_records = self.idr_parser.parse_single_data_block(block_start_addr, data_block_size)
-
-        if not idr_records:
-            logger.error(f"Could not parse IDR table for block {target_offset_str}. Cannot determine video boundaries.")
+        block_info = self.block_video_range(block_start_addr, data_block_size)
+        if block_info is None:
             return False, None
-
-        video_end_addr = idr_records[0]['address']
-
-        block_info = {"start": block_start_addr, "end": video_end_addr}
+        if self.progress is not None:
+            self.progress.begin(block_info['end'] - block_info['start'], 1, "blocks")
         
         # Sanitize the offset string for use in a filename
         safe_offset_str = target_offset_str.replace('0x', '').lower()
-        output_filename = os.path.join(self.output_dir, f"video_block_at_{safe_offset_str}.h264")
-        
+        output_filename = os.path.join(self.output_dir, f"video_block_at_{safe_offset_str}.{container}")
+
+        if container != "h264":
+            if self.remux_range(block_info['start'], block_info['end'], output_filename, block_info['keyframes']):
+                return True, output_filename
+            return False, None
         if self._carve_and_clean(block_info, output_filename):
             return True, output_filename
         return False, None
 
 
+    def block_video_range(self, block_start_addr, data_block_size):
+        """
+        Returns the {"start", "end"} addresses of the video in a data block, and the
+        (address, timestamp) of each of its keyframes, or None.
+        """
+        idr_table = self.idr_parser.read_table(block_start_addr, data_block_size)
+
+        if idr_table is None or len(idr_table[1]) == 0:
+            logger.error(f"Could not parse IDR table for block {hex(block_start_addr)}. Cannot determine video boundaries.")
+            return None
+
+        table_addr, records = idr_table
+        if self.idr_parser.unverified_blocks({block_start_addr: records['frame_index']}):
+            logger.warning(f"IDR keyframe offsets of block {hex(block_start_addr)} don't point at H.264 start codes, "
+                           f"ignoring them.")
+            records = records[:0]
+        # `frame_index` is the offset of each keyframe from the start of the block.
+        keyframes = sorted(
+            (block_start_addr + frame_index, timestamp)
+            for frame_index, timestamp in zip(records['frame_index'].tolist(), records['timestamp'].tolist())
+            if 0 < timestamp < 0x7FFFFFFF)
+        # The video data ends where the IDR table begins.
+        return {"start": block_start_addr, "end": table_addr, "keyframes": keyframes}
+
+    def open_stream(self, start_addr, end_addr, source_hasher=None):
+        """
+        Returns a file-like stream of the cleaned H.264 data in [start_addr, end_addr),
+        i.e. everything from the first NAL start code on, or None if there isn't one.
+        If `source_hasher` is given, the whole source range is passed to it as it is read.
+        """
+        first_nal_addr = self._find_first_start_code(start_addr, end_addr)
+        if first_nal_addr is None:
+            logger.error("No H.264 NAL units could be found in the data block.")
+            return None
+        if source_hasher is not None:
+            # The bytes preceding the first NAL unit are part of the source, but not the stream.
+            for addr in range(start_addr, first_nal_addr, self.COPY_CHUNK_SIZE):
+                source_hasher.update(self.reader.read(addr, min(self.COPY_CHUNK_SIZE, first_nal_addr - addr)))
+        if self.progress is not None:
+            self.progress.advance(nbytes=first_nal_addr - start_addr)
+        return ImageRangeStream(self.reader, first_nal_addr, end_addr, chunk_size=self.COPY_CHUNK_SIZE,
+                                hasher=source_hasher, progress=self.progress)
+
+    def stream_input(self, start_addr, end_addr, name):
+        """
+        Returns a StreamInput which MotionScanner can scan directly, carving the range
+        from the image as it is decoded instead of extracting it to a file first.
+        """
+        def open_carved_stream():
+            stream = self.open_stream(start_addr, end_addr)
+            if stream is None:
+                raise ValueError(f"No H.264 video found between {hex(start_addr)} and {hex(end_addr)}.")
+            return stream
+        return StreamInput(f"{name}.h264", open_carved_stream)
+
+    def remux_range(self, start_addr, end_addr, output_filename, keyframes=()):
+        """
+        Remuxes the H.264 video in [start_addr, end_addr) into the MP4/MKV container named
+        by `output_filename`, without re-encoding. `keyframes` are (address, timestamp)
+        pairs from the IDR table, used to timestamp the frames.
+        """
+        source_hasher = StreamHasher(self.hash_algorithms)
+        output_hasher = None
+        try:
+            stream = self.open_stream(start_addr, end_addr, source_hasher)
+            if stream is None:
+                return False
+            logger.info(f"Remuxing {(end_addr - stream.start) / 1024**2:.2f} MB of video to '{output_filename}'...")
+            with stream:
+                remux_h264(stream, output_filename,
+                           [(addr - stream.start, timestamp) for addr, timestamp in keyframes])
+                stream.finish_hash()
+            # The muxer seeks back to finalize the container (e.g. the MP4 index), so unlike
+            # the source, the output can only be hashed once it has been closed.
+            output_hasher = StreamHasher(self.hash_algorithms)
+            with open(output_filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.COPY_CHUNK_SIZE), b''):
+                    output_hasher.update(chunk)
+            self._record_hashes(output_filename, start_addr, end_addr, source_hasher, output_hasher)
+            if self.progress is not None:
+                self.progress.advance(items=1)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to remux video. Error: {e}")
+            return False
+        finally:
+            self._stop_hashers(source_hasher, output_hasher)
+
+    @staticmethod
+    def _stop_hashers(*hashers):
+        """Waits for the threads of hashers to exit, whether or not their digests were recorded."""
+        for hasher in hashers:
+            if hasher is None:
+                continue
+            try:
+                hasher.hexdigests()
+            except Exception:
+                # Only reached after a failure, errors hashing a recorded digest were raised already.
+                pass
+
+    def _record_hashes(self, output_filename, start_addr, end_addr, source_hasher, output_hasher):
+        self.hashes[output_filename] = {
+            "source_start": start_addr,
+            "source_end": end_addr,
+            "output_size": output_hasher.size,
+            "source": source_hasher.hexdigests(),
+            "output": output_hasher.hexdigests(),
+        }
+        logger.info(f"SHA-256 of source range: {self.hashes[output_filename]['source'].get('sha256')}")
+        logger.info(f"SHA-256 of output file:  {self.hashes[output_filename]['output'].get('sha256')}")
+
+    def extract_range(self, start_addr, end_addr, name):
+        """Carves an arbitrary byte range of the image (e.g. from a catalogue query)."""
+        output_filename = os.path.join(self.output_dir, f"{name}.h264")
+        if self._carve_and_clean({"start": start_addr, "end": end_addr}, output_filename):
+            return True, output_filename
+        return False, None
+
+    def _find_first_start_code(self, start_addr, end_addr):
+        """Returns the address of the first H.264 start code in [start_addr, end_addr)."""
+        search_addr = start_addr
+        while search_addr < end_addr:
+            data = self.reader.read(search_addr, min(self.COPY_CHUNK_SIZE, end_addr - search_addr))
+            if not data:
+                break
+            start_code_pos = data.find(self.H264_START_CODE)
+            if start_code_pos != -1:
+                return search_addr + start_code_pos
+            # Step back so a start code straddling the chunk boundary isn't missed.
+            search_addr += max(1, len(data) - len(self.H264_START_CODE) + 1)
+        return None
+
     def _carve_and_clean(self, block_info, output_filename):
         """
         Reads the raw video area, strips non-H264 headers, and saves
-        the cleaned video stream to a file.
+        the cleaned video stream to a file. The source range and the output are hashed
+        as they stream past (see `hashes`).
         """
         carve_start = block_info['start']
         carve_size = block_info['end'] - block_info['start']
@@ -69,42 +214,59 @@ class VideoExtractor:
             return False
             
         logger.info(f"Carving {carve_size / 1024**2:.2f} MB of raw video data...")
-        raw_video_data = self.reader.read(carve_start, carve_size)
-        
         logger.info("Cleaning stream: isolating all standard H.264 NAL units...")
-        
-        cleaned_data = bytearray()
-        current_pos = 0
-        nal_unit_count = 0
-        
-        while current_pos < len(raw_video_data):
-            start_code_pos = raw_video_data.find(self.H264_START_CODE, current_pos)
-            if start_code_pos == -1: break
-
-            next_start_code_pos = raw_video_data.find(self.H264_START_CODE, start_code_pos + 4)
-            
-            if next_start_code_pos == -1:
-                frame_data = raw_video_data[start_code_pos:]
-                current_pos = len(raw_video_data)
-            else:
-                frame_data = raw_video_data[start_code_pos:next_start_code_pos]
-                current_pos = next_start_code_pos
-            
-            cleaned_data.extend(frame_data)
-            nal_unit_count += 1
-            
-        if not cleaned_data:
-            logger.error("No H.264 NAL units could be found in the data block.")
-            return False
-
-        logger.info(f"Found and stitched together {nal_unit_count} NAL units.")
-        
+        # NAL units run back to back from the first start code to the end of the video
+        # data, so cleaning amounts to dropping whatever precedes the first start code.
+        source_hasher = StreamHasher(self.hash_algorithms)
+        output_hasher = StreamHasher(self.hash_algorithms)
         try:
+            stream = self.open_stream(carve_start, block_info['end'], source_hasher)
+            if stream is None:
+                return False
             logger.info(f"Saving cleaned video stream to '{output_filename}'...")
-            with open(output_filename, 'wb') as f:
-                f.write(cleaned_data)
+            nal_unit_count = 0
+            tail = b''
+            with stream, open(output_filename, 'wb') as f:
+                while True:
+                    chunk = stream.read(self.COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    output_hasher.update(chunk)
+                    # Keep the end of the previous chunk so straddling start codes are counted.
+                    nal_unit_count += (tail + chunk[:len(self.H264_START_CODE) - 1]).count(self.H264_START_CODE)
+                    nal_unit_count += chunk.count(self.H264_START_CODE)
+                    tail = chunk[-(len(self.H264_START_CODE) - 1):]
+                stream.finish_hash()
+            logger.info(f"Found and stitched together {nal_unit_count} NAL units.")
+            self._record_hashes(output_filename, carve_start, block_info['end'], source_hasher, output_hasher)
+            if self.progress is not None:
+                self.progress.advance(items=1)
             logger.info(f"SUCCESS! File saved. Try opening it with a media player like VLC.")
             return True
         except IOError as e:
             logger.error(f"Failed to write video file. Error: {e}")
-            return False
\ No newline at end of file
+            return False
+        finally:
+            self._stop_hashers(source_hasher, output_hasher)
+
+
+def image_stream_inputs(reader, block_offsets=(), ranges=(), data_block_size=None, extra_offset=0):
+    """
+    Builds the StreamInputs for scanning video directly from a disk image: one per data
+    block (hex offset strings as listed in the HIKBTREE, bounded by their IDR tables) and
+    one per (start, end) absolute byte range.
+    """
+    extractor = VideoExtractor(reader, output_dir=None)
+    inputs = []
+    for offset_str in block_offsets:
+        if data_block_size is None:
+            raise ValueError("The data block size (from the master sector) is required to scan data blocks.")
+        block_info = extractor.block_video_range(int(offset_str, 16) + extra_offset, data_block_size)
+        if block_info is None:
+            raise ValueError(f"Could not determine the video boundaries of data block {offset_str}.")
+        name = f"video_block_at_{offset_str.replace('0x', '').lower()}"
+        inputs.append(extractor.stream_input(block_info['start'], block_info['end'], name))
+    for start_addr, end_addr in ranges:
+        inputs.append(extractor.stream_input(start_addr, end_addr, f"range_{start_addr:x}_{end_addr:x}"))
+    return inputs
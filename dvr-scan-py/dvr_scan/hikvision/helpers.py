@@ -1,6 +1,14 @@
+import hashlib
+import io
+import json
 import os
+import queue
 import sys
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 try:
@@ -9,12 +17,20 @@ try:
 except ImportError:
     HAS_EWF = False
 
+logger = logging.getLogger("dvr_scan")
+
 class ImageReader:
     def __init__(self, image_path):
         self.image_path = image_path
         self.handle = None
         self.is_ewf = False
         self.image_size = 0
+        # Serializes seek+read pairs so the reader can be shared between threads.
+        self._lock = threading.Lock()
+        # Totals over every read, so progress reports can tell I/O time from parsing time.
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self._stats_lock = threading.Lock()
 
     def open(self):
         if not os.path.exists(self.image_path):
@@ -22,41 +38,375 @@ class ImageReader:
         if self.image_path.lower().endswith(('.e01', '.ewf')):
             if not HAS_EWF:
                 raise ImportError("pyewf-ctypes is required for E01 files. Run: pip install pyewf-ctypes")
-            logging.info(f"Opening E01 image file: {self.image_path}")
+            logger.info(f"Opening E01 image file: {self.image_path}")
             filenames = pyewf.glob(self.image_path)
             self.handle = pyewf.handle()
             self.handle.open(filenames)
             self.is_ewf = True
             self.image_size = self.handle.get_media_size()
         else:
-            logging.info(f"Opening raw image file: {self.image_path}")
+            logger.info(f"Opening raw image file: {self.image_path}")
             self.handle = open(self.image_path, 'rb')
             self.is_ewf = False
             self.handle.seek(0, 2)
             self.image_size = self.handle.tell()
-        logging.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
+        logger.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
         return True
 
     def close(self):
         if self.handle:
             self.handle.close()
-            logging.info("Image file handle closed.")
+            logger.info("Image file handle closed.")
 
     def read(self, offset, size):
         if not self.handle:
             raise IOError("Image is not open.")
-        self.handle.seek(offset)
-        return self.handle.read(size)
+        start = time.perf_counter()
+        # Positional reads on raw images don't touch the shared file position, so
+        # concurrent readers don't need to wait on each other.
+        if not self.is_ewf and hasattr(os, 'pread'):
+            data = os.pread(self.handle.fileno(), size, offset)
+        else:
+            with self._lock:
+                self.handle.seek(offset)
+                data = self.handle.read(size)
+        with self._stats_lock:
+            self.bytes_read += len(data)
+            self.read_seconds += time.perf_counter() - start
+        return data
+
+    def read_coalesced(self, ranges, max_gap=64 * 1024, max_size=16 * 1024 * 1024, workers=4):
+        """
+        Reads many (start, end, tag) byte ranges by sorting and merging them into large
+        contiguous reads (see coalesce_ranges), which are issued concurrently on a thread
+        pool. Yields (run_start, data, members) in address order, keeping at most
+        2 * `workers` reads in flight so memory use stays bounded.
+
+        If a merged read fails (e.g. a bad chunk of an E01 image), its ranges are read
+        again one at a time, and any which still fail are logged and left out.
+        """
+        runs = iter(coalesce_ranges(ranges, max_gap, max_size))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for run_start, run_end, members in runs:
+                pending.append((run_start, members, executor.submit(self.read, run_start, run_end - run_start)))
+                if len(pending) >= 2 * workers:
+                    yield from self._coalesced_result(*pending.popleft())
+            while pending:
+                yield from self._coalesced_result(*pending.popleft())
+
+    def _coalesced_result(self, run_start, members, future):
+        try:
+            data = future.result()
+        except Exception as e:
+            logger.error(f"  Could not read data from offset {hex(run_start)}. Error: {e}")
+        else:
+            yield run_start, data, members
+            return
+        if len(members) == 1:
+            return
+        for start, end, tag in members:
+            try:
+                data = self.read(start, end - start)
+            except Exception as e:
+                logger.error(f"  Could not read data from offset {hex(start)}. Error: {e}")
+                continue
+            yield start, data, [(start, end, tag)]
+
+class ProgressReporter:
+    """
+    Prints `hik_progress` JSON events for a long-running task, at most one every
+    `interval` seconds: bytes and items (pages, entries, blocks) processed against their
+    totals, throughput and an ETA. If a `reader` is given, the time it spent reading is
+    included as `io_seconds`; when that is close to `elapsed_seconds` the task is I/O
+    bound, otherwise parsing is the bottleneck. Other counters (e.g. entries found) can
+    be passed to `advance` by name and are reported as running totals.
+    """
+
+    # Events from concurrent stages (see AnalysisPipeline) must not interleave on stdout.
+    _print_lock = threading.Lock()
+
+    def __init__(self, task, reader=None, interval=0.5, emit=None):
+        self.task = task
+        self.reader = reader
+        self.interval = interval
+        # Called with each event dict, defaults to printing it as a line of JSON.
+        self.emit = emit or self._print_event
+        self.begin()
+
+    def begin(self, total_bytes=None, total_items=None, unit="items"):
+        """Starts (or restarts) timing, with the totals used for the percentage and ETA."""
+        self.total_bytes = total_bytes
+        self.total_items = total_items
+        self.unit = unit
+        self.bytes_done = 0
+        self.items_done = 0
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._start_read_seconds = self.reader.read_seconds if self.reader else 0.0
+        self._last_emit = None
+
+    def advance(self, nbytes=0, items=0, **counters):
+        """Records work done, emitting an event if `interval` has passed since the last."""
+        self.bytes_done += nbytes
+        self.items_done += items
+        for name, count in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + count
+        now = time.perf_counter()
+        if self._last_emit is None or now - self._last_emit >= self.interval:
+            self._last_emit = now
+            self.emit(self.event())
+
+    def finish(self):
+        """Emits a final event regardless of the interval."""
+        self.emit(self.event(finished=True))
+
+    def event(self, finished=False):
+        elapsed = time.perf_counter() - self._start
+        rate = self.bytes_done / elapsed if elapsed > 0 else 0.0
+        # Prefer bytes for the percentage, the items total isn't always known up front.
+        if self.total_bytes:
+            fraction = self.bytes_done / self.total_bytes
+        elif self.total_items:
+            fraction = self.items_done / self.total_items
+        else:
+            fraction = None
+        eta = None
+        if fraction and not finished:
+            eta = round(elapsed * (1 - fraction) / fraction, 1)
+        return {
+            "type": "hik_progress",
+            "task": self.task,
+            "finished": finished,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.total_bytes,
+            "items_done": self.items_done,
+            "items_total": self.total_items,
+            "unit": self.unit,
+            **self.counters,
+            "percent": round(100 * min(1.0, fraction), 1) if fraction is not None else None,
+            "elapsed_seconds": round(elapsed, 3),
+            "io_seconds": round(self.reader.read_seconds - self._start_read_seconds, 3) if self.reader else None,
+            "mb_per_sec": round(rate / 1024**2, 2),
+            "eta_seconds": 0 if finished else eta,
+        }
+
+    @classmethod
+    def _print_event(cls, event):
+        with cls._print_lock:
+            print(json.dumps(event), flush=True)
+
+class StreamHasher:
+    """
+    Computes digests (SHA-256 by default) of data as it is read or written, on a worker
+    thread fed through a bounded queue so hashing overlaps the I/O instead of requiring
+    another pass over the data. hashlib releases the GIL for large updates.
+    """
+
+    def __init__(self, algorithms=("sha256",), max_pending=8):
+        self._hashes = {name: hashlib.new(name) for name in algorithms}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self.size = 0
+        self._thread = threading.Thread(target=self._hash_thread, daemon=True)
+        self._thread.start()
+
+    def update(self, data):
+        self.size += len(data)
+        self._queue.put(bytes(data))
+
+    def hexdigests(self):
+        """Waits for all queued data to be hashed and returns {algorithm: hex digest}."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return {name: digest.hexdigest() for name, digest in self._hashes.items()}
+
+    def _hash_thread(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                for digest in self._hashes.values():
+                    digest.update(data)
+            except Exception as e:
+                self._error = e
+
+
+class ImageRangeStream(io.RawIOBase):
+    """
+    A read-only, seekable file-like view of the bytes [start, end) of an image, so a
+    carved range can be handed straight to a decoder without writing a temp file.
+    Sequential reads are served by a background thread reading up to `prefetch` chunks
+    ahead into a bounded queue, overlapping the image reads with decoding.
+
+    If a `hasher` (StreamHasher) is given, every byte of the range is passed to it once,
+    in order, as it is first read; `finish_hash` hashes whatever was skipped over.
+    """
+
+    def __init__(self, reader, start, end, chunk_size=4 * 1024 * 1024, prefetch=4, hasher=None, progress=None):
+        super().__init__()
+        self.reader = reader
+        self.hasher = hasher
+        # ProgressReporter advanced by the size of each chunk as it is first read.
+        self.progress = progress
+        self._hashed_to = 0
+        self.start = start
+        self.size = max(0, end - start)
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self._pos = 0
+        self._buffer = b''
+        self._buffer_pos = 0
+        self._next_pos = None  # Stream position of the next chunk the prefetch thread will queue.
+        self._queue = None
+        self._stop = None
+        self._thread = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer):
+        # Fill the whole buffer (like a regular file) rather than stopping at chunk boundaries.
+        view = memoryview(buffer).cast('B')
+        total = 0
+        while total < len(view) and self._pos < self.size:
+            if not self._buffer_pos <= self._pos < self._buffer_pos + len(self._buffer):
+                self._fetch_chunk()
+                if not self._buffer:
+                    break
+            offset = self._pos - self._buffer_pos
+            count = min(len(view) - total, len(self._buffer) - offset)
+            view[total:total + count] = self._buffer[offset:offset + count]
+            self._pos += count
+            total += count
+        return total
+
+    def close(self):
+        self._stop_prefetch()
+        super().close()
+
+    def _fetch_chunk(self):
+        # Reads that don't continue where the prefetcher is (i.e. after a seek) restart it.
+        if self._thread is None or self._next_pos != self._pos:
+            self._stop_prefetch()
+            self._start_prefetch(self._pos)
+        chunk_pos, data = self._queue.get()
+        if isinstance(data, Exception):
+            raise data
+        self._buffer, self._buffer_pos = data, chunk_pos
+        self._next_pos = chunk_pos + len(data) if data else None
+        if chunk_pos <= self._hashed_to < chunk_pos + len(data):
+            if self.hasher is not None:
+                self.hasher.update(memoryview(data)[self._hashed_to - chunk_pos:])
+            if self.progress is not None:
+                self.progress.advance(nbytes=chunk_pos + len(data) - self._hashed_to)
+            self._hashed_to = chunk_pos + len(data)
+
+    def finish_hash(self):
+        """Hashes the rest of the range (anything not read, e.g. after seeking past it)."""
+        while self.hasher is not None and self._hashed_to < self.size:
+            data = self.reader.read(self.start + self._hashed_to, min(self.chunk_size, self.size - self._hashed_to))
+            if not data:
+                break
+            self.hasher.update(data)
+            self._hashed_to += len(data)
+
+    def _start_prefetch(self, pos):
+        self._queue = queue.Queue(maxsize=self.prefetch)
+        self._stop = threading.Event()
+        self._next_pos = pos
+        self._thread = threading.Thread(
+            target=self._prefetch_thread, args=(pos, self._queue, self._stop), daemon=True)
+        self._thread.start()
+
+    def _stop_prefetch(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        # Unblock the thread if it is waiting on a full queue.
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                self._thread.join(timeout=0.01)
+        self._thread = None
+
+    def _prefetch_thread(self, pos, chunk_queue, stop):
+        try:
+            while pos < self.size and not stop.is_set():
+                data = self.reader.read(self.start + pos, min(self.chunk_size, self.size - pos))
+                if not data:
+                    break
+                chunk_queue.put((pos, data))
+                pos += len(data)
+            chunk_queue.put((pos, b''))
+        except Exception as e:
+            chunk_queue.put((pos, e))
+
+
+def coalesce_ranges(ranges, max_gap, max_size):
+    """
+    Sorts (start, end, tag) byte ranges and merges neighbours separated by at most
+    `max_gap` bytes into runs no larger than `max_size` (unless a single range is).
+    Returns a list of (run_start, run_end, members) where `members` are the original ranges.
+    """
+    runs = []
+    for rng in sorted(ranges, key=lambda r: r[0]):
+        start, end = rng[0], rng[1]
+        if runs:
+            run_start, run_end, members = runs[-1]
+            if start - run_end <= max_gap and max(end, run_end) - run_start <= max_size:
+                runs[-1] = (run_start, max(end, run_end), members)
+                members.append(rng)
+                continue
+        runs.append((start, end, [rng]))
+    return runs
 
 def format_timestamp(ts):
     if ts == 0 or ts >= 0x7FFFFFFF or ts == 0xFFFFFFFF: return "Invalid/Not Set"
     try: return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S UTC')
     except (OSError, ValueError): return f"Invalid Timestamp ({ts})"
 
+def parse_timestamp(value):
+    """Parses a unix timestamp or a 'YYYY-MM-DD HH:MM:SS' string as shown by format_timestamp."""
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    if value.endswith(' UTC'):
+        value = value[:-4]
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S'):
+        try: return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError: pass
+    raise ValueError(f"Invalid time: {value} (expected a unix timestamp or YYYY-MM-DD HH:MM:SS)")
+
 def format_bytes(byte_string):
     return ' '.join(f'{b:02X}' for b in byte_string)
 
 def log_and_format(name, addr, val, is_ts=False):
     readable = format_timestamp(val) if is_ts else hex(val)
-    logging.info(f"  Found {name}: {val} ({readable}) at {hex(addr)}")
+    logger.info(f"  Found {name}: {val} ({readable}) at {hex(addr)}")
     return {"value": val, "value_readable": readable, "address": addr, "address_hex": hex(addr)}
\ No newline at end of file
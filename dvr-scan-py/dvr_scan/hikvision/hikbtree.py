@@ -8,48 +8,9 @@ import logging
 import os
 import json
 
-# --- (Standard setup: pyewf import, logging, and ImageReader class) ---
-try:
-    import pyewf
-    HAS_EWF = True
-except ImportError:
-    HAS_EWF = False
-
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
-
-class ImageReader:
-    # ... (This class is identical to the previous scripts and does not need changes) ...
-    def __init__(self, image_path):
-        self.image_path = image_path
-        self.handle = None
-        self.is_ewf = False
-        self.image_size = 0
-
-    def open(self):
-        if not os.path.exists(self.image_path):
-            raise FileNotFoundError(f"Image file not found: {self.image_path}")
-        if self.image_path.lower().endswith(('.e01', '.ewf')):
-            if not HAS_EWF:
-                raise ImportError("pyewf is not installed. Required for E01 files. Run: pip install pyewf")
-            self.handle = pyewf.handle()
-            self.handle.open(pyewf.glob(self.image_path))
-            self.is_ewf = True
-            self.image_size = self.handle.get_media_size()
-        else:
-            self.handle = open(self.image_path, 'rb')
-            self.is_ewf = False
-            self.handle.seek(0, 2)
-            self.image_size = self.handle.tell()
-        logging.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
-        return True
-
-    def close(self):
-        if self.handle: self.handle.close()
+from dvr_scan.hikvision.helpers import ImageReader
 
-    def read(self, offset, size):
-        if not self.handle: raise IOError("Image is not open.")
-        self.handle.seek(offset)
-        return self.handle.read(size)
+logger = logging.getLogger("dvr_scan")
 
 class HikbtreeParser:
     """
@@ -58,19 +19,41 @@ class HikbtreeParser:
     """
     
     HIKBTREE_SIGNATURE = b'HIKBTREE'
-
-    def __init__(self, image_reader):
+    PAGE_SIZE = 4096
+    PAGE_LIST_HEADER_SIZE = 80
+    PAGE_LIST_ENTRY_SIZE = 48
+    # Upper bound on the page count so a corrupt header can't trigger a huge read.
+    MAX_PAGES = 1 << 20
+    READ_WORKERS = 4
+
+    def __init__(self, image_reader, progress=None):
         self.reader = image_reader
+        # ProgressReporter advanced as each page is parsed.
+        self.progress = progress
         self.analysis_results = {}
 
-    def run_parser(self, master_file, output_file, extra_offset=0):
-        """Main workflow to orchestrate the parsing of the HIKBTREE."""
+    def run_parser(self, master_file, output_file, extra_offset=0, case_store=None):
+        """
+        Main workflow to orchestrate the parsing of the HIKBTREE. If `case_store` is
+        set, pages and entries are also written to the case database.
+        """
         try:
             with open(master_file, 'r') as f:
-                master_data = json.load(f)['master_sector']
-            hbt_base_offset = master_data['hikbtree1_offset']['value']
-        except (FileNotFoundError, KeyError) as e:
-            logging.error(f"FATAL: Could not read HIKBTREE offset from '{master_file}'. Error: {e}")
+                master_data = json.load(f)
+        except FileNotFoundError as e:
+            logger.error(f"FATAL: Could not read HIKBTREE offset from '{master_file}'. Error: {e}")
+            return False
+        return self.parse(master_data, output_file, extra_offset, case_store)
+
+    def parse(self, master_data, output_file, extra_offset=0, case_store=None):
+        """
+        Same as `run_parser`, but takes the master sector results in memory (the contents
+        of master_sector.json, i.e. `MasterSectorParser.analysis_results`).
+        """
+        try:
+            hbt_base_offset = master_data['master_sector']['hikbtree1_offset']['value']
+        except KeyError as e:
+            logger.error(f"FATAL: Could not read HIKBTREE offset from the master sector. Error: {e}")
             return False
 
         header_info = self._parse_header(hbt_base_offset, extra_offset)
@@ -81,27 +64,28 @@ class HikbtreeParser:
         if not page_list_info: return False
         self.analysis_results['page_list_summary'] = page_list_info
 
-        page_offsets = [p['page_offset']['value'] for p in page_list_info['page_metadata']]
-        all_pages_data = self._parse_all_pages(page_offsets, extra_offset)
-        self.analysis_results['pages'] = all_pages_data
-
         footer_info = self._parse_footer(header_info['footer_address']['value'], extra_offset)
         if not footer_info: return False
         self.analysis_results['footer'] = footer_info
-        
-        return self._save_results_to_json(output_file)
+
+        # Pages are parsed and written out one at a time rather than kept in memory.
+        page_offsets = [p['page_offset']['value'] for p in page_list_info['page_metadata']]
+        pages = self._iter_pages(page_offsets, extra_offset)
+        if case_store is not None:
+            pages = case_store.store_hikbtree_pages(pages)
+        return self._save_results_to_json(output_file, pages)
 
     def _parse_header(self, base_addr, extra_offset):
         """Parses the HIKBTREE Header."""
-        logging.info(f"\n--- 1. Parsing HIKBTREE Header at {hex(base_addr)} ---")
+        logger.info(f"\n--- 1. Parsing HIKBTREE Header at {hex(base_addr)} ---")
         data_addr = base_addr + extra_offset
         data = self.reader.read(data_addr, 256)
 
         if not data.startswith(self.HIKBTREE_SIGNATURE):
-            logging.error(f"HIKBTREE signature not found at {hex(data_addr)}!")
+            logger.error(f"HIKBTREE signature not found at {hex(data_addr)}!")
             return None
         
-        logging.info(f"  Found Signature 'HIKBTREE' at {hex(data_addr)}")
+        logger.info(f"  Found Signature 'HIKBTREE' at {hex(data_addr)}")
         
         try:
             sig_len = len(self.HIKBTREE_SIGNATURE)
@@ -124,14 +108,21 @@ class HikbtreeParser:
                 "page_1_address": self._log_and_format("Page 1 Offset (from header)", page1_offset_addr, page1_offset),
             }
         except (struct.error, IndexError) as e:
-            logging.error(f"Failed to parse header structure. Error: {e}")
+            logger.error(f"Failed to parse header structure. Error: {e}")
             return None
 
     def _parse_page_list(self, base_addr, extra_offset):
         """Parses the Page List structure."""
-        logging.info(f"\n--- 2. Parsing Page List at {hex(base_addr)} ---")
+        logger.info(f"\n--- 2. Parsing Page List at {hex(base_addr)} ---")
         data_addr = base_addr + extra_offset
-        data = self.reader.read(data_addr, 8192)
+        data = self.reader.read(data_addr, self.PAGE_LIST_HEADER_SIZE)
+        if len(data) >= 4:
+            # The page list grows with the disk, so size the read from the page count.
+            total_pages = struct.unpack('<I', data[0:4])[0]
+            if total_pages > self.MAX_PAGES:
+                logger.warning(f"  Page count {total_pages} looks invalid, only reading the first {self.MAX_PAGES} pages.")
+            num_entries = min(total_pages, self.MAX_PAGES)
+            data = self.reader.read(data_addr, self.PAGE_LIST_HEADER_SIZE + num_entries * self.PAGE_LIST_ENTRY_SIZE)
 
         try:
             total_pages = struct.unpack('<I', data[0:4])[0]
@@ -140,14 +131,14 @@ class HikbtreeParser:
             page_metadata = []
             # --- THIS IS THE FIX ---
             # Corrected starting offset from 76 to 80
-            current_offset_in_block = 80
+            current_offset_in_block = self.PAGE_LIST_HEADER_SIZE
             # --- END OF FIX ---
 
             for i in range(total_pages):
                 entry_addr = data_addr + current_offset_in_block
                 entry_data = data[current_offset_in_block : current_offset_in_block + 48]
                 if len(entry_data) < 48:
-                    logging.warning(f"  Ran out of data in page list after {i} pages.")
+                    logger.warning(f"  Ran out of data in page list after {i} pages.")
                     break
 
                 page_offset = struct.unpack('<Q', entry_data[0:8])[0]
@@ -156,7 +147,7 @@ class HikbtreeParser:
                 end_time = struct.unpack('<I', entry_data[28:32])[0]
                 first_block_offset = struct.unpack('<Q', entry_data[32:40])[0]
                 
-                logging.info(f"  Parsed metadata for Page #{i+1} at {hex(entry_addr)}")
+                logger.debug(f"  Parsed metadata for Page #{i+1} at {hex(entry_addr)}")
                 page_metadata.append({
                     "page_number": i + 1,
                     "page_offset": {"value": page_offset, "address": entry_addr},
@@ -165,29 +156,43 @@ class HikbtreeParser:
                     "first_entry_end_time": {"value": end_time, "readable": self._format_timestamp(end_time)},
                     "first_entry_data_offset": {"value": first_block_offset}
                 })
-                current_offset_in_block += 48
-            
+                current_offset_in_block += self.PAGE_LIST_ENTRY_SIZE
+
+            logger.info(f"  Parsed metadata for {len(page_metadata)} pages.")
             page_list_summary["page_metadata"] = page_metadata
             return page_list_summary
 
         except (struct.error, IndexError) as e:
-            logging.error(f"Failed to parse page list structure. Error: {e}")
+            logger.error(f"Failed to parse page list structure. Error: {e}")
             return None
 
-    def _parse_all_pages(self, page_offsets, extra_offset):
-        """Iterates through page offsets and parses each one."""
-        logging.info(f"\n--- 3. Parsing {len(page_offsets)} Individual Pages ---")
-        all_pages = {}
-        for i, page_addr in enumerate(page_offsets):
-            logging.info(f"  -> Parsing Page #{i+1} at {hex(page_addr)}")
-            page_data = self._parse_single_page(page_addr, extra_offset)
-            all_pages[f"page_{i+1}"] = page_data
-        return all_pages
-
-    def _parse_single_page(self, base_addr, extra_offset):
+    def _iter_pages(self, page_offsets, extra_offset):
+        """
+        Yields (page_key, page_info) for every page. Page reads are sorted and
+        coalesced into large contiguous reads which are issued concurrently.
+        """
+        logger.info(f"\n--- 3. Parsing {len(page_offsets)} Individual Pages ---")
+        ranges = [
+            (page_addr + extra_offset, page_addr + extra_offset + self.PAGE_SIZE, (i, page_addr))
+            for i, page_addr in enumerate(page_offsets)
+        ]
+        if self.progress is not None:
+            self.progress.begin(len(page_offsets) * self.PAGE_SIZE, len(page_offsets), "pages")
+        num_entries = 0
+        for run_start, data, members in self.reader.read_coalesced(ranges, workers=self.READ_WORKERS):
+            for start, end, (i, page_addr) in members:
+                page_data = self._parse_single_page(page_addr, extra_offset, data[start - run_start:end - run_start])
+                num_entries += len(page_data.get("entries", []))
+                if self.progress is not None:
+                    self.progress.advance(nbytes=end - start, items=1, entries=len(page_data.get("entries", [])))
+                yield f"page_{i+1}", page_data
+        if self.progress is not None:
+            self.progress.finish()
+        logger.info(f"  Parsed {num_entries} entries from {len(page_offsets)} pages.")
+
+    def _parse_single_page(self, base_addr, extra_offset, page_content):
         """Parses the data block entries within a single page."""
         data_addr = base_addr + extra_offset
-        page_content = self.reader.read(data_addr, 4096)
         
         try:
             next_page_offset = struct.unpack('<Q', page_content[16:24])[0]
@@ -227,45 +232,63 @@ class HikbtreeParser:
             return page_info
 
         except (struct.error, IndexError) as e:
-            logging.error(f"    Failed to parse page at {hex(base_addr)}. Error: {e}")
+            logger.error(f"    Failed to parse page at {hex(base_addr)}. Error: {e}")
             return {"error": str(e)}
 
     def _parse_footer(self, base_addr, extra_offset):
         """Parses the HIKBTREE Footer."""
-        logging.info(f"\n--- 4. Parsing HIKBTREE Footer at {hex(base_addr)} ---")
+        logger.info(f"\n--- 4. Parsing HIKBTREE Footer at {hex(base_addr)} ---")
         data_addr = base_addr + extra_offset
         data = self.reader.read(data_addr, 32)
         
         try:
             if not data.startswith(b'\xFF' * 8):
-                logging.warning("Footer does not start with expected FF padding.")
+                logger.warning("Footer does not start with expected FF padding.")
 
             last_page_offset_addr = data_addr + 8
             last_page_offset = struct.unpack('<Q', data[8:16])[0]
 
             return { "last_page_address": self._log_and_format("Last Page Offset", last_page_offset_addr, last_page_offset) }
         except (struct.error, IndexError) as e:
-            logging.error(f"Failed to parse footer structure. Error: {e}")
+            logger.error(f"Failed to parse footer structure. Error: {e}")
             return None
 
     # --- Helper functions ---
     def _log_and_format(self, name, addr, val, is_ts=False):
         readable = self._format_timestamp(val) if is_ts else hex(val)
-        logging.info(f"  Found {name}: {val} ({readable}) at {hex(addr)}")
+        logger.info(f"  Found {name}: {val} ({readable}) at {hex(addr)}")
         return {"value": val, "value_readable": readable, "address": addr, "address_hex": hex(addr)}
 
-    def _save_results_to_json(self, filename):
-        logging.info(f"\n--- Saving HIKBTREE analysis to {filename} ---")
+    def _save_results_to_json(self, filename, pages):
+        """Writes the results incrementally, streaming each page from `pages` as it is parsed."""
+        logger.info(f"\n--- Saving HIKBTREE analysis to {filename} ---")
         self.analysis_results['image_info'] = {"filename": os.path.basename(self.reader.image_path)}
+        temp_filename = filename + '.tmp'
         try:
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.analysis_results, f, indent=4)
-            logging.info(f"Successfully wrote analysis to {filename}")
+            if os.path.dirname(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                f.write('{"header": ' + json.dumps(self.analysis_results['header']))
+                f.write(',\n"page_list_summary": ' + json.dumps(self.analysis_results['page_list_summary']))
+                f.write(',\n"pages": {')
+                for i, (page_key, page_data) in enumerate(pages):
+                    f.write(('\n' if i == 0 else ',\n') + json.dumps(page_key) + ': ' + json.dumps(page_data))
+                f.write('},\n"footer": ' + json.dumps(self.analysis_results['footer']))
+                f.write(',\n"image_info": ' + json.dumps(self.analysis_results['image_info']) + '}\n')
+            # Only replace the output once complete so readers never see a partial file.
+            os.replace(temp_filename, filename)
+            logger.info(f"Successfully wrote analysis to {filename}")
             return True
         except (IOError, TypeError) as e:
-            logging.error(f"Failed to write to JSON file. Error: {e}")
+            logger.error(f"Failed to write to JSON file. Error: {e}")
             return False
+        finally:
+            # Left behind if writing failed, including on errors from `pages` not caught above.
+            if os.path.exists(temp_filename):
+                try:
+                    os.remove(temp_filename)
+                except OSError:
+                    pass
 
     def _format_timestamp(self, ts):
         if ts == 0 or ts >= 0x7FFFFFFF or ts == 0xFFFFFFFF: return "Invalid/Not Set"
@@ -274,7 +297,7 @@ class HikbtreeParser:
 
 def main():
     config_filename = "config.json"
-    logging.info(f"Reading settings from '{config_filename}'...")
+    logger.info(f"Reading settings from '{config_filename}'...")
     try:
         with open(config_filename, 'r') as f:
             config = json.load(f)
@@ -283,7 +306,7 @@ def main():
         output_file = config['output_files']['hikbtree']
         extra_offset = config.get('extra_offset', 0)
     except (FileNotFoundError, KeyError) as e:
-        logging.critical(f"FATAL: Config file '{config_filename}' is missing required data. Error: {e}")
+        logger.critical(f"FATAL: Config file '{config_filename}' is missing required data. Error: {e}")
         sys.exit(1)
 
     reader = None
@@ -293,11 +316,11 @@ def main():
         
         parser = HikbtreeParser(reader)
         if parser.run_parser(master_file, output_file, extra_offset):
-            logging.info("\nHIKBTREE parsing completed successfully.")
+            logger.info("\nHIKBTREE parsing completed successfully.")
         else:
-            logging.error("\nHIKBTREE parsing failed.")
+            logger.error("\nHIKBTREE parsing failed.")
     except Exception as e:
-        logging.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
+        logger.critical(f"An unexpected critical error occurred: {e}", exc_info=True)
         sys.exit(1)
     finally:
         if reader: reader.close()
@@ -1,9 +1,22 @@
 # dvr-scan-py/dvr_scan/hikvision/idr_parser.py
 
-import struct
+import collections
 from datetime import datetime
 import logging
 
+import numpy as np
+
+logger = logging.getLogger("dvr_scan")
+
+# Layout of a single 56-byte IDR ('OFNI') record. Only the fields we currently understand are
+# named, the remaining bytes are skipped by the explicit offsets.
+IDR_RECORD_DTYPE = np.dtype({
+    "names": ["signature", "record_size", "frame_index", "channel", "timestamp"],
+    "formats": ["S4", "<u4", "<u4", "u1", "<u4"],
+    "offsets": [0, 4, 12, 16, 24],
+    "itemsize": 56,
+})
+
 class IdrParser:
     """
     A helper class that provides logic for finding and parsing the IDR metadata
@@ -12,75 +25,167 @@ class IdrParser:
     """
     IDR_SIGNATURE = b'OFNI'
     IDR_RECORD_SIZE = 56
+    # A generous 10MB buffer is safe, fast, and covers worst-case scenarios
+    SEARCH_BUFFER_SIZE = 10 * 1024 * 1024
+    # Tail reads of neighbouring blocks closer than this are merged into a single read.
+    MAX_COALESCE_GAP = 1024 * 1024
+    MAX_COALESCED_READ = 64 * 1024 * 1024
 
     def __init__(self, image_reader):
         self.reader = image_reader
 
     def parse_single_data_block(self, block_start_addr, block_size):
         """
-        Reads from the end of a data block's allocated space and searches
-        backwards to find and parse all IDR records.
-        Returns a list of parsed records if found, otherwise None.
+        Reads from the end of a data block's allocated space and locates the
+        IDR table. Returns a list of parsed records if found, otherwise None.
         """
-        # A generous 10MB buffer is safe, fast, and covers worst-case scenarios
-        search_buffer_size = 10 * 1024 * 1024
-        block_end_addr = block_start_addr + block_size
-        read_start_addr = block_end_addr - search_buffer_size
-
-        if read_start_addr < block_start_addr:
-            read_start_addr = block_start_addr
-            search_buffer_size = block_end_addr - read_start_addr
+        table = self.read_table(block_start_addr, block_size)
+        if table is None:
+            return None
+        table_addr, records = table
+        logger.info(f"  Successfully parsed {len(records)} IDR records for this block.")
+        return self.records_to_dicts(table_addr, records)
 
-        if search_buffer_size <= 0:
-            logging.warning(f"  Invalid block size for block at {hex(block_start_addr)}. Skipping.")
+    def read_table(self, block_start_addr, block_size):
+        """
+        Reads the tail of a single data block and decodes its IDR table.
+        Returns a tuple of (table_addr, records) where `records` is a numpy array of
+        IDR_RECORD_DTYPE, or None if no table could be found.
+        """
+        window = self._search_window(block_start_addr, block_size)
+        if window is None:
             return None
+        read_start_addr, search_buffer_size = window
 
-        logging.info(f"  Reading {search_buffer_size / 1024:.0f} KB from the end of the data block to find IDR table...")
+        logger.info(f"  Reading {search_buffer_size / 1024:.0f} KB from the end of the data block to find IDR table...")
 
         try:
             data_chunk = self.reader.read(read_start_addr, search_buffer_size)
         except Exception as e:
-            logging.error(f"  Could not read data from offset {hex(read_start_addr)}. Error: {e}")
+            logger.error(f"  Could not read data from offset {hex(read_start_addr)}. Error: {e}")
+            return None
+
+        return self.locate_table(data_chunk, read_start_addr)
+
+    def parse_data_blocks(self, block_start_addrs, block_size):
+        """
+        Batch version of `read_table` for many data blocks. The tail of every block is
+        sorted by address, neighbouring tails are merged into large contiguous reads,
+        and the reads are issued concurrently.
+        Returns a dict mapping each block start address to (table_addr, records), or
+        None for blocks without a valid IDR table.
+        """
+        windows = {}
+        for block_start_addr in block_start_addrs:
+            window = self._search_window(block_start_addr, block_size)
+            if window is not None:
+                windows[block_start_addr] = window
+
+        results = {addr: None for addr in block_start_addrs}
+        ranges = [(start, start + size, addr) for addr, (start, size) in windows.items()]
+        for run_start, data, members in self.reader.read_coalesced(
+                ranges, self.MAX_COALESCE_GAP, self.MAX_COALESCED_READ):
+            for start, end, block_start_addr in members:
+                results[block_start_addr] = self.locate_table(
+                    data, run_start, start - run_start, end - run_start)
+
+        found = sum(1 for table in results.values() if table is not None)
+        logger.info(f"  Parsed IDR tables for {found} of {len(results)} data blocks.")
+        return results
+
+    def unverified_blocks(self, keyframe_offsets):
+        """
+        Checks the `frame_index` of IDR records is the byte offset of a keyframe from the
+        start of its data block, which carving at keyframe granularity relies on, by
+        requiring an H.264 start code at each one. Takes {block_start_addr: frame_indexes}
+        and returns the set of blocks where any offset isn't a start code (or can't be read).
+        """
+        ranges = [(addr + offset, addr + offset + 4, addr)
+                  for addr, frame_indexes in keyframe_offsets.items()
+                  for offset in set(int(frame_index) for frame_index in frame_indexes)]
+        verified = dict.fromkeys(keyframe_offsets, 0)
+        for run_start, data, members in self.reader.read_coalesced(ranges, max_gap=0):
+            for start, end, addr in members:
+                code = data[start - run_start:end - run_start]
+                if code == b'\x00\x00\x00\x01' or code[:3] == b'\x00\x00\x01':
+                    verified[addr] += 1
+        expected = collections.Counter(addr for _, _, addr in ranges)
+        return {addr for addr in keyframe_offsets if verified[addr] != expected[addr]}
+
+    def locate_table(self, data, base_addr, lo=0, hi=None):
+        """
+        Finds the contiguous IDR table ending at the last 'OFNI' signature in
+        `data[lo:hi]` and decodes all of its records in one pass.
+        `base_addr` is the image address of `data[0]`.
+        """
+        hi = len(data) if hi is None else min(hi, len(data))
+        last_sig = data.rfind(self.IDR_SIGNATURE, lo, hi)
+        # A signature too close to the end of the window can't hold a whole record.
+        while last_sig != -1 and last_sig + self.IDR_RECORD_SIZE > hi:
+            last_sig = data.rfind(self.IDR_SIGNATURE, lo, last_sig)
+        if last_sig == -1:
+            logger.warning("  No IDR ('OFNI') signature found at the end of this data block.")
             return None
 
-        sig_pos_in_chunk = data_chunk.rfind(self.IDR_SIGNATURE)
+        # View the window as an array of records aligned to the last signature.
+        phase = lo + (last_sig - lo) % self.IDR_RECORD_SIZE
+        last_index = (last_sig - phase) // self.IDR_RECORD_SIZE
+        records = np.frombuffer(data, dtype=IDR_RECORD_DTYPE, count=last_index + 1, offset=phase)
 
-        if sig_pos_in_chunk == -1:
-            logging.warning("  No IDR ('OFNI') signature found at the end of this data block.")
+        valid = (records["signature"] == self.IDR_SIGNATURE) & (records["record_size"] == self.IDR_RECORD_SIZE)
+        if not valid[last_index]:
+            logger.warning(f"  Record at {hex(base_addr + last_sig)} has unexpected size {records['record_size'][last_index]}.")
             return None
+        invalid = np.flatnonzero(~valid)
+        first_index = int(invalid[-1]) + 1 if invalid.size else 0
+
+        table_addr = base_addr + phase + first_index * self.IDR_RECORD_SIZE
+        # Copy so we don't hold a reference to the (much larger) read buffer.
+        return table_addr, records[first_index:].copy()
+
+    def records_to_dicts(self, table_addr, records):
+        """Converts a decoded IDR table into the list-of-dicts form used in JSON output."""
+        addresses = range(table_addr, table_addr + len(records) * self.IDR_RECORD_SIZE, self.IDR_RECORD_SIZE)
+        return [
+            {
+                "address": address, "frame_index": frame_index, "channel": channel,
+                "timestamp_unix": timestamp, "timestamp_readable": self._format_timestamp(timestamp)
+            }
+            for address, frame_index, channel, timestamp in zip(
+                addresses,
+                records["frame_index"].tolist(),
+                records["channel"].tolist(),
+                records["timestamp"].tolist(),
+            )
+        ]
+
+    @staticmethod
+    def summarize_table(records):
+        """Returns the number of records and the valid time span covered by an IDR table."""
+        timestamps = records["timestamp"]
+        timestamps = timestamps[(timestamps > 0) & (timestamps < 0x7FFFFFFF)]
+        return {
+            "record_count": len(records),
+            "start_time": int(timestamps.min()) if timestamps.size else None,
+            "end_time": int(timestamps.max()) if timestamps.size else None,
+            "channels": sorted(set(records["channel"].tolist())),
+        }
+
+    def _search_window(self, block_start_addr, block_size):
+        search_buffer_size = self.SEARCH_BUFFER_SIZE
+        block_end_addr = block_start_addr + block_size
+        read_start_addr = block_end_addr - search_buffer_size
 
-        idr_records = []
-        while sig_pos_in_chunk != -1:
-            record_addr = read_start_addr + sig_pos_in_chunk
-            record_data = data_chunk[sig_pos_in_chunk : sig_pos_in_chunk + self.IDR_RECORD_SIZE]
-            if len(record_data) < self.IDR_RECORD_SIZE: break
-
-            try:
-                # Using the newly refined structure from your hex analysis
-                rec_size = struct.unpack('<I', record_data[4:8])[0]
-                if rec_size != 56: # Sanity check
-                    logging.warning(f"  Record at {hex(record_addr)} has unexpected size {rec_size}. Skipping rest of table.")
-                    break
-                
-                frame_index = struct.unpack('<I', record_data[12:16])[0]
-                channel = struct.unpack('<B', record_data[16:17])[0]
-                timestamp = struct.unpack('<I', record_data[24:28])[0]
-
-                record = {
-                    "address": record_addr, "frame_index": frame_index, "channel": channel,
-                    "timestamp_unix": timestamp, "timestamp_readable": self._format_timestamp(timestamp)
-                }
-                idr_records.insert(0, record)
-            except (struct.error, IndexError) as e:
-                logging.warning(f"  Could not parse record at {hex(record_addr)}. Error: {e}")
-                break 
-
-            sig_pos_in_chunk = data_chunk.rfind(self.IDR_SIGNATURE, 0, sig_pos_in_chunk)
-
-        logging.info(f"  Successfully parsed {len(idr_records)} IDR records for this block.")
-        return idr_records
+        if read_start_addr < block_start_addr:
+            read_start_addr = block_start_addr
+            search_buffer_size = block_end_addr - read_start_addr
+
+        if search_buffer_size <= 0:
+            logger.warning(f"  Invalid block size for block at {hex(block_start_addr)}. Skipping.")
+            return None
+        return read_start_addr, search_buffer_size
 
     def _format_timestamp(self, ts):
         if ts == 0 or ts >= 0x7FFFFFFF: return "Invalid/Not Set"
         try: return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S UTC')
-        except (OSError, ValueError): return f"Invalid Timestamp ({ts})"
\ No newline at end of file
+        except (OSError, ValueError): return f"Invalid Timestamp ({ts})"
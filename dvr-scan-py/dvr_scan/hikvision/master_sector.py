@@ -7,6 +7,8 @@ import json
 
 from dvr_scan.hikvision.helpers import format_timestamp, format_bytes, log_and_format
 
+logger = logging.getLogger("dvr_scan")
+
 class MasterSectorParser:
     FILESYSTEM_SIGNATURE = b'HIKVISION@HANGZHOU'
 
@@ -15,7 +17,7 @@ class MasterSectorParser:
         self.analysis_results = {}
         self.extra_offset = 0
 
-    def run_parser(self, output_filename):
+    def run_parser(self, output_filename, case_store=None):
         self.analysis_results['image_info'] = {
             'filename': os.path.basename(self.reader.image_path),
             'full_path': self.reader.image_path,
@@ -25,22 +27,24 @@ class MasterSectorParser:
             return None
         if not self._save_results_to_json(output_filename):
             return None
+        if case_store is not None:
+            case_store.store_master(self.analysis_results)
         return self.extra_offset
 
     def _find_and_parse_master_sector(self):
-        logging.info("\n--- Locating and Parsing the Master Sector ---")
+        logger.info("\n--- Locating and Parsing the Master Sector ---")
         SEARCH_START_OFFSET = 0x200
         search_block = self.reader.read(SEARCH_START_OFFSET, 4096)
         try:
             sig_index_in_block = search_block.index(self.FILESYSTEM_SIGNATURE)
         except ValueError:
-            logging.error(f"FATAL: Could not find '{self.FILESYSTEM_SIGNATURE.decode()}' signature.")
+            logger.error(f"FATAL: Could not find '{self.FILESYSTEM_SIGNATURE.decode()}' signature.")
             return False
         
         absolute_sig_start_addr = SEARCH_START_OFFSET + sig_index_in_block
         self.analysis_results['master_sector'] = {}
         self.extra_offset = absolute_sig_start_addr - SEARCH_START_OFFSET
-        logging.info(f"Calculated an extra offset of {self.extra_offset} bytes ({hex(self.extra_offset)})")
+        logger.info(f"Calculated an extra offset of {self.extra_offset} bytes ({hex(self.extra_offset)})")
         self.analysis_results['master_sector']['extra_offset'] = self.extra_offset
         self.analysis_results['master_sector']['signature_address'] = absolute_sig_start_addr
 
@@ -124,18 +128,18 @@ class MasterSectorParser:
                 "address_hex": hex(addr), "raw_bytes": format_bytes(raw)
             }
         except (struct.error, IndexError) as e:
-            logging.error(f"FATAL: Failed to parse master sector data. Error: {e}")
+            logger.error(f"FATAL: Failed to parse master sector data. Error: {e}")
             return False
         return True
 
     def _save_results_to_json(self, filename):
-        logging.info(f"\n--- Saving results to {filename} ---")
+        logger.info(f"\n--- Saving results to {filename} ---")
         try:
             os.makedirs(os.path.dirname(filename), exist_ok=True)
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(self.analysis_results, f, indent=4)
-            logging.info(f"Successfully wrote analysis data to {filename}")
+            logger.info(f"Successfully wrote analysis data to {filename}")
             return True
         except (IOError, TypeError) as e:
-            logging.error(f"Failed to write to JSON file. Error: {e}")
+            logger.error(f"Failed to write to JSON file. Error: {e}")
             return False
\ No newline at end of file
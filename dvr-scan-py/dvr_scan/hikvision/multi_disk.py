@@ -0,0 +1,111 @@
+# dvr-scan-py/dvr_scan/hikvision/multi_disk.py
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dvr_scan.hikvision.analyze import AnalysisPipeline
+from dvr_scan.hikvision.catalogue import RecordingCatalogue
+from dvr_scan.hikvision.helpers import ImageReader
+
+logger = logging.getLogger("dvr_scan")
+
+
+def disk_output_dir(output_dir, disk, image_path):
+    """Returns the directory the results for one disk of a case are written to."""
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(output_dir, f"disk_{disk}_{name}")
+
+
+def process_disk(disk, image_path, disk_dir, include_previews=True, use_cache=True):
+    """
+    Analyses one disk of a case (master sector, HIKBTREE, logs) and catalogues its
+    recordings, run on a worker process. Returns a summary dict, with `success` False
+    (and the reason in `error`) if any stage failed.
+    """
+    start = time.time()
+    result = {"disk": disk, "image": image_path, "output_dir": disk_dir, "success": False}
+    reader = None
+    catalogue = None
+    try:
+        reader = ImageReader(image_path)
+        reader.open()
+        summary = AnalysisPipeline(reader, disk_dir, case_db=os.path.join(disk_dir, "case.db"),
+                                   include_previews=include_previews).run(use_cache=use_cache)
+        result.update(extra_offset=summary['extra_offset'], stages=summary['stages'], cached=summary['cached'])
+        if not summary['success']:
+            result['error'] = "Analysis failed."
+            return result
+
+        with open(summary['master_file'], 'r') as f:
+            data_block_size = json.load(f)['master_sector']['data_block_size']['value']
+        with open(summary['hikbtree_file'], 'r') as f:
+            hikbtree_data = json.load(f)
+        result['catalogue'] = os.path.join(disk_dir, "catalogue.db")
+        catalogue = RecordingCatalogue(result['catalogue'])
+        result.update(catalogue.build(reader, hikbtree_data, data_block_size, summary['extra_offset']))
+        result['success'] = True
+    except Exception as e:
+        logger.error(f"Failed to process disk {disk} ({image_path}): {e}", exc_info=True)
+        result['error'] = str(e)
+    finally:
+        if catalogue: catalogue.close()
+        if reader: reader.close()
+        result['elapsed_seconds'] = round(time.time() - start, 3)
+    return result
+
+
+class CaseProcessor:
+    """
+    Processes every disk image of a multi-disk case in parallel worker processes (one
+    disk per worker), then merges the per-disk catalogues into a single case catalogue,
+    so `locate` and `timeline` see each channel's recordings across all of the disks.
+    """
+
+    CATALOGUE_FILE = "case_catalogue.db"
+
+    def __init__(self, image_paths, output_dir, workers=None, include_previews=True, on_disk=None):
+        self.image_paths = list(image_paths)
+        self.output_dir = output_dir
+        # Disks are mostly waiting on I/O, so by default every disk gets its own worker.
+        self.workers = workers or len(self.image_paths)
+        self.include_previews = include_previews
+        # Called with the summary of each disk as it finishes.
+        self.on_disk = on_disk
+
+    def run(self, use_cache=True):
+        """Processes all disks and builds the case catalogue. Returns a summary dict."""
+        start = time.time()
+        os.makedirs(self.output_dir, exist_ok=True)
+        logger.info(f"Processing {len(self.image_paths)} disk(s) using {self.workers} worker(s)...")
+        results = [None] * len(self.image_paths)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(process_disk, disk, image_path, disk_output_dir(self.output_dir, disk, image_path),
+                                self.include_previews, use_cache): disk
+                for disk, image_path in enumerate(self.image_paths)
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if self.on_disk is not None:
+                    self.on_disk(result)
+
+        catalogue_file = os.path.join(self.output_dir, self.CATALOGUE_FILE)
+        counts = {}
+        if all(result['success'] for result in results):
+            catalogue = RecordingCatalogue(catalogue_file)
+            try:
+                counts = catalogue.merge([result['catalogue'] for result in results])
+            finally:
+                catalogue.close()
+        return {
+            "success": all(result['success'] for result in results),
+            "catalogue": catalogue_file if counts else None,
+            "elapsed_seconds": round(time.time() - start, 3),
+            "blocks": counts.get("blocks", 0),
+            "keyframes": counts.get("keyframes", 0),
+            "disks": results,
+        }
@@ -0,0 +1,166 @@
+# dvr-scan-py/dvr_scan/hikvision/remux.py
+
+import logging
+import os
+from fractions import Fraction
+
+logger = logging.getLogger("dvr_scan")
+
+# Carved video has no timestamps of its own, all PTS/DTS are generated in this time base.
+TIME_BASE = Fraction(1, 90000)
+DEFAULT_FRAMERATE = 25
+# A GOP whose IDR timestamps imply frames this many times longer than nominal spans a gap
+# in the recording, so its frames are spaced at the nominal rate instead.
+MAX_FRAME_STRETCH = 4
+CONTAINER_FORMATS = {".mp4": "mp4", ".mkv": "matroska"}
+CONTAINER_OPTIONS = {
+    # Put the moov atom (and with it the keyframe/sample index) at the front of the file.
+    "mp4": {"movflags": "+faststart"},
+    "matroska": {},
+}
+
+
+def remux_h264(stream, output_filename, keyframe_times=(), framerate=None):
+    """
+    Copies the raw H.264 (Annex B) video in the file-like `stream` into an MP4 or MKV
+    container (chosen by the extension of `output_filename`) without re-encoding.
+
+    `keyframe_times` is a sorted list of (stream_offset, unix_timestamp) pairs from the IDR
+    table. Each GOP starts at the time of the last IDR record at or before its keyframe,
+    and its frames are spaced evenly until the next one. Without IDR records, frames are
+    spaced at `framerate` (or the rate reported by the stream).
+
+    Returns a summary dict of the frames written.
+    """
+    import av
+
+    container_format = CONTAINER_FORMATS.get(os.path.splitext(output_filename)[1].lower())
+    if container_format is None:
+        raise ValueError(f"Unsupported container for '{output_filename}', expected one of: "
+                         f"{', '.join(CONTAINER_FORMATS)}")
+
+    with av.open(stream, format="h264") as input_container:
+        in_stream = input_container.streams.video[0]
+        framerate = framerate or in_stream.average_rate or DEFAULT_FRAMERATE
+        frame_duration = int(round(1 / (float(framerate) * TIME_BASE)))
+        # Streams with B-frames are decoded (not re-encoded) to find each frame's display
+        # position. Most DVR streams don't use them, and are copied without decoding.
+        decoder = None
+        if in_stream.codec_context.has_b_frames:
+            decoder = av.CodecContext.create("h264", "r")
+            decoder.extradata = in_stream.codec_context.extradata
+            decoder.options = {"skip_loop_filter": "all", "skip_idct": "all"}
+
+        with av.open(output_filename, "w", format=container_format,
+                     options=CONTAINER_OPTIONS[container_format]) as output_container:
+            out_stream = output_container.add_stream_from_template(in_stream)
+            out_stream.time_base = TIME_BASE
+            muxer = _GopMuxer(output_container, out_stream, decoder, frame_duration, keyframe_times)
+            for packet in input_container.demux(in_stream):
+                if packet.size == 0:
+                    continue
+                muxer.add(packet)
+            muxer.finish()
+
+    logger.info(f"Remuxed {muxer.frames} frames ({muxer.keyframes} keyframes) to '{output_filename}'.")
+    return {
+        "frames": muxer.frames,
+        "keyframes": muxer.keyframes,
+        "duration_seconds": round(float(muxer.end_time * TIME_BASE), 3),
+        "reordered": decoder is not None,
+    }
+
+
+class _GopMuxer:
+    """
+    Buffers one GOP at a time, so the spacing of its frames can be derived from the IDR
+    timestamps at either end of it, then timestamps and muxes its packets in decode order.
+    """
+
+    def __init__(self, output_container, out_stream, decoder, frame_duration, keyframe_times):
+        self.output = output_container
+        self.out_stream = out_stream
+        self.decoder = decoder
+        self.frame_duration = frame_duration
+        self.keyframe_times = list(keyframe_times)
+        self._next_record = 0
+        self._first_timestamp = None
+        self._gop = []
+        self._gop_time = None
+        # Reordered streams need DTS to run ahead of PTS by the reorder depth.
+        self._delay = 2 * frame_duration if decoder is not None else 0
+        self.frames = 0
+        self.keyframes = 0
+        self.end_time = 0
+
+    def add(self, packet):
+        if packet.is_keyframe:
+            keyframe_time = self._keyframe_time(packet.pos)
+            if self._gop:
+                self._flush_gop(keyframe_time)
+            self._gop_time = keyframe_time
+            self.keyframes += 1
+        self._gop.append(packet)
+
+    def finish(self):
+        if self._gop:
+            self._flush_gop(None)
+
+    def _keyframe_time(self, pos):
+        """Returns the time of the IDR record for the keyframe at `pos`, or None."""
+        record = None
+        while (self._next_record < len(self.keyframe_times)
+               and self.keyframe_times[self._next_record][0] <= pos):
+            record = self.keyframe_times[self._next_record]
+            self._next_record += 1
+        if record is None:
+            return None
+        if self._first_timestamp is None:
+            self._first_timestamp = record[1]
+        return int((record[1] - self._first_timestamp) / TIME_BASE)
+
+    def _flush_gop(self, next_gop_time):
+        count = len(self._gop)
+        # GOPs always start after the end of the previous one, even if the IDR timestamps
+        # (which only have one second resolution) say otherwise.
+        start = self.end_time if self._gop_time is None else max(self._gop_time, self.end_time)
+        spacing = self.frame_duration
+        if next_gop_time is not None and next_gop_time > start:
+            stretched = (next_gop_time - start) // count
+            if 0 < stretched <= MAX_FRAME_STRETCH * self.frame_duration:
+                spacing = stretched
+
+        display_order = self._display_order()
+        for index, packet in enumerate(self._gop):
+            packet.stream = self.out_stream
+            packet.time_base = TIME_BASE
+            packet.dts = start + index * spacing
+            # A frame can't be presented before it is decoded, should the stream reorder
+            # more deeply than we allow for.
+            packet.pts = max(start + display_order[index] * spacing + self._delay, packet.dts)
+            packet.duration = spacing
+            self.output.mux(packet)
+        self.frames += count
+        self.end_time = start + count * spacing
+        self._gop = []
+
+    def _display_order(self):
+        """Returns the display position within the GOP of each packet (in decode order)."""
+        count = len(self._gop)
+        if self.decoder is None:
+            return list(range(count))
+        decoded = []
+        for index, packet in enumerate(self._gop):
+            # Tag each packet with its decode index, frames come out in display order.
+            packet.pts = index
+            decoded += [frame.pts for frame in self.decoder.decode(packet)]
+        decoded += [frame.pts for frame in self.decoder.decode(None)]
+        self.decoder.flush_buffers()
+        display_order = list(range(count))
+        if sorted(decoded) == display_order:
+            for position, index in enumerate(decoded):
+                display_order[index] = position
+        else:
+            logger.warning(f"Could not determine the frame order of a GOP ({len(decoded)} of {count} "
+                           f"frames decoded), using decode order.")
+        return display_order
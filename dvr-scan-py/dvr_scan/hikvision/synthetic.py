@@ -0,0 +1,300 @@
+# dvr-scan-py/dvr_scan/hikvision/synthetic.py
+
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+
+from dvr_scan.hikvision.hikbtree import HikbtreeParser
+from dvr_scan.hikvision.idr_parser import IdrParser
+from dvr_scan.hikvision.master_sector import MasterSectorParser
+from dvr_scan.hikvision.system_logs import ALARM_LOG_TYPE, SystemLogParser
+
+logger = logging.getLogger("dvr_scan")
+
+H264_START_CODE = b'\x00\x00\x00\x01'
+# Entries start 80 bytes into a HIKBTREE page and are 48 bytes each.
+PAGE_ENTRIES_OFFSET = 80
+MAX_ENTRIES_PER_PAGE = (HikbtreeParser.PAGE_SIZE - PAGE_ENTRIES_OFFSET) // 48
+LOGS_OFFSET = 0x100000
+LOG_BODY_SIZE = 96
+# Log bodies for each type, laid out as the sub-parsers of `SystemLogParser` expect.
+LOG_BODIES = {
+    ALARM_LOG_TYPE: b'\x01\x00\x00\x00',
+    0x02: b'\x27' + bytes(67) + struct.pack('<I', 1),
+    0x03: b'\x02\x00\x00\x00admin\x00',
+    0x04: b'\xA1' + bytes(15) + b'ST4000VX007\x00' + bytes(4) + b'ZDH1A2B3C4\x00' + bytes(4) + b'CV11\x00',
+}
+LOG_TYPE_CYCLE = (ALARM_LOG_TYPE, 0x03, ALARM_LOG_TYPE, 0x04, ALARM_LOG_TYPE, 0x02, 0x03)
+
+
+def _align(value, alignment):
+    return value + -value % alignment
+
+
+def parse_size(value):
+    """Parses a size such as '4T', '512M' or '4096' into a number of bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = str(value).strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value, 0)
+
+
+class SyntheticImageBuilder:
+    """
+    Writes a sparse file laid out like a Hikvision disk: a master sector, a system log
+    region, a HIKBTREE (and its backup copy) and data blocks holding H.264 followed by
+    an IDR table at the end of the block. Only these structures are written, everything
+    else is left as a hole, so an image of several TB takes up a few hundred MB on disk.
+
+    Each HIKBTREE entry is a data block of one of `num_channels` channels, the channels
+    recording in parallel for `block_duration` seconds per block.
+    """
+
+    def __init__(self, num_pages=8, entries_per_page=64, num_channels=4, data_block_size=1 << 30,
+                 video_size=256 * 1024, keyframes_per_block=60, block_duration=600, num_logs=10000,
+                 extra_offset=0, disk_size=None, start_time=1700000000, video=None):
+        if not 0 < entries_per_page <= MAX_ENTRIES_PER_PAGE:
+            raise ValueError(f"entries_per_page must be between 1 and {MAX_ENTRIES_PER_PAGE}.")
+        self.num_pages = num_pages
+        self.entries_per_page = entries_per_page
+        self.num_channels = num_channels
+        self.data_block_size = data_block_size
+        self.block_duration = block_duration
+        self.num_logs = num_logs
+        self.extra_offset = extra_offset
+        self.disk_size = disk_size
+        self.start_time = start_time
+        # Real H.264 (Annex B) to store in every block, otherwise placeholder NAL units.
+        self.video, self.keyframe_offsets = (
+            self._parse_video(video) if video is not None else self._make_video(video_size, keyframes_per_block))
+        table_size = len(self.keyframe_offsets) * IdrParser.IDR_RECORD_SIZE
+        if len(self.video) + table_size > data_block_size:
+            raise ValueError("The video and IDR table of a block don't fit in data_block_size.")
+
+    @property
+    def num_blocks(self):
+        return self.num_pages * self.entries_per_page
+
+    def layout(self):
+        """Returns the logical offsets (without the extra offset) and sizes of each region."""
+        logs_size = self.num_logs * (len(SystemLogParser.SYSTEM_LOG_SIGNATURE) + 6 + LOG_BODY_SIZE)
+        hikbtree_size = self._hikbtree_layout(0)['size']
+        hikbtree1_offset = _align(LOGS_OFFSET + logs_size, 0x100000)
+        hikbtree2_offset = _align(hikbtree1_offset + hikbtree_size, 0x100000)
+        return {
+            "logs_offset": LOGS_OFFSET,
+            "logs_size": logs_size,
+            "hikbtree1_offset": hikbtree1_offset,
+            "hikbtree1_size": hikbtree_size,
+            "hikbtree2_offset": hikbtree2_offset,
+            "hikbtree2_size": hikbtree_size,
+            "video_data_offset": _align(hikbtree2_offset + hikbtree_size, min(self.data_block_size, 1 << 30)),
+        }
+
+    def write(self, path):
+        """Writes the image to `path`. Returns a dict describing its layout."""
+        start = time.time()
+        layout = self.layout()
+        video_data_offset = layout['video_data_offset']
+        logical_size = max(video_data_offset + self.num_blocks * self.data_block_size + self.extra_offset,
+                           self.disk_size or 0)
+
+        logger.info(f"Writing a synthetic image of {logical_size / 1024**4:.2f} TB ({self.num_blocks} data blocks) "
+                    f"to '{path}'...")
+        with open(path, 'wb') as f:
+            # Setting the size first leaves everything we don't write as a hole.
+            f.truncate(logical_size)
+
+            def write_at(addr, data):
+                f.seek(addr + self.extra_offset)
+                f.write(data)
+
+            write_at(0x200, self._make_master_sector(layout, logical_size - self.extra_offset))
+            write_at(LOGS_OFFSET, self._make_logs())
+            for base in (layout['hikbtree1_offset'], layout['hikbtree2_offset']):
+                for addr, data in self._make_hikbtree(base, video_data_offset).items():
+                    write_at(addr, data)
+            for block in range(self.num_blocks):
+                block_addr = video_data_offset + block * self.data_block_size
+                channel, block_start_time = self._block_info(block)
+                table = self._make_idr_table(channel, block_start_time)
+                write_at(block_addr, self.video)
+                write_at(block_addr + self.data_block_size - len(table), table)
+
+        stat = os.stat(path)
+        summary = {
+            "path": path,
+            "logical_size": logical_size,
+            # st_blocks isn't available on every platform.
+            "allocated_size": stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else None,
+            "extra_offset": self.extra_offset,
+            "data_block_size": self.data_block_size,
+            "blocks": self.num_blocks,
+            "pages": self.num_pages,
+            "channels": self.num_channels,
+            "logs": self.num_logs,
+            "keyframes_per_block": len(self.keyframe_offsets),
+            "start_time": self.start_time,
+            "end_time": self.start_time + self._blocks_per_channel() * self.block_duration,
+            "elapsed_seconds": round(time.time() - start, 3),
+            **layout,
+        }
+        logger.info(f"Wrote the synthetic image in {summary['elapsed_seconds']:.1f}s.")
+        return summary
+
+    def _blocks_per_channel(self):
+        return -(-self.num_blocks // self.num_channels)
+
+    def _block_info(self, block):
+        """Returns the channel and start time of data block number `block`."""
+        return 1 + block % self.num_channels, self.start_time + (block // self.num_channels) * self.block_duration
+
+    def _make_master_sector(self, layout, disk_capacity):
+        sector = bytearray(512)
+        sig_len = len(MasterSectorParser.FILESYSTEM_SIGNATURE)
+        sector[0:sig_len] = MasterSectorParser.FILESYSTEM_SIGNATURE
+        struct.pack_into('<Q', sector, sig_len + 38, disk_capacity)
+        struct.pack_into('<QQ', sector, sig_len + 62, layout['logs_offset'], layout['logs_size'])
+        struct.pack_into('<Q', sector, sig_len + 86, layout['video_data_offset'])
+        struct.pack_into('<QI', sector, sig_len + 102, self.data_block_size, self.num_blocks)
+        struct.pack_into('<QI', sector, sig_len + 118, layout['hikbtree1_offset'], layout['hikbtree1_size'])
+        struct.pack_into('<QI', sector, sig_len + 134, layout['hikbtree2_offset'], layout['hikbtree2_size'])
+        struct.pack_into('<I', sector, sig_len + 210, self.start_time)
+        return bytes(sector)
+
+    def _make_logs(self):
+        """Builds the log region, with entries spread evenly over the recording time."""
+        span = self._blocks_per_channel() * self.block_duration
+        entries = []
+        for i in range(self.num_logs):
+            log_type = LOG_TYPE_CYCLE[i % len(LOG_TYPE_CYCLE)]
+            timestamp = self.start_time + (i * span) // max(1, self.num_logs)
+            entries.append(SystemLogParser.SYSTEM_LOG_SIGNATURE + struct.pack('<IH', timestamp, log_type)
+                           + LOG_BODIES[log_type].ljust(LOG_BODY_SIZE, b'\x00'))
+        return b''.join(entries)
+
+    def _hikbtree_layout(self, base):
+        page_list_addr = base + 0x1000
+        pages_addr = _align(page_list_addr + HikbtreeParser.PAGE_LIST_HEADER_SIZE
+                            + HikbtreeParser.PAGE_LIST_ENTRY_SIZE * self.num_pages, 0x1000)
+        footer_addr = pages_addr + HikbtreeParser.PAGE_SIZE * self.num_pages
+        return {"page_list": page_list_addr, "pages": pages_addr, "footer": footer_addr,
+                "size": footer_addr + 16 - base}
+
+    def _make_hikbtree(self, base, video_data_offset):
+        """Builds a HIKBTREE at `base`, returning a map of address to bytes to write."""
+        layout = self._hikbtree_layout(base)
+        pages_addr = layout['pages']
+        header = bytearray(256)
+        header[0:8] = HikbtreeParser.HIKBTREE_SIGNATURE
+        struct.pack_into('<IQ', header, 44, self.start_time, layout['footer'])
+        struct.pack_into('<QQ', header, 64, layout['page_list'], pages_addr)
+        page_list = bytearray(HikbtreeParser.PAGE_LIST_HEADER_SIZE + HikbtreeParser.PAGE_LIST_ENTRY_SIZE * self.num_pages)
+        struct.pack_into('<I', page_list, 0, self.num_pages)
+        writes = {base: bytes(header)}
+        for page in range(self.num_pages):
+            page_addr = pages_addr + HikbtreeParser.PAGE_SIZE * page
+            content = bytearray(HikbtreeParser.PAGE_SIZE)
+            next_page = 0xFFFFFFFFFFFFFFFF if page == self.num_pages - 1 else page_addr + HikbtreeParser.PAGE_SIZE
+            struct.pack_into('<Q', content, 16, next_page)
+            for i in range(self.entries_per_page):
+                block = page * self.entries_per_page + i
+                channel, block_start_time = self._block_info(block)
+                entry = bytearray(48)
+                # All FF marks a used entry, the zero existence bytes that follow mean it has video.
+                entry[0:8] = b'\xff' * 8
+                struct.pack_into('<B', entry, 17, channel)
+                struct.pack_into('<II', entry, 24, block_start_time, block_start_time + self.block_duration - 1)
+                struct.pack_into('<Q', entry, 32, video_data_offset + block * self.data_block_size)
+                offset = PAGE_ENTRIES_OFFSET + 48 * i
+                content[offset:offset + 48] = entry
+                if i == 0:
+                    # The page list repeats the first entry of each page.
+                    list_entry = bytearray(entry)
+                    struct.pack_into('<Q', list_entry, 0, page_addr)
+                    offset = HikbtreeParser.PAGE_LIST_HEADER_SIZE + HikbtreeParser.PAGE_LIST_ENTRY_SIZE * page
+                    page_list[offset:offset + 48] = list_entry
+            writes[page_addr] = bytes(content)
+        writes[layout['page_list']] = bytes(page_list)
+        writes[layout['footer']] = b'\xff' * 8 + struct.pack('<Q', pages_addr + HikbtreeParser.PAGE_SIZE * (self.num_pages - 1))
+        return writes
+
+    def _make_idr_table(self, channel, block_start_time):
+        """Builds the IDR table of a block, its keyframes spread evenly over `block_duration`."""
+        count = len(self.keyframe_offsets)
+        records = []
+        for i, offset in enumerate(self.keyframe_offsets):
+            record = bytearray(IdrParser.IDR_RECORD_SIZE)
+            record[0:4] = IdrParser.IDR_SIGNATURE
+            struct.pack_into('<I', record, 4, IdrParser.IDR_RECORD_SIZE)
+            struct.pack_into('<I', record, 12, offset)
+            struct.pack_into('<B', record, 16, channel)
+            struct.pack_into('<I', record, 24, block_start_time + (i * self.block_duration) // count)
+            records.append(bytes(record))
+        return b''.join(records)
+
+    @staticmethod
+    def _make_video(video_size, keyframes_per_block):
+        """Builds placeholder H.264: GOPs of an SPS, PPS and IDR slice followed by P slices."""
+        gop_size = max(64, video_size // max(1, keyframes_per_block))
+        gop = bytearray()
+        gop += H264_START_CODE + b'\x67\x64\x00\x28' + b'\xac' * 12
+        gop += H264_START_CODE + b'\x68\xee\x3c\x80'
+        gop += H264_START_CODE + b'\x65\x88\x84' + b'\x5a' * 1024
+        while len(gop) < gop_size:
+            gop += H264_START_CODE + b'\x41\x9a' + b'\x3c' * 1020
+        gop = bytes(gop[:gop_size])
+        return gop * keyframes_per_block, [i * gop_size for i in range(keyframes_per_block)]
+
+    @staticmethod
+    def _parse_video(video):
+        """Uses real H.264 as the payload of every block, with a keyframe at every SPS."""
+        offsets = []
+        pos = video.find(H264_START_CODE + b'\x67')
+        while pos != -1:
+            offsets.append(pos)
+            pos = video.find(H264_START_CODE + b'\x67', pos + 1)
+        if not offsets:
+            raise ValueError("The video doesn't contain any keyframes (SPS NAL units).")
+        return video, offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a sparse synthetic Hikvision disk image for testing and benchmarks.")
+    parser.add_argument("-o", "--output-file", required=True, help="Path to write the image to.")
+    parser.add_argument("--pages", type=int, default=8, help="Number of HIKBTREE pages (default: 8).")
+    parser.add_argument("--entries-per-page", type=int, default=64, help=f"Data blocks listed per page, at most {MAX_ENTRIES_PER_PAGE} (default: 64).")
+    parser.add_argument("--channels", type=int, default=4, help="Number of channels recording in parallel (default: 4).")
+    parser.add_argument("--block-size", type=parse_size, default=1 << 30, help="Size of each data block, e.g. '1G' (default: 1G).")
+    parser.add_argument("--video-size", type=parse_size, default=256 * 1024, help="Bytes of placeholder H.264 written to each block (default: 256K).")
+    parser.add_argument("--video", help="Store this raw H.264 (Annex B) file in every block instead of placeholder NAL units.")
+    parser.add_argument("--keyframes-per-block", type=int, default=60, help="IDR records per block for placeholder video (default: 60).")
+    parser.add_argument("--block-duration", type=int, default=600, help="Seconds of recording in each block (default: 600).")
+    parser.add_argument("--logs", type=int, default=10000, help="Number of system log entries (default: 10000).")
+    parser.add_argument("--extra-offset", type=int, default=0, help="Bytes to shift the whole layout by, as seen on some disks (default: 0).")
+    parser.add_argument("--disk-size", type=parse_size, help="Logical size of the image, e.g. '4T' (default: just large enough for the data blocks).")
+    args = parser.parse_args()
+
+    try:
+        video = None
+        if args.video:
+            with open(args.video, 'rb') as f:
+                video = f.read()
+        builder = SyntheticImageBuilder(
+            num_pages=args.pages, entries_per_page=args.entries_per_page, num_channels=args.channels,
+            data_block_size=args.block_size, video_size=args.video_size, keyframes_per_block=args.keyframes_per_block,
+            block_duration=args.block_duration, num_logs=args.logs, extra_offset=args.extra_offset,
+            disk_size=args.disk_size, video=video)
+        print(json.dumps({"type": "hik_synthetic_complete", **builder.write(args.output_file)}), flush=True)
+    except (OSError, ValueError) as e:
+        logger.critical(f"Failed to write the synthetic image: {e}", exc_info=True)
+        print(json.dumps({"type": "error", "message": str(e)}), flush=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import sys
 import logging
@@ -6,51 +8,12 @@ import os
 import json
 import re
 
-# --- (Standard setup: pyewf import, logging, and ImageReader class) ---
-try:
-    import pyewf
-    HAS_EWF = True
-except ImportError:
-    HAS_EWF = False
-
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
-
-class ImageReader:
-    # ... (no changes needed)
-    def __init__(self, image_path):
-        self.image_path = image_path
-        self.handle = None
-        self.is_ewf = False
-        self.image_size = 0
-
-    def open(self):
-        # ... (implementation is the same)
-        if not os.path.exists(self.image_path):
-            raise FileNotFoundError(f"Image file not found: {self.image_path}")
-
-        if self.image_path.lower().endswith(('.e01', '.ewf')):
-            if not HAS_EWF:
-                raise ImportError("pyewf is not installed but is required for E01 files. Please run: pip install pyewf")
-            self.handle = pyewf.handle()
-            self.handle.open(pyewf.glob(self.image_path))
-            self.is_ewf = True
-            self.image_size = self.handle.get_media_size()
-        else:
-            self.handle = open(self.image_path, 'rb')
-            self.is_ewf = False
-            self.handle.seek(0, 2)
-            self.image_size = self.handle.tell()
-        
-        logging.info(f"Image size is {self.image_size} bytes ({self.image_size / 1024**3:.2f} GB)")
-        return True
-
-    def close(self):
-        if self.handle: self.handle.close()
-
-    def read(self, offset, size):
-        if not self.handle: raise IOError("Image is not open.")
-        self.handle.seek(offset)
-        return self.handle.read(size)
+from dvr_scan.hikvision.helpers import ImageReader
+
+logger = logging.getLogger("dvr_scan")
+
+# Log type of motion detection (and other sensor) alarms.
+ALARM_LOG_TYPE = 0x01
 
 class SystemLogParser:
     """
@@ -59,21 +22,34 @@ class SystemLogParser:
     """
     
     SYSTEM_LOG_SIGNATURE = b'RATS\x14\x00\x00\x00'
+    SIGNATURE_PATTERN = re.compile(re.escape(SYSTEM_LOG_SIGNATURE))
+    # The log region is scanned in windows of this size, so memory use doesn't grow with it.
+    WINDOW_SIZE = 4 * 1024 * 1024
+    # Longest description kept for an entry. Real entries are a few hundred bytes, this
+    # only stops a missing signature from turning the rest of the region into one entry.
+    MAX_ENTRY_SIZE = 64 * 1024
+    # Regions larger than this have their entries decoded on a pool of worker processes.
+    PARALLEL_THRESHOLD = 32 * 1024 * 1024
+    DECODE_BATCH_SIZE = 2000
+    DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
     LOG_TYPES = {
-        0x01: "Alarm - Motion Detection or other sensor.",
+        ALARM_LOG_TYPE: "Alarm - Motion Detection or other sensor.",
         0x02: "Exception - An error or unusual event, like Video Loss.",
         0x03: "Operation - A user or system action, like Login or System Startup.",
         0x04: "Information - System status reports, like HDD info or Network Stats."
     }
 
-    def __init__(self, image_reader):
+    def __init__(self, image_reader, include_previews=True, progress=None):
         self.reader = image_reader
-        self.analysis_results = {"log_header_info": {}, "system_logs": []}
+        self.include_previews = include_previews
+        # ProgressReporter advanced as the log region is scanned and entries are decoded.
+        self.progress = progress
+        self.analysis_results = {"log_header_info": {}}
 
     # --- Smart Decoding Router ---
     def _decode_log_description(self, log_type_code, raw_bytes):
         """Main router that calls the correct specialized parser."""
-        if log_type_code == 0x01: return self._parse_alarm_log(raw_bytes)
+        if log_type_code == ALARM_LOG_TYPE: return self._parse_alarm_log(raw_bytes)
         if log_type_code == 0x02: return self._parse_exception_log(raw_bytes)
         if log_type_code == 0x03: return self._parse_operation_log(raw_bytes)
         if log_type_code == 0x04: return self._parse_information_log(raw_bytes)
@@ -150,102 +126,197 @@ class SystemLogParser:
         return [s.decode('ascii').strip() for s in found_strings if re.search(rb'[a-zA-Z0-9]', s)]
 
     # --- Main Workflow and Helper Functions ---
-    def run_parser(self, master_sector_file, output_filename, extra_offset=0):
+    def run_parser(self, master_sector_file, output_filename, extra_offset=0, case_store=None):
         try:
             with open(master_sector_file, 'r') as f:
                 master_data = json.load(f)
+        except FileNotFoundError as e:
+            logger.error(f"FATAL: Could not read required data from '{master_sector_file}'. Error: {e}")
+            return False
+        return self.parse(master_data, output_filename, extra_offset, case_store)
+
+    def parse(self, master_data, output_filename, extra_offset=0, case_store=None):
+        """
+        Same as `run_parser`, but takes the master sector results in memory (the contents
+        of master_sector.json, i.e. `MasterSectorParser.analysis_results`).
+        """
+        try:
             logs_offset = master_data['master_sector']['system_logs_offset']['value']
             logs_size = master_data['master_sector']['system_logs_size']['value']
-        except (FileNotFoundError, KeyError) as e:
-            logging.error(f"FATAL: Could not read required data from '{master_sector_file}'. Error: {e}")
+        except KeyError as e:
+            logger.error(f"FATAL: Could not read required data from the master sector. Error: {e}")
             return False
 
         if logs_size == 0:
-            logging.warning("Master sector indicates a log size of 0. Nothing to parse.")
-            return self._save_results_to_json(output_filename)
+            logger.warning("Master sector indicates a log size of 0. Nothing to parse.")
+            return self._save_results_to_json(output_filename, iter(()))
 
         actual_logs_offset = logs_offset + extra_offset
-        logging.info(f"\n--- Reading System Logs Block (with +{extra_offset} byte offset adjustment) ---")
-        logging.info(f"Reading {logs_size} bytes starting from adjusted offset {hex(actual_logs_offset)}")
-        logs_data_block = self.reader.read(actual_logs_offset, logs_size)
-        
-        self._parse_and_store_header(logs_data_block, actual_logs_offset)
-        
-        return self._save_results_to_json(output_filename)
-
-    def _parse_and_store_header(self, logs_data_block, base_offset):
-        first_sig_pos = logs_data_block.find(self.SYSTEM_LOG_SIGNATURE)
-        if first_sig_pos == -1:
-            logging.warning(f"No log signatures found in the data block.")
+        logger.info(f"\n--- Reading System Logs Block (with +{extra_offset} byte offset adjustment) ---")
+        logger.info(f"Scanning {logs_size} bytes starting from adjusted offset {hex(actual_logs_offset)}")
+
+        entries = self.iter_log_entries(actual_logs_offset, logs_size)
+        if case_store is not None:
+            entries = case_store.store_log_entries(entries)
+        return self._save_results_to_json(output_filename, entries)
+
+    def iter_log_entries(self, base_offset, size):
+        """
+        Yields every decoded log entry in the region [base_offset, base_offset + size).
+        Large regions are decoded in batches on a process pool, keeping a bounded number
+        of batches in flight so entries are still yielded in order.
+        """
+        logger.info("\n--- Parsing Log Entries ---")
+        raw_entries = self._iter_raw_entries(base_offset, size)
+        log_count = 0
+        if self.progress is not None:
+            self.progress.begin(size, None, "entries")
+        if size < self.PARALLEL_THRESHOLD or self.DECODE_WORKERS < 2:
+            decoded = (self._decode_raw_entry(*raw_entry) for raw_entry in raw_entries)
+        else:
+            decoded = self._decode_parallel(raw_entries)
+        for log_entry in decoded:
+            log_count += 1
+            if self.progress is not None:
+                self.progress.advance(items=1)
+            yield {"entry_number": log_count, **log_entry}
+        if self.progress is not None:
+            self.progress.finish()
+        logger.info(f"Found and parsed {log_count} system log entries.")
+
+    def _iter_raw_entries(self, base_offset, size):
+        """
+        Scans the region for log signatures one window at a time, yielding the address,
+        timestamp, type and (capped) description bytes of each entry. An entry runs up to
+        the next signature, so the last entry of each window is completed from the next.
+        """
+        sig_len = len(self.SYSTEM_LOG_SIGNATURE)
+        region_end = base_offset + size
+        pending = None  # (address, entry bytes) of the entry awaiting the next signature
+        window_start = base_offset
+        while window_start < region_end:
+            window_size = min(self.WINDOW_SIZE, region_end - window_start)
+            # Read a little past the window so signatures straddling the boundary are found.
+            data = self.reader.read(window_start, min(window_size + sig_len - 1, region_end - window_start))
+            if not data:
+                break
+            view = memoryview(data)
+            for match in self.SIGNATURE_PATTERN.finditer(view):
+                if match.start() >= window_size:
+                    break
+                sig_addr = window_start + match.start()
+                if pending is not None:
+                    self._append_entry_data(pending, view, window_start, match.start())
+                    yield from self._finish_entry(pending)
+                elif sig_addr > base_offset:
+                    self._store_header(base_offset, sig_addr - base_offset)
+                pending = (sig_addr, bytearray())
+            if pending is not None:
+                self._append_entry_data(pending, view, window_start, window_size)
+            window_start += window_size
+            if self.progress is not None:
+                self.progress.advance(nbytes=window_size)
+
+        if pending is not None:
+            yield from self._finish_entry(pending)
+        else:
+            logger.warning("No log signatures found in the data block.")
+
+    def _append_entry_data(self, pending, view, window_start, end):
+        """Appends view[:end] to the pending entry, skipping its signature and capping its size."""
+        address, entry_data = pending
+        start = max(0, address + len(self.SYSTEM_LOG_SIGNATURE) - window_start)
+        room = self.MAX_ENTRY_SIZE + 6 - len(entry_data)
+        if start < end and room > 0:
+            entry_data += view[start:min(end, start + room)]
+
+    def _finish_entry(self, pending):
+        address, entry_data = pending
+        if len(entry_data) < 6:
             return
-            
-        if first_sig_pos > 0:
-            logging.info(f"Detected a data header of {first_sig_pos} bytes before the first log entry.")
-            header_data = logs_data_block[:first_sig_pos]
-            self.analysis_results["log_header_info"] = {
-                "start_address": base_offset, "start_address_hex": hex(base_offset),
-                "size_bytes": first_sig_pos, "raw_hex_preview": self._format_bytes(header_data[:128])
-            }
-        
-        actual_logs_data = logs_data_block[first_sig_pos:]
-        logs_start_offset = base_offset + first_sig_pos
-        self._parse_log_entries(actual_logs_data, logs_start_offset)
-
-    def _parse_log_entries(self, logs_data, base_offset):
-        logging.info("\n--- Parsing Log Entries ---")
-        current_pos = 0; log_count = 0
-        while current_pos < len(logs_data):
-            sig_pos = logs_data.find(self.SYSTEM_LOG_SIGNATURE, current_pos)
-            if sig_pos == -1: break
-
-            next_sig_pos = logs_data.find(self.SYSTEM_LOG_SIGNATURE, sig_pos + 1)
-            entry_data_end = next_sig_pos if next_sig_pos != -1 else len(logs_data)
-            data_start = sig_pos + len(self.SYSTEM_LOG_SIGNATURE)
-            entry_data = logs_data[data_start:entry_data_end]
-
-            if len(entry_data) < 6:
-                current_pos = sig_pos + 1; continue
-            try:
-                timestamp = struct.unpack('<I', entry_data[0:4])[0]
-                log_type = struct.unpack('<H', entry_data[4:6])[0]
-                description_obj = self._decode_log_description(log_type, entry_data[6:])
-                log_entry = {
-                    "entry_number": log_count + 1, "address": base_offset + sig_pos,
-                    "address_hex": hex(base_offset + sig_pos), "timestamp_unix": timestamp,
-                    "timestamp_readable": self._format_timestamp(timestamp), "log_type_code": log_type,
-                    "log_type_name": self.LOG_TYPES.get(log_type, "Unknown"), "description": description_obj
-                }
-                self.analysis_results["system_logs"].append(log_entry)
-                log_count += 1
-            except struct.error:
-                logging.warning(f"Could not parse log entry at {hex(base_offset + sig_pos)}. Skipping.")
-            current_pos = sig_pos + 1
-        logging.info(f"Found and parsed {log_count} system log entries.")
-
-    def _save_results_to_json(self, filename):
-        logging.info(f"\n--- Saving results to {filename} ---")
+        timestamp, log_type = struct.unpack_from('<IH', entry_data)
+        yield address, timestamp, log_type, bytes(entry_data[6:])
+
+    def _store_header(self, base_offset, header_size):
+        logger.info(f"Detected a data header of {header_size} bytes before the first log entry.")
+        header_data = self.reader.read(base_offset, min(header_size, 128))
+        self.analysis_results["log_header_info"] = {
+            "start_address": base_offset, "start_address_hex": hex(base_offset),
+            "size_bytes": header_size, "raw_hex_preview": self._format_bytes(header_data)
+        }
+
+    def _decode_raw_entry(self, address, timestamp, log_type, raw_bytes):
+        return {
+            "address": address, "address_hex": hex(address), "timestamp_unix": timestamp,
+            "timestamp_readable": self._format_timestamp(timestamp), "log_type_code": log_type,
+            "log_type_name": self.LOG_TYPES.get(log_type, "Unknown"),
+            "description": self._decode_log_description(log_type, raw_bytes)
+        }
+
+    def _decode_parallel(self, raw_entries):
+        """Decodes entries in batches on worker processes, yielding them in order."""
+        logger.info(f"Decoding log entries on {self.DECODE_WORKERS} worker processes.")
+        with ProcessPoolExecutor(max_workers=self.DECODE_WORKERS) as executor:
+            pending = deque()
+            batch = []
+            for raw_entry in raw_entries:
+                batch.append(raw_entry)
+                if len(batch) >= self.DECODE_BATCH_SIZE:
+                    pending.append(executor.submit(_decode_batch, batch, self.include_previews))
+                    batch = []
+                    if len(pending) >= 2 * self.DECODE_WORKERS:
+                        yield from pending.popleft().result()
+            if batch:
+                pending.append(executor.submit(_decode_batch, batch, self.include_previews))
+            while pending:
+                yield from pending.popleft().result()
+
+    def _save_results_to_json(self, filename, log_entries):
+        """Writes the results incrementally, streaming each entry from `log_entries` as it is decoded."""
+        logger.info(f"\n--- Saving results to {filename} ---")
         self.analysis_results['image_info'] = {"filename": os.path.basename(self.reader.image_path)}
+        temp_filename = filename + '.tmp'
         try:
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.analysis_results, f, indent=4)
-            logging.info(f"Successfully wrote system log analysis to {filename}")
+            if os.path.dirname(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                f.write('{"system_logs": [')
+                for i, log_entry in enumerate(log_entries):
+                    f.write(('\n' if i == 0 else ',\n') + json.dumps(log_entry))
+                # The header is only known once the first signature has been found.
+                f.write('],\n"log_header_info": ' + json.dumps(self.analysis_results['log_header_info']))
+                f.write(',\n"image_info": ' + json.dumps(self.analysis_results['image_info']) + '}\n')
+            os.replace(temp_filename, filename)
+            logger.info(f"Successfully wrote system log analysis to {filename}")
             return True
         except (IOError, TypeError) as e:
-            logging.error(f"Failed to write to JSON file. Error: {e}")
+            logger.error(f"Failed to write to JSON file. Error: {e}")
             return False
 
     def _format_timestamp(self, ts):
         if ts == 0 or ts >= 0x7FFFFFFF: return "Invalid/Not Set"
         try: return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S UTC')
-        except (OSEError, ValueError): return f"Invalid Timestamp ({ts})"
+        except (OSError, ValueError): return f"Invalid Timestamp ({ts})"
     
     def _format_bytes(self, byte_string):
-        return ' '.join(f'{b:02X}' for b in byte_string)
+        # Previews are only generated when asked for, they dominate the output size otherwise.
+        if not self.include_previews: return None
+        return bytes(byte_string).hex(' ').upper()
+
+
+def alarm_timestamps(logs_data, log_type=ALARM_LOG_TYPE):
+    """Returns the sorted unix timestamps of the alarm entries in parsed logs (as saved to JSON)."""
+    return sorted(entry['timestamp_unix'] for entry in logs_data.get('system_logs', [])
+                  if entry.get('log_type_code') == log_type)
+
+def _decode_batch(raw_entries, include_previews):
+    """Decodes a batch of raw log entries, run on a worker process."""
+    parser = SystemLogParser(None, include_previews)
+    return [parser._decode_raw_entry(*raw_entry) for raw_entry in raw_entries]
 
 def main():
     config_filename = "config.json"
-    logging.info(f"Attempting to read settings from '{config_filename}'...")
+    logger.info(f"Attempting to read settings from '{config_filename}'...")
     try:
         with open(config_filename, 'r') as f:
             config = json.load(f)
@@ -254,9 +325,9 @@ def main():
         system_logs_file = config['output_files']['system_logs']
         extra_offset = config.get('extra_offset', 0)
         if extra_offset > 0:
-            logging.info(f"Applying a global extra offset of {extra_offset} bytes.")
+            logger.info(f"Applying a global extra offset of {extra_offset} bytes.")
     except (FileNotFoundError, KeyError) as e:
-        logging.critical(f"FATAL: Could not read required settings from '{config_filename}'. Error: {e}")
+        logger.critical(f"FATAL: Could not read required settings from '{config_filename}'. Error: {e}")
         sys.exit(1)
 
     reader = None
@@ -265,11 +336,11 @@ def main():
         if not reader.open(): sys.exit(1)
         parser = SystemLogParser(reader)
         if parser.run_parser(master_sector_file, system_logs_file, extra_offset):
-            logging.info("\nSystem log parsing completed.")
+            logger.info("\nSystem log parsing completed.")
         else:
-            logging.error("\nSystem log parsing failed.")
+            logger.error("\nSystem log parsing failed.")
     except (FileNotFoundError, ImportError, IOError) as e:
-        logging.critical(f"A critical error occurred: {e}")
+        logger.critical(f"A critical error occurred: {e}")
         sys.exit(1)
     finally:
         if reader: reader.close()
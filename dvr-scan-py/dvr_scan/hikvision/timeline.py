@@ -0,0 +1,162 @@
+# dvr-scan-py/dvr_scan/hikvision/timeline.py
+
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dvr_scan.hikvision.helpers import StreamHasher, format_timestamp
+
+logger = logging.getLogger("dvr_scan")
+
+H264_START_CODE = b'\x00\x00\x00\x01'
+# UUID identifying our gap markers (a user_data_unregistered SEI). It contains no zero
+# bytes, so the marker never needs emulation prevention bytes.
+GAP_MARKER_UUID = b'HIKGAPMARKER\x01\x02\x03\x04'
+
+
+def gap_marker(gap_start, gap_end):
+    """
+    Returns an H.264 SEI NAL unit recording a gap in the recording between two unix
+    timestamps. Decoders ignore it, so the stream stays playable, but the gap can be
+    found again by searching the stream for GAP_MARKER_UUID.
+    """
+    text = f"GAP {gap_start} {gap_end} {gap_end - gap_start}s".encode('ascii')
+    payload = GAP_MARKER_UUID + text
+    # NAL type 6 (SEI), payload type 5 (user data unregistered), then the RBSP stop bit.
+    return H264_START_CODE + b'\x06\x05' + bytes([len(payload)]) + payload + b'\x80'
+
+
+class TimelineBuilder:
+    """
+    Stitches the byte ranges recorded on one channel (as returned by
+    `RecordingCatalogue.locate`, in keyframe order) into a single continuous H.264
+    stream. Ranges are read in chunks on a thread pool a few chunks ahead of the writer,
+    while the output is written strictly in order, and a gap marker is inserted wherever
+    consecutive ranges are further apart in time than `gap_threshold` seconds.
+    """
+
+    CHUNK_SIZE = 8 * 1024 * 1024
+    WORKERS = 4
+
+    def __init__(self, image_reader, chunk_size=None, workers=None, gap_threshold=2, hash_algorithms=("sha256",),
+                 readers=None):
+        self.reader = image_reader
+        # Readers for the other images of a multi-disk case, keyed by the `image` of each range.
+        self.readers = readers or {}
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.workers = workers or self.WORKERS
+        self.gap_threshold = gap_threshold
+        self.hash_algorithms = hash_algorithms
+
+    def build(self, ranges, output_file):
+        """
+        Writes the ranges to `output_file`. Returns a summary dict listing where each
+        segment and gap ended up in the output, with digests of every source range and
+        of the output, computed as the data streams past.
+        """
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        total_bytes = sum(rng['end'] - rng['start'] for rng in ranges)
+        logger.info(f"Reconstructing {len(ranges)} segment(s), {total_bytes / 1024**2:.2f} MB of video...")
+        start = time.time()
+
+        segments, gaps = [], []
+        previous = None
+        output_hasher = StreamHasher(self.hash_algorithms)
+        try:
+            with open(output_file, 'wb') as f:
+                def write(data):
+                    f.write(data)
+                    output_hasher.update(data)
+
+                for index, data in self._read_chunks(ranges):
+                    rng = ranges[index]
+                    if not segments or segments[-1]['index'] != index:
+                        if segments:
+                            # The previous segment has been read, so stop its hashing thread now
+                            # rather than keeping one alive for every segment of the timeline.
+                            self._finish_hash(segments[-1])
+                        if previous is not None:
+                            gap = rng['start_time']['value'] - previous['end_time']['value']
+                            if gap > self.gap_threshold:
+                                gaps.append(self._gap_info(previous, rng, f.tell()))
+                                write(gap_marker(previous['end_time']['value'], rng['start_time']['value']))
+                        segments.append({"index": index, "output_offset": f.tell(), "found_start": False,
+                                         "hasher": StreamHasher(self.hash_algorithms)})
+                        previous = rng
+                    segment = segments[-1]
+                    segment['hasher'].update(data)
+                    if not segment['found_start']:
+                        # Drop anything preceding the first NAL unit, as `VideoExtractor` does.
+                        start_code_pos = data.find(H264_START_CODE)
+                        if start_code_pos == -1:
+                            continue
+                        data = data[start_code_pos:]
+                        segment['found_start'] = True
+                    write(data)
+                output_size = f.tell()
+        finally:
+            # Also stops the hashing threads if a read or write failed.
+            for segment in segments:
+                self._finish_hash(segment)
+            output_hashes = output_hasher.hexdigests()
+
+        elapsed = time.time() - start
+        logger.info(f"Wrote {output_size / 1024**2:.2f} MB to '{output_file}' in {elapsed:.1f}s "
+                    f"({len(gaps)} gap(s)).")
+        return {
+            "output_file": output_file,
+            "output_size": output_size,
+            "hashes": output_hashes,
+            "segments": [self._segment_info(ranges[segment['index']], segment) for segment in segments
+                         if segment['found_start']],
+            "gaps": gaps,
+        }
+
+    @staticmethod
+    def _finish_hash(segment):
+        if 'hasher' in segment:
+            segment['hashes'] = segment.pop('hasher').hexdigests()
+
+    def _read_chunks(self, ranges):
+        """Yields (range_index, data) for every chunk of every range, in order."""
+        chunks = ((index, self.readers.get(rng.get('image'), self.reader), addr, min(self.chunk_size, rng['end'] - addr))
+                  for index, rng in enumerate(ranges)
+                  for addr in range(rng['start'], rng['end'], self.chunk_size))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for index, reader, addr, size in chunks:
+                pending.append((index, executor.submit(reader.read, addr, size)))
+                # Bound the read-ahead so memory use doesn't depend on the size of the timeline.
+                if len(pending) >= 2 * self.workers:
+                    index, future = pending.popleft()
+                    yield index, future.result()
+            while pending:
+                index, future = pending.popleft()
+                yield index, future.result()
+
+    @staticmethod
+    def _segment_info(rng, segment):
+        return {
+            "disk": rng.get('disk', 0),
+            "block_offset": rng['block_offset'],
+            "start": rng['start'],
+            "end": rng['end'],
+            "output_offset": segment['output_offset'],
+            "start_time": rng['start_time'],
+            "end_time": rng['end_time'],
+            "hashes": segment['hashes'],
+        }
+
+    @staticmethod
+    def _gap_info(previous, rng, output_offset):
+        gap_start, gap_end = previous['end_time']['value'], rng['start_time']['value']
+        return {
+            "output_offset": output_offset,
+            "start_time": {"value": gap_start, "readable": format_timestamp(gap_start)},
+            "end_time": {"value": gap_end, "readable": format_timestamp(gap_end)},
+            "duration_seconds": gap_end - gap_start,
+        }
@@ -4,6 +4,8 @@ import struct
 from datetime import datetime
 import logging
 
+logger = logging.getLogger("dvr_scan")
+
 class IdrParser:
     """
     A helper class that provides logic for finding and parsing the IDR metadata
@@ -32,21 +34,21 @@ class IdrParser:
             search_buffer_size = block_end_addr - read_start_addr
 
         if search_buffer_size <= 0:
-            logging.warning(f"  Invalid block size for block at {hex(block_start_addr)}. Skipping.")
+            logger.warning(f"  Invalid block size for block at {hex(block_start_addr)}. Skipping.")
             return None
 
-        logging.info(f"  Reading {search_buffer_size / 1024:.0f} KB from the end of the data block to find IDR table...")
+        logger.info(f"  Reading {search_buffer_size / 1024:.0f} KB from the end of the data block to find IDR table...")
 
         try:
             data_chunk = self.reader.read(read_start_addr, search_buffer_size)
         except Exception as e:
-            logging.error(f"  Could not read data from offset {hex(read_start_addr)}. Error: {e}")
+            logger.error(f"  Could not read data from offset {hex(read_start_addr)}. Error: {e}")
             return None
 
         sig_pos_in_chunk = data_chunk.rfind(self.IDR_SIGNATURE)
 
         if sig_pos_in_chunk == -1:
-            logging.warning("  No IDR ('OFNI') signature found at the end of this data block.")
+            logger.warning("  No IDR ('OFNI') signature found at the end of this data block.")
             return None
 
         idr_records = []
@@ -59,7 +61,7 @@ class IdrParser:
                 # Using the newly refined structure from your hex analysis
                 rec_size = struct.unpack('<I', record_data[4:8])[0]
                 if rec_size != 56: # Sanity check
-                    logging.warning(f"  Record at {hex(record_addr)} has unexpected size {rec_size}. Skipping rest of table.")
+                    logger.warning(f"  Record at {hex(record_addr)} has unexpected size {rec_size}. Skipping rest of table.")
                     break
                 
                 frame_index = struct.unpack('<I', record_data[12:16])[0]
@@ -72,12 +74,12 @@ class IdrParser:
                 }
                 idr_records.insert(0, record)
             except (struct.error, IndexError) as e:
-                logging.warning(f"  Could not parse record at {hex(record_addr)}. Error: {e}")
+                logger.warning(f"  Could not parse record at {hex(record_addr)}. Error: {e}")
                 break 
 
             sig_pos_in_chunk = data_chunk.rfind(self.IDR_SIGNATURE, 0, sig_pos_in_chunk)
 
-        logging.info(f"  Successfully parsed {len(idr_records)} IDR records for this block.")
+        logger.info(f"  Successfully parsed {len(idr_records)} IDR records for this block.")
         return idr_records
 
     def _format_timestamp(self, ts):
@@ -110,12 +110,13 @@ def _init_logger_impl(
     format_str: str,
     show_stdout: bool,
     log_file: ty.Optional[str],
+    use_stderr: bool = False,
 ):
     logger.handlers = []
     logger.setLevel(logging.DEBUG)
-    # Add stdout handler if required.
+    # Add stdout (or stderr) handler if required.
     if show_stdout:
-        handler = logging.StreamHandler(stream=sys.stdout)
+        handler = logging.StreamHandler(stream=sys.stderr if use_stderr else sys.stdout)
         handler.setLevel(log_level)
         handler.setFormatter(logging.Formatter(fmt=format_str))
         logger.addHandler(handler)
@@ -137,6 +138,7 @@ def init_logger(
     log_level: int = logging.INFO,
     show_stdout: bool = False,
     log_file: ty.Optional[str] = None,
+    use_stderr: bool = False,
 ) -> logging.Logger:
     """Initializes logging for DVR-Scan. The logger instance used is named 'dvr_scan'.
     By default the logger has no handlers to suppress output.
@@ -148,6 +150,8 @@ def init_logger(
             logging.WARNING, logging.ERROR, logging.CRITICAL].
         show_stdout: If True, add handler to show log messages on stdout (default: False).
         log_file: If set, add handler to dump log messages to given file path.
+        use_stderr: If True, messages enabled by show_stdout are written to stderr instead, leaving
+            stdout free for machine-readable output (default: False).
         log_handlers: Additional log handlers to attach.
     """
     # Format of log messages depends on verbosity.
@@ -158,6 +162,7 @@ def init_logger(
         format_str,
         show_stdout,
         log_file,
+        use_stderr,
     )
     _init_logger_impl(
         logging.getLogger("pyscenedetect"),
@@ -165,6 +170,7 @@ def init_logger(
         format_str,
         show_stdout,
         log_file,
+        use_stderr,
     )
     return logging.getLogger("dvr_scan")
 
@@ -0,0 +1,132 @@
+#
+#      DVR-Scan: Video Motion Event Detection & Extraction Tool
+#   --------------------------------------------------------------
+#       [  Site: https://www.dvr-scan.com/                 ]
+#       [  Repo: https://github.com/Breakthrough/DVR-Scan  ]
+#
+# Copyright (C) 2016 Brandon Castellano <http://www.bcastell.com>.
+# DVR-Scan is licensed under the BSD 2-Clause License; see the included
+# LICENSE file, or visit one of the above pages for details.
+#
+"""``dvr_scan.prescreen`` Module
+
+Finds where a video may have motion from the sizes of its compressed frames, without decoding
+any of them. Predicted frames only encode what changed since the frames they refer to, so in
+footage from a fixed camera they grow when something moves. The windows found are then scanned
+with `MotionScanner.set_scan_windows`, which verifies them.
+"""
+
+import logging
+import typing as ty
+
+import numpy as np
+
+from dvr_scan.video_joiner import InputVideo, StreamInput
+
+logger = logging.getLogger("dvr_scan")
+
+DEFAULT_THRESHOLD: float = 0.005
+"""Activity (see `frame_activity`) above which frames are scanned."""
+
+SMOOTHING_SECONDS: float = 1.0
+"""Length of the moving average applied to frame sizes. Evens out differences between types of
+predicted frames (e.g. P and B frames) and the bursts some encoders produce."""
+
+BASELINE_SECONDS: float = 300.0
+"""Length of the blocks the baseline (quiet) frame size is found in, so slow changes like lighting
+or weather over a recording aren't mistaken for motion."""
+
+BASELINE_PERCENTILE: float = 25.0
+"""Percentile of smoothed frame sizes in each block taken as the baseline."""
+
+
+def packet_sizes(path: InputVideo) -> ty.Tuple[float, np.ndarray, np.ndarray, np.ndarray]:
+    """Demuxes the first video stream of `path` without decoding it. Returns the frame rate, and
+    the number, size in bytes, and whether it is a keyframe of each frame in presentation order.
+    Carved streams have no timestamps, so their frames are taken to be in order already."""
+    import av
+
+    stream = path.open() if isinstance(path, StreamInput) else None
+    try:
+        container = av.open(stream, format="h264") if stream is not None else av.open(str(path))
+        with container:
+            video = container.streams.video[0]
+            framerate = float(video.average_rate or video.guessed_rate or 0)
+            if not framerate:
+                raise ValueError(f"Frame rate of {path} is unknown.")
+            start = video.start_time or 0
+            frames = []
+            for packet in container.demux(video):
+                if packet.size == 0:
+                    continue
+                if packet.pts is None or stream is not None:
+                    frame_num = len(frames)
+                else:
+                    frame_num = round(float((packet.pts - start) * video.time_base) * framerate)
+                frames.append((frame_num, packet.size, packet.is_keyframe))
+    finally:
+        if stream is not None:
+            stream.close()
+    frames.sort()
+    return (
+        framerate,
+        np.array([frame_num for frame_num, _, _ in frames], dtype=np.int64),
+        np.array([size for _, size, _ in frames], dtype=np.float64),
+        np.array([keyframe for _, _, keyframe in frames], dtype=bool),
+    )
+
+
+def frame_activity(sizes: np.ndarray, keyframes: np.ndarray, framerate: float) -> np.ndarray:
+    """Estimates how much of each frame changed: the smoothed size of predicted frames above the
+    baseline, as a fraction of the typical keyframe size (which encodes a whole frame). Keyframes
+    take the size of the predicted frames around them."""
+    if keyframes.all():
+        return np.zeros(len(sizes))
+    keyframe_size = float(np.median(sizes[keyframes])) if keyframes.any() else float(sizes.max())
+    predicted = np.flatnonzero(~keyframes)
+    sizes = np.interp(np.arange(len(sizes)), predicted, sizes[predicted])
+    window = max(1, round(SMOOTHING_SECONDS * framerate))
+    padded = np.pad(sizes, (window // 2, window - 1 - window // 2), mode="edge")
+    smoothed = np.convolve(padded, np.ones(window) / window, mode="valid")
+    block = max(1, round(BASELINE_SECONDS * framerate))
+    centers, baselines = [], []
+    for start in range(0, len(smoothed), block):
+        end = min(start + block, len(smoothed))
+        centers.append((start + end - 1) / 2)
+        baselines.append(np.percentile(smoothed[start:end], BASELINE_PERCENTILE))
+    baseline = np.interp(np.arange(len(smoothed)), centers, baselines)
+    return np.maximum(smoothed - baseline, 0) / keyframe_size
+
+
+def active_windows(activity: np.ndarray, threshold: float) -> ty.List[ty.Tuple[int, int]]:
+    """Returns the (start, end) index of each run of `activity` above `threshold`."""
+    above = np.concatenate(([False], activity > threshold, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def prescreen_windows(
+    inputs: ty.List[InputVideo], threshold: float = DEFAULT_THRESHOLD
+) -> ty.List[ty.Tuple[int, int]]:
+    """Finds the (start, end) frame numbers of the windows of `inputs` (concatenated as with
+    `VideoJoiner`) which may have motion, to be scanned with `MotionScanner.set_scan_windows`."""
+    windows = []
+    offset = 0
+    total_frames = 0
+    for path in inputs:
+        framerate, frame_nums, sizes, keyframes = packet_sizes(path)
+        if not len(sizes):
+            continue
+        activity = frame_activity(sizes, keyframes, framerate)
+        for start, end in active_windows(activity, threshold):
+            windows.append((offset + int(frame_nums[start]), offset + int(frame_nums[end - 1]) + 1))
+        offset += int(frame_nums[-1]) + 1
+        total_frames += len(sizes)
+    logger.info(
+        "Pre-screen found %d window%s with activity (%d of %d frames).",
+        len(windows),
+        "" if len(windows) == 1 else "s",
+        sum(end - start for start, end in windows),
+        total_frames,
+    )
+    return windows
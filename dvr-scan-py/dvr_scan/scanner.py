@@ -13,13 +13,14 @@
 Contains the motion scanning engine (`MotionScanner`) for DVR-Scan.
 """
 
+import collections
 import logging
 import queue
 import subprocess
 import sys
 import threading
 import typing as ty
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
 
@@ -29,7 +30,8 @@ from scenedetect import FrameTimecode
 from scenedetect.platform import FakeTqdmObject
 from tqdm import tqdm
 
-from dvr_scan.detector import MotionDetector
+from dvr_scan.background import BackgroundSampler, load_background, save_background
+from dvr_scan.detector import DuplicateFilter, MotionDetector, MotionGate, ProcessedFrame
 from dvr_scan.overlays import BoundingBoxOverlay, TextOverlay
 from dvr_scan.platform_utils import (
     HAS_PILLOW,
@@ -38,8 +40,14 @@ from dvr_scan.platform_utils import (
     is_ffmpeg_available,
 )
 from dvr_scan.region import Point, Size, bound_point, load_regions
-from dvr_scan.subtractor import SubtractorCNT, SubtractorCudaMOG2, SubtractorMOG2
-from dvr_scan.video_joiner import VideoJoiner
+from dvr_scan.subtractor import (
+    SubtractorCNT,
+    SubtractorCudaMOG2,
+    SubtractorMOG2,
+    SubtractorMOG2Tiled,
+    SubtractorRunningAverage,
+)
+from dvr_scan.video_joiner import InputVideo, StreamInput, VideoJoiner
 
 if HAS_TKINTER and HAS_PILLOW:
     from dvr_scan.app.region_editor import RegionEditor
@@ -52,6 +60,25 @@ DEFAULT_VIDEOWRITER_CODEC = "XVID"
 MAX_DECODE_QUEUE_SIZE: int = 4
 """Maximum size of the queue of frames waiting to be processed after decoding."""
 
+MAX_DETECTION_BATCH_SIZE: int = 16
+"""Maximum number of decoded frames run through the motion detector together."""
+
+MAX_DETECTION_BATCH_BYTES: int = 128 * 1024 * 1024
+"""Maximum size of a batch of frames run through the motion detector together, in bytes. Limits
+the batch size (and so the decode queue size) for high resolution videos."""
+
+ADAPTIVE_SKIP_APPROACH: float = 0.5
+"""With adaptive frame skip, no frames are skipped after a frame scoring at least this fraction of
+the threshold, so events are detected at the full frame rate."""
+
+ADAPTIVE_SKIP_QUIET: float = 0.25
+"""With adaptive frame skip, the number of frames skipped only increases after frames scoring less
+than this fraction of the threshold (and is halved after those in between)."""
+
+TWO_PASS_WARMUP_KEYFRAMES: int = 3
+"""In a two-pass scan, number of keyframes before each window run through the detector to train
+the background model, instead of decoding frames before it."""
+
 MAX_ENCODE_QUEUE_SIZE: int = 4
 """Maximum size of the queue of encode events waiting to be processed."""
 
@@ -80,6 +107,8 @@ class DetectorType(Enum):
     MOG2 = SubtractorMOG2
     CNT = SubtractorCNT
     MOG2_CUDA = SubtractorCudaMOG2
+    MOG2_TILED = SubtractorMOG2Tiled
+    AVG = SubtractorRunningAverage
 
 
 class OutputMode(Enum):
@@ -111,6 +140,20 @@ class DecodeEvent:
 
     frame_bgr: np.ndarray
     timecode: FrameTimecode
+    skipped: int = 0
+    """Number of frames skipped (not decoded) since the previous frame."""
+
+
+@dataclass
+class ScanWindowEvent:
+    """Event generated by decode thread before the frames of each scan window. Frames before
+    `warmup_end` only train the background model."""
+
+    start: FrameTimecode
+    end: FrameTimecode
+    warmup_end: FrameTimecode
+    warmup_frames: ty.List[np.ndarray] = field(default_factory=list)
+    """Frames from before the window to train the background model with first."""
 
 
 @dataclass
@@ -148,6 +191,10 @@ class DetectionResult:
 
     event_list: ty.List[MotionEvent]
     num_frames: int
+    num_frames_gated: int = 0
+    """Frames the cascade gate found no motion in, so weren't run through the subtractor."""
+    num_frames_duplicate: int = 0
+    """Frames identical to the previous one, so weren't run through the subtractor."""
 
 
 def _scale_kernel_size(kernel_size: int, downscale_factor: int):
@@ -218,9 +265,12 @@ class MotionScanner:
 
     def __init__(
         self,
-        input_videos: ty.List[Path],
+        input_videos: ty.List[InputVideo],
         input_mode: str = "opencv",
         frame_skip: int = 0,
+        adaptive_frame_skip: int = 0,
+        decoder_skip: str = "none",
+        two_pass: bool = False,
         show_progress: bool = False,
         debug_mode: bool = False,
     ):
@@ -252,11 +302,20 @@ class MotionScanner:
         self._kernel_size = None  # -k/--kernel-size
         self._downscale_factor = 1  # -df/--downscale-factor
         self._learning_rate = -1  # learning-rate
+        self._tile_count = 0  # tile-count
+        self._cascade_gate = False  # --cascade-gate
+        self._cascade_threshold = 10.0  # cascade-threshold
+        self._cascade_interval = 10  # cascade-interval
+        self._skip_duplicates = False  # --skip-duplicates
         self._max_threshold = 255.0  # max-threshold
         self._max_area = 1.0  # max-area
         self._max_width = 1.0  # max-width
         self._max_height = 1.0  # max-height
 
+        # Background Snapshot Parameters (set_background)
+        self._load_background: ty.Optional[Path] = None  # --load-background
+        self._save_background: ty.Optional[Path] = None  # --save-background
+
         # Motion Event Parameters (set_event_params)
         self._min_event_len = None  # -l/--min-event-length
         self._pre_event_len = None  # -tb/--time-before-event
@@ -273,11 +332,27 @@ class MotionScanner:
         self._roi_deprecated = None
 
         # Input Video Parameters (set_video_time)
-        self._input: VideoJoiner = VideoJoiner(input_videos, backend=input_mode)  # -i/--input
+        if sum((frame_skip > 0, adaptive_frame_skip > 0, decoder_skip != "none")) > 1:
+            raise ValueError("Only one of fixed, adaptive, or decoder frame skip can be used.")
+        self._input: VideoJoiner = VideoJoiner(
+            input_videos, backend=input_mode, decoder_skip=decoder_skip
+        )  # -i/--input
         self._frame_skip: int = frame_skip  # -fs/--frame-skip
+        self._adaptive_frame_skip: int = adaptive_frame_skip  # -afs/--adaptive-frame-skip
+        self._decoder_skip: str = decoder_skip  # --decoder-skip
+        self._two_pass: bool = two_pass  # --two-pass
+        # With adaptive frame skip, the decode thread waits for the main loop to reply to each frame
+        # with the number of frames to skip before the next one, or a FrameTimecode to go back to.
+        self._adaptive_feedback: ty.Optional[queue.Queue] = None
         self._start_time: FrameTimecode = None  # -st/--start-time
         self._end_time: FrameTimecode = None  # -et/--end-time
 
+        # Scan Windows (set_scan_windows)
+        self._scan_windows: ty.Optional[ty.List[ty.Tuple[FrameTimecode, FrameTimecode]]] = None
+        self._window_warmup: ty.Optional[FrameTimecode] = None  # --window-warmup
+        # Keyframes found by the first pass of a two-pass scan, which warm up each window.
+        self._warmup_keyframes: ty.List[FrameTimecode] = []
+
         # Internal Variables
         self._stop: threading.Event = threading.Event()
         self._decode_thread_exception = None
@@ -365,6 +440,13 @@ class MotionScanner:
             raise ValueError(
                 "input concatenation is only supported in `scan-only` or `opencv` mode."
             )
+        if any(isinstance(path, StreamInput) for path in self._input.paths) and output_mode in (
+            OutputMode.FFMPEG,
+            OutputMode.COPY,
+        ):
+            raise ValueError(
+                "inputs carved from a disk image are only supported in `scan-only` or `opencv` mode."
+            )
         if comp_file is not None and output_mode != OutputMode.OPENCV:
             raise ValueError("output to single file is only supported with mode `opencv`")
         if output_mode in (OutputMode.FFMPEG, OutputMode.COPY) and not is_ffmpeg_available():
@@ -410,6 +492,11 @@ class MotionScanner:
         kernel_size: int = -1,
         downscale_factor: int = 1,
         learning_rate: float = -1,
+        tile_count: int = 0,
+        cascade_gate: bool = False,
+        cascade_threshold: float = 10.0,
+        cascade_interval: int = 10,
+        skip_duplicates: bool = False,
     ):
         """Set detection parameters."""
         self._threshold = threshold
@@ -432,6 +519,29 @@ class MotionScanner:
         #
         # We should also investigate how this works for CNT and other subtractors.
         self._learning_rate = learning_rate
+        if tile_count < 0:
+            raise ValueError("Tile count must be positive.")
+        # Only used by DetectorType.MOG2_TILED, 0 uses one tile per CPU core.
+        self._tile_count = tile_count
+        if cascade_interval < 1:
+            raise ValueError("Cascade interval must be at least 1.")
+        # Only run the full subtractor on frames where a cheap thumbnail difference finds motion,
+        # and every `cascade_interval` frames otherwise.
+        self._cascade_gate = cascade_gate
+        self._cascade_threshold = cascade_threshold
+        self._cascade_interval = cascade_interval
+        # Frames identical to the previous one share its result instead of being detected again.
+        self._skip_duplicates = skip_duplicates
+
+    def set_background(
+        self,
+        load_background: ty.Optional[Path] = None,
+        save_background: ty.Optional[Path] = None,
+    ):
+        """Set paths to load a background snapshot from, which the background model is trained on
+        before scanning (and each scan window), and to save one to once scanning completes."""
+        self._load_background = load_background
+        self._save_background = save_background
 
     def set_regions(
         self,
@@ -503,6 +613,65 @@ class MotionScanner:
         elif end_time is not None:
             self._end_time = FrameTimecode(end_time, self._input.framerate)
 
+    def set_scan_windows(
+        self,
+        windows: ty.Optional[ty.List[ty.Tuple[ty.Union[int, float, str], ty.Union[int, float, str]]]],
+        margin_before: ty.Union[int, float, str] = 0,
+        margin_after: ty.Union[int, float, str] = 0,
+        warmup: ty.Union[int, float, str] = 0,
+    ):
+        """Only scan the given (start, end) windows of the video, each padded by the margins.
+        If `windows` is None the whole video is scanned, and if it is empty nothing is.
+
+        The input is seeked from one window to the next. The background model is reset for
+        each window, and trained on `warmup` worth of frames before it which can't start a
+        motion event. Windows closer together than that are merged."""
+        assert self._input.framerate is not None
+        if windows is None:
+            self._scan_windows = None
+            return
+        framerate = self._input.framerate
+        before = FrameTimecode(margin_before, framerate).frame_num
+        after = FrameTimecode(margin_after, framerate).frame_num
+        self._window_warmup = FrameTimecode(warmup, framerate)
+        padded = sorted(
+            (
+                max(0, FrameTimecode(start, framerate).frame_num - before),
+                FrameTimecode(end, framerate).frame_num + after,
+            )
+            for start, end in windows
+        )
+        merged = []
+        for start, end in padded:
+            if merged and start <= merged[-1][1] + self._window_warmup.frame_num:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._scan_windows = [
+            (FrameTimecode(start, framerate), FrameTimecode(end, framerate)) for start, end in merged
+        ]
+        logger.info(
+            "Limiting scan to %d window%s (%s of video).",
+            len(self._scan_windows),
+            "" if len(self._scan_windows) == 1 else "s",
+            FrameTimecode(sum(end - start for start, end in merged), framerate).get_timecode(),
+        )
+
+    def _get_scan_windows(self) -> ty.List[ty.Tuple[FrameTimecode, FrameTimecode]]:
+        """Scan windows limited to the start/end time (if set), including their warm-up."""
+        windows = []
+        for start, end in self._scan_windows:
+            if self._start_time is not None and start < self._start_time:
+                start = self._start_time
+            if self._end_time is not None and end > self._end_time:
+                end = self._end_time
+            if start < end:
+                windows.append((max(0, start.frame_num - self._window_warmup.frame_num), start, end))
+        return [
+            (FrameTimecode(decode_start, self._input.framerate), start, end)
+            for decode_start, start, end in windows
+        ]
+
     def _handle_regions(self) -> bool:
         # TODO(v2.0): Remove deprecated ROI selection handlers.
         if (self._show_roi_window_deprecated) and (
@@ -612,6 +781,11 @@ class MotionScanner:
     @property
     def frames_remaining(self) -> int:
         num_frames = self._input.total_frames
+        if self._scan_windows is not None:
+            return sum(
+                max(0, min(end.frame_num, num_frames) - decode_start.frame_num)
+                for decode_start, _, end in self._get_scan_windows()
+            )
         # Correct for end time.
         if self._end_time and self._end_time.frame_num < num_frames:
             num_frames = self._end_time.frame_num
@@ -648,15 +822,20 @@ class MotionScanner:
         self._stop.clear()
         buffered_frames: ty.List[np.ndarray] = []
         event_window: ty.List[float] = []
+        # First frame number each score in the event window may represent (including skipped ones).
+        event_window_starts: ty.List[int] = []
         event_list: ty.List[MotionEvent] = []
         num_frames_post_event = 0
         event_start = None
 
         in_motion_event = False
         frames_processed = 0
+        frames_detected = 0
+        frames_gated = 0
+        frames_duplicate = 0
 
-        # Seek to starting position if required.
-        if self._start_time is not None:
+        # Seek to starting position if required (scan windows are seeked to by the decode thread).
+        if self._start_time is not None and self._scan_windows is None:
             self._input.seek(self._start_time)
 
         if not self._use_pts:
@@ -685,16 +864,35 @@ class MotionScanner:
         # Create background subtractor and motion detector.
         # TODO: Figure out how to avoid logging unused parameters or emit a warning. For example,
         # the `variance_threshold` parameter is ignored by the `CNT` subtractor.
-        detector = MotionDetector(
-            subtractor=self._subtractor_type.value(
-                variance_threshold=self._variance_threshold,
-                kernel_size=kernel_size,
-                learning_rate=self._learning_rate,
-            ),
-            frame_size=self._input.resolution,
-            downscale=self._downscale_factor,
-            regions=self._regions,
-        )
+        subtractor_args = {}
+        if self._subtractor_type == DetectorType.MOG2_TILED:
+            subtractor_args["tiles"] = self._tile_count
+
+        background = self._load_background_snapshot()
+
+        def create_detector() -> MotionDetector:
+            detector = MotionDetector(
+                subtractor=self._subtractor_type.value(
+                    variance_threshold=self._variance_threshold,
+                    kernel_size=kernel_size,
+                    learning_rate=self._learning_rate,
+                    **subtractor_args,
+                ),
+                frame_size=self._input.resolution,
+                downscale=self._downscale_factor,
+                regions=self._regions,
+                gate=(
+                    MotionGate(threshold=self._cascade_threshold, interval=self._cascade_interval)
+                    if self._cascade_gate
+                    else None
+                ),
+                duplicates=DuplicateFilter() if self._skip_duplicates else None,
+            )
+            if background:
+                detector.train(background)
+            return detector
+
+        detector = create_detector()
 
         logger.info(
             "Using subtractor %s with kernel_size = %s%s, "
@@ -705,11 +903,37 @@ class MotionScanner:
             str(self._variance_threshold) if self._variance_threshold != 16.0 else "auto",
             str(self._learning_rate) if self._learning_rate != -1 else "auto",
         )
+        if self._cascade_gate:
+            logger.info(
+                "Using cascade gate with threshold = %s and interval = %d",
+                str(self._cascade_threshold),
+                self._cascade_interval,
+            )
+
+        if self._two_pass and any(isinstance(path, StreamInput) for path in self._input.paths):
+            # Frames can't be dropped in the decoder for carved inputs, so the first pass would
+            # decode every frame and only add work.
+            logger.warning("Two-pass scan isn't supported for inputs carved from a disk image.")
+        elif self._two_pass and self._scan_windows is None:
+            # Events can start before the motion found, and are only cut off at the window end.
+            self.set_scan_windows(
+                self._find_keyframe_windows(create_detector()),
+                margin_before=self._pre_event_len.frame_num + self._min_event_len.frame_num,
+                margin_after=self._post_event_len.frame_num,
+            )
 
         # Correct event length parameters to account frame skip.
         post_event_len: int = self._post_event_len.frame_num // (self._frame_skip + 1)
         pre_event_len: int = self._pre_event_len.frame_num // (self._frame_skip + 1)
         min_event_len: int = max(self._min_event_len.frame_num // (self._frame_skip + 1), 1)
+        # With adaptive or decoder frame skip, the frames skipped before each frame are counted as
+        # they are decoded instead of scaling event lengths by a fixed amount.
+        count_skipped = self._adaptive_frame_skip > 0 or self._decoder_skip != "none"
+        if self._decoder_skip != "none":
+            # The event window and frame buffer still hold decoded frames only, so scale those by
+            # the average number of frames each one represents.
+            pre_event_len = int(pre_event_len / self._input.sampling_interval)
+            min_event_len = max(round(min_event_len / self._input.sampling_interval), 1)
 
         # Calculations below rely on min_event_len always being >= 1 (cannot be zero)
         assert min_event_len >= 1, "min_event_len must be at least 1 frame"
@@ -734,6 +958,11 @@ class MotionScanner:
             last_frame_above_threshold = 0
         else:
             last_frame_above_threshold_ms = 0
+        # With adaptive or decoder frame skip, frames skipped right after the last frame with motion,
+        # which may also have had motion (None until the next frame is processed).
+        skipped_after_motion: ty.Optional[int] = 0
+        adaptive_skip = 0
+        self._adaptive_feedback = queue.Queue(1) if self._adaptive_frame_skip else None
 
         if self._bounding_box:
             self._bounding_box.set_corrections(
@@ -742,8 +971,12 @@ class MotionScanner:
                 frame_skip=self._frame_skip,
             )
 
-        # Don't use the first result from the background subtractor.
-        processed_first_frame = False
+        # Don't use the first result from the background subtractor, unless it was trained on a
+        # background snapshot already.
+        processed_first_frame = bool(background)
+        sampler = BackgroundSampler(self._input.framerate) if self._save_background else None
+        # Current scan window (if any), frames before its warm-up end can't start events.
+        window: ty.Optional[ScanWindowEvent] = None
 
         # Motion event scanning/detection loop. Need to avoid CLI output/logging until end of the
         # main scanning loop below, otherwise it will interrupt the progress bar.
@@ -760,7 +993,18 @@ class MotionScanner:
         progress_bar = FakeTqdmObject() if not self._show_progress else self._create_progress_bar()
         num_frames_to_process = self.frames_remaining
 
-        decode_queue = queue.Queue(MAX_DECODE_QUEUE_SIZE)
+        # Frames are run through the detector in batches of as many as have already been decoded,
+        # so the decode queue must be able to hold a whole batch.
+        frame_bytes = self._input.resolution[0] * self._input.resolution[1] * 3
+        batch_size = max(1, min(MAX_DETECTION_BATCH_SIZE, MAX_DETECTION_BATCH_BYTES // frame_bytes))
+        if self._adaptive_frame_skip:
+            # The decode thread waits for the result of each frame before decoding the next.
+            batch_size = 1
+        decode_queue = queue.Queue(max(MAX_DECODE_QUEUE_SIZE, batch_size))
+        # Events read from the decode queue, with their detection results, waiting to be processed.
+        pending: ty.Deque[
+            ty.Tuple[ty.Optional[ty.Union[DecodeEvent, ScanWindowEvent]], ty.Optional[ProcessedFrame]]
+        ] = collections.deque()
         decode_thread = threading.Thread(
             target=MotionScanner._decode_thread, args=(self, decode_queue), daemon=True
         )
@@ -788,11 +1032,64 @@ class MotionScanner:
                     num_events += 1
                 self._processed_frame(progress_bar=progress_bar, num_events=num_events)
             # Keep polling decode queue until it's empty (signaled via None).
-            frame: ty.Optional[DecodeEvent] = decode_queue.get()
+            if not pending:
+                pending.extend(self._read_decode_batch(decode_queue, detector, batch_size))
+            frame, result = pending.popleft()
             if frame is None:
                 break
+            if isinstance(frame, ScanWindowEvent):
+                # An event still open when its window ended is cut off at the window end.
+                if in_motion_event:
+                    in_motion_event = False
+                    if not self._use_pts:
+                        event_end = FrameTimecode(
+                            min(
+                                1
+                                + last_frame_above_threshold
+                                + self._post_event_len.frame_num
+                                + self._frame_skip
+                                + (skipped_after_motion or 0),
+                                window.end.frame_num,
+                            ),
+                            self._input.framerate,
+                        )
+                    else:
+                        event_end = FrameTimecode(
+                            min(
+                                (last_frame_above_threshold_ms / 1000)
+                                + self._post_event_len.get_seconds(),
+                                window.end.get_seconds(),
+                            ),
+                            self._input.framerate,
+                        )
+                    event_list.append(MotionEvent(start=event_start, end=event_end))
+                    self._save_thumbnail()
+                    if self._output_mode != OutputMode.SCAN_ONLY:
+                        encode_queue.put(MotionEvent(start=event_start, end=event_end))
+                # The background from the previous window is stale, start a new model.
+                window = frame
+                detector = create_detector()
+                processed_first_frame = bool(background)
+                if window.warmup_frames:
+                    detector.update_batch(window.warmup_frames)
+                    processed_first_frame = True
+                adaptive_skip = 0
+                event_window = []
+                event_window_starts = []
+                buffered_frames = []
+                event_end = window.start
+                if not self._use_pts:
+                    start_frame = window.start.frame_num
+                else:
+                    start_frame_ms = window.start.get_seconds() * 1000
+                if self._bounding_box:
+                    self._bounding_box.clear()
+                continue
             assert frame.frame_bgr is not None
             pts = frame.timecode.get_seconds() * 1000
+            # Frames skipped before this one with adaptive or decoder frame skip. Event lengths are
+            # scaled for fixed frame skip instead (see above).
+            frames_skipped = frame.skipped if count_skipped else 0
             frame_size = (frame.frame_bgr.shape[1], frame.frame_bgr.shape[0])
             if frame_size != self._input.resolution:
                 time = frame.timecode
@@ -801,8 +1098,10 @@ class MotionScanner:
                     f"WARNING: Frame {time.frame_num} [{time.get_timecode()}] has unexpected size: "
                     f"{frame_size[0]}x{frame_size[1]}, expected {video_res[0]}x{video_res[1]}"
                 )
-            result = detector.update(frame.frame_bgr)
             frame_score = result.score
+            frames_detected += 1
+            frames_gated += result.gated
+            frames_duplicate += result.duplicate
 
             if test_width_height_area:
                 box_width = cv2.boundingRect(result.subtracted)[2] * self._downscale_factor
@@ -822,19 +1121,53 @@ class MotionScanner:
                 or height_fraction > self._max_height
             ):
                 frame_score = 0
+            # Frames before the start of the scan window only train the background model.
+            if window is not None and frame.timecode < window.warmup_end:
+                frame_score = 0
             above_threshold = frame_score >= self._threshold
 
+            if self._adaptive_frame_skip:
+                if (
+                    frames_skipped
+                    and not in_motion_event
+                    and self._input.can_seek_backward
+                    and frame_score >= self._threshold * ADAPTIVE_SKIP_APPROACH
+                ):
+                    # Motion may have started in the frames skipped, so go back and process them.
+                    adaptive_skip = 0
+                    self._adaptive_feedback.put(
+                        FrameTimecode(
+                            frame.timecode.frame_num - frames_skipped, self._input.framerate
+                        )
+                    )
+                    continue
+                if in_motion_event or frame_score >= self._threshold * ADAPTIVE_SKIP_APPROACH:
+                    adaptive_skip = 0
+                elif frame_score >= self._threshold * ADAPTIVE_SKIP_QUIET:
+                    adaptive_skip //= 2
+                else:
+                    adaptive_skip = min(2 * adaptive_skip + 1, self._adaptive_frame_skip)
+                self._adaptive_feedback.put(adaptive_skip)
+
             if above_threshold and frame_score > self._highscore:
                 self._highscore = frame_score
                 self._highframe = frame.frame_bgr
 
             event_window.append(frame_score)
+            event_window_starts.append(frame.timecode.frame_num - frames_skipped)
             # The first frame fed to the detector can sometimes produce unreliable results due
             # to it not having any previous information to compare against.
             if not processed_first_frame:
                 above_threshold = False
                 processed_first_frame = True
             event_window = event_window[-min_event_len:]
+            event_window_starts = event_window_starts[-min_event_len:]
+            if sampler is not None and not in_motion_event and not above_threshold:
+                sampler.add(frame.timecode.frame_num, frame.frame_bgr)
+            if above_threshold:
+                skipped_after_motion = None
+            elif skipped_after_motion is None:
+                skipped_after_motion = frames_skipped
 
             bounding_box = None
             # TODO: Only call clear() when we exit the current motion event.
@@ -872,31 +1205,11 @@ class MotionScanner:
                 # TODO(#72): We should wait until the max of *both* the pre-event and post-
                 # event windows have passed. Right now we just consider the post-event window.
                 else:
-                    num_frames_post_event += 1
+                    num_frames_post_event += 1 + frames_skipped
                     if num_frames_post_event >= post_event_len:
                         in_motion_event = False
 
-                        logger.debug(
-                            "event %d high score %f" % (1 + self._num_events, self._highscore)
-                        )
-                        if self._thumbnails == "highscore":
-                            video_name = self._input.paths[0].stem
-                            output_path: Path = (
-                                self._comp_file
-                                if self._comp_file
-                                else Path(
-                                    OUTPUT_FILE_TEMPLATE.format(
-                                        VIDEO_NAME=video_name,
-                                        EVENT_NUMBER="%04d" % (1 + self._num_events),
-                                        EXTENSION="jpg",
-                                    )
-                                )
-                            )
-                            if self._output_dir:
-                                output_path = self._output_dir / output_path
-                            cv2.imwrite(str(output_path), self._highframe)
-                            self._highscore = 0
-                            self._highframe = None
+                        self._save_thumbnail()
 
                         # Calculate event end based on the last frame we had with motion plus
                         # the post event length time. We also need to compensate for the number
@@ -907,7 +1220,8 @@ class MotionScanner:
                                 1
                                 + last_frame_above_threshold
                                 + self._post_event_len.frame_num
-                                + self._frame_skip,
+                                + self._frame_skip
+                                + (skipped_after_motion or 0),
                                 self._input.framerate,
                             )
                             assert event_end.frame_num >= event_start.frame_num
@@ -953,12 +1267,20 @@ class MotionScanner:
                     progress_bar.set_description(
                         PROGRESS_BAR_DESCRIPTION % (1 + len(event_list)), refresh=False
                     )
-                    event_window = []
                     num_frames_post_event = 0
                     frames_since_last_event = frame.timecode.frame_num - event_end.frame_num
                     last_frame_above_threshold = frame.timecode.frame_num
 
                     if not self._use_pts:
+                        if count_skipped:
+                            # Motion may have started anywhere after the frame processed before
+                            # the event window.
+                            start_event_shift = (
+                                self._pre_event_len.frame_num
+                                + frame.timecode.frame_num
+                                + 1
+                                - event_window_starts[0]
+                            )
                         shift_amount = min(frames_since_last_event, start_event_shift)
                         shifted_start = max(
                             start_frame, frame.timecode.frame_num + 1 - shift_amount
@@ -981,9 +1303,11 @@ class MotionScanner:
                             break
                         encode_queue.put(encode_frame)
                     buffered_frames = []
+                    event_window = []
+                    event_window_starts = []
 
-            frames_processed += 1 + self._frame_skip
-            progress_bar.update(1 + self._frame_skip)
+            frames_processed += 1 + self._frame_skip + frames_skipped
+            progress_bar.update(1 + self._frame_skip + frames_skipped)
 
         # Close the progress bar before producing any more output.
         progress_bar.close()
@@ -1004,26 +1328,7 @@ class MotionScanner:
             else:
                 event_end = FrameTimecode((pts / 1000), self._input.framerate)
             event_list.append(MotionEvent(start=event_start, end=event_end))
-
-            logger.debug("event %d high score %f" % (1 + self._num_events, self._highscore))
-            if self._thumbnails == "highscore":
-                video_name = self._input.paths[0].stem
-                output_path = (
-                    self._comp_file
-                    if self._comp_file
-                    else Path(
-                        OUTPUT_FILE_TEMPLATE.format(
-                            VIDEO_NAME=video_name,
-                            EVENT_NUMBER="%04d" % (1 + self._num_events),
-                            EXTENSION="jpg",
-                        )
-                    )
-                )
-                if self._output_dir:
-                    output_path = self._output_dir / output_path
-                cv2.imwrite(str(output_path), self._highframe)
-                self._highscore = 0
-                self._highframe = None
+            self._save_thumbnail()
 
             if self._output_mode != OutputMode.SCAN_ONLY:
                 encode_queue.put(MotionEvent(start=event_start, end=event_end))
@@ -1049,33 +1354,183 @@ class MotionScanner:
                 self._input.decode_failures,
             )
 
-        return DetectionResult(event_list, frames_processed)
+        if self._cascade_gate and frames_detected:
+            logger.info(
+                "Cascade gate skipped %d of %d frames (%.1f%%).",
+                frames_gated,
+                frames_detected,
+                100.0 * frames_gated / frames_detected,
+            )
+
+        if self._skip_duplicates and frames_detected:
+            logger.info(
+                "Skipped %d duplicate frames of %d (%.1f%%).",
+                frames_duplicate,
+                frames_detected,
+                100.0 * frames_duplicate / frames_detected,
+            )
+
+        if sampler is not None and sampler.frames:
+            # Don't lose the events found if the snapshot can't be saved.
+            try:
+                save_background(self._save_background, sampler.frames)
+            except OSError as ex:
+                logger.error(
+                    "Failed to save background snapshot to %s: %s", self._save_background, ex
+                )
+            else:
+                logger.info(
+                    "Saved background snapshot (%d frames) to: %s",
+                    len(sampler.frames),
+                    self._save_background,
+                )
+
+        return DetectionResult(event_list, frames_processed, frames_gated, frames_duplicate)
+
+    def _load_background_snapshot(self) -> ty.List[np.ndarray]:
+        """Loads the background snapshot to train the background model on, if set. A missing
+        snapshot isn't an error, so the same settings can be used for the first scan of a camera
+        which saves it."""
+        if not self._load_background:
+            return []
+        if not self._load_background.exists():
+            logger.warning(
+                "Background snapshot does not exist, starting with an empty background model: %s",
+                self._load_background,
+            )
+            return []
+        frames = load_background(self._load_background)
+        width, height = self._input.resolution
+        if frames[0].shape[:2] != (height, width):
+            logger.warning(
+                "Background snapshot is %dx%d but video is %dx%d, ignoring it.",
+                frames[0].shape[1],
+                frames[0].shape[0],
+                width,
+                height,
+            )
+            return []
+        logger.info(
+            "Loaded background snapshot (%d frames) from: %s", len(frames), self._load_background
+        )
+        return frames
+
+    def _save_thumbnail(self):
+        """Save the highest scoring frame of the motion event that just ended, if enabled."""
+        logger.debug("event %d high score %f" % (1 + self._num_events, self._highscore))
+        if self._thumbnails == "highscore":
+            video_name = self._input.paths[0].stem
+            output_path: Path = (
+                self._comp_file
+                if self._comp_file
+                else Path(
+                    OUTPUT_FILE_TEMPLATE.format(
+                        VIDEO_NAME=video_name,
+                        EVENT_NUMBER="%04d" % (1 + self._num_events),
+                        EXTENSION="jpg",
+                    )
+                )
+            )
+            if self._output_dir:
+                output_path = self._output_dir / output_path
+            cv2.imwrite(str(output_path), self._highframe)
+            self._highscore = 0
+            self._highframe = None
+
+    def _read_decode_batch(
+        self, decode_queue: queue.Queue, detector: MotionDetector, batch_size: int
+    ) -> ty.List[
+        ty.Tuple[ty.Optional[ty.Union[DecodeEvent, ScanWindowEvent]], ty.Optional[ProcessedFrame]]
+    ]:
+        """Waits for the next frame from the decode queue, and runs it through `detector` along
+        with any others already decoded, up to `batch_size`. Returns each event in order with its
+        result. A scan window or the end of the queue (None) has no result and ends the batch, as
+        the frames after it need a new detector."""
+        frames: ty.List[DecodeEvent] = []
+        event = decode_queue.get()
+        while isinstance(event, DecodeEvent):
+            frames.append(event)
+            if len(frames) >= batch_size:
+                break
+            try:
+                event = decode_queue.get_nowait()
+            except queue.Empty:
+                break
+        batch = []
+        if frames:
+            results = detector.update_batch([frame.frame_bgr for frame in frames])
+            batch = list(zip(frames, results))
+        if not isinstance(event, DecodeEvent):
+            batch.append((event, None))
+        return batch
+
+    def _find_keyframe_windows(self, detector: MotionDetector) -> ty.List[ty.Tuple[int, int]]:
+        """First pass of a two-pass scan. Runs `detector` on only the keyframes of the input, which
+        are decoded on their own, and returns the (start, end) frames between the keyframes on
+        either side of each one with motion."""
+        keyframes = VideoJoiner(self._input.paths, decoder_skip="nonkey")
+        if self._start_time is not None:
+            keyframes.seek(self._start_time)
+        positions: ty.List[int] = []
+        scores: ty.List[float] = []
+        while not self._stop.is_set():
+            if self._end_time is not None and keyframes.position >= self._end_time:
+                break
+            frame_bgr = keyframes.read()
+            if frame_bgr is None:
+                break
+            positions.append(keyframes.position.frame_num - 1)
+            scores.append(detector.update(frame_bgr).score)
+        self._warmup_keyframes = [
+            FrameTimecode(position, self._input.framerate) for position in positions
+        ]
+        end_frame = (
+            self._end_time.frame_num if self._end_time is not None else self._input.total_frames
+        )
+        positions.append(end_frame)
+        # The first frame has nothing to compare against, so its score isn't used.
+        windows = [
+            (positions[i - 1], positions[i + 1])
+            for i in range(1, len(scores))
+            if scores[i] >= self._threshold
+        ]
+        logger.info("Found motion in %d of %d keyframes.", len(windows), len(scores))
+        return windows
 
     def _decode_thread(self, decode_queue: queue.Queue):
         try:
-            while not self._stop.is_set():
-                if self._end_time is not None and self._input.position >= self._end_time:
-                    break
-                for _ in range(self._frame_skip):
-                    if self._input.read(decode=False) is None:
-                        break
-                frame_bgr = self._input.read()
-                if frame_bgr is None:
+            if self._scan_windows is None:
+                self._decode_frames(decode_queue, self._end_time)
+                return
+            # The same decoder is used throughout, seeking forward from one window to the next.
+            for decode_start, start, end in self._get_scan_windows():
+                if self._stop.is_set():
                     break
-                # self._input.position points to the time at the end of the current frame (i.e. the
-                # first frame has a frame_num of 1), so we correct that for presentation time.
-                assert self._input.position.frame_num > 0
-                if not self._use_pts:
-                    presentation_time = FrameTimecode(
-                        timecode=self._input.position.frame_num - 1,
-                        fps=self._input.framerate,
-                    )
-                else:
-                    presentation_time = FrameTimecode(
-                        self._input.position_ms / 1000, self._input.framerate
+                # Keyframes are decoded on their own, so train the model with those before the
+                # window (only seeking forward) rather than decoding every frame of a warmup.
+                warmup_keyframes = [
+                    keyframe
+                    for keyframe in self._warmup_keyframes
+                    if self._input.position <= keyframe < decode_start
+                ][-TWO_PASS_WARMUP_KEYFRAMES:]
+                warmup_frames = []
+                for keyframe in warmup_keyframes:
+                    self._input.seek(keyframe)
+                    frame_bgr = self._input.read()
+                    if frame_bgr is not None:
+                        warmup_frames.append(frame_bgr)
+                if self._input.position < decode_start:
+                    self._input.seek(decode_start)
+                decode_queue.put(
+                    ScanWindowEvent(
+                        start=decode_start,
+                        end=end,
+                        warmup_end=start,
+                        warmup_frames=warmup_frames,
                     )
-                if not self._stop.is_set():
-                    decode_queue.put(DecodeEvent(frame_bgr, presentation_time))
+                )
+                if not self._decode_frames(decode_queue, end):
+                    break
 
         # We'll re-raise any exceptions from the main thread.
         except:  # noqa: E722
@@ -1087,14 +1542,66 @@ class MotionScanner:
             # Make sure main thread stops processing loop.
             decode_queue.put(None)
 
+    def _decode_frames(self, decode_queue: queue.Queue, end_time: ty.Optional[FrameTimecode]) -> bool:
+        """Decode frames up to `end_time`. Returns False once the end of the input is reached."""
+        adaptive_skip = 0
+        last_frame_num: ty.Optional[int] = None
+        while not self._stop.is_set():
+            if end_time is not None and self._input.position >= end_time:
+                break
+            frame_skip = self._frame_skip
+            if self._adaptive_frame_skip:
+                frame_skip = adaptive_skip
+                # Don't skip past the end, so the last frame before it is always processed.
+                end_frame = self._input.total_frames if end_time is None else end_time.frame_num
+                frame_skip = max(0, min(frame_skip, end_frame - self._input.position.frame_num - 1))
+            skipped = 0
+            for _ in range(frame_skip):
+                if self._input.read(decode=False) is None:
+                    break
+                skipped += 1
+            frame_bgr = self._input.read()
+            if frame_bgr is None:
+                return False
+            # self._input.position points to the time at the end of the current frame (i.e. the
+            # first frame has a frame_num of 1), so we correct that for presentation time.
+            assert self._input.position.frame_num > 0
+            if not self._use_pts:
+                presentation_time = FrameTimecode(
+                    timecode=self._input.position.frame_num - 1,
+                    fps=self._input.framerate,
+                )
+            else:
+                presentation_time = FrameTimecode(
+                    self._input.position_ms / 1000, self._input.framerate
+                )
+            if self._decoder_skip != "none":
+                # Frames dropped by the decoder leave gaps in the timestamps of those decoded.
+                if last_frame_num is not None:
+                    skipped = max(0, presentation_time.frame_num - last_frame_num - 1)
+                last_frame_num = presentation_time.frame_num
+            if not self._stop.is_set():
+                decode_queue.put(DecodeEvent(frame_bgr, presentation_time, skipped))
+            if self._adaptive_frame_skip:
+                feedback = None
+                while feedback is None and not self._stop.is_set():
+                    try:
+                        feedback = self._adaptive_feedback.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                if isinstance(feedback, FrameTimecode):
+                    self._input.seek(feedback)
+                    adaptive_skip = 0
+                elif feedback is not None:
+                    adaptive_skip = feedback
+        return True
+
     def _init_video_writer(self, path: Path, frame_size: ty.Tuple[int, int]) -> cv2.VideoWriter:
         """Create a new cv2.VideoWriter using the correct framerate."""
         if self._output_dir:
             path = self._output_dir / path
-        effective_framerate = (
-            self._input.framerate
-            if self._frame_skip < 1
-            else self._input.framerate / (1 + self._frame_skip)
+        effective_framerate = self._input.framerate / (
+            (1 + self._frame_skip) * self._input.sampling_interval
         )
         return cv2.VideoWriter(str(path), self._fourcc, effective_framerate, frame_size)
 
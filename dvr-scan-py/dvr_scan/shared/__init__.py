@@ -37,6 +37,7 @@ from tqdm.contrib.logging import (
 from dvr_scan.overlays import BoundingBoxOverlay, TextOverlay
 from dvr_scan.platform_utils import LOG_FORMAT_ROLLING_LOGS, attach_log_handler
 from dvr_scan.platform_utils import init_logger as _init_logger
+from dvr_scan.prescreen import prescreen_windows
 from dvr_scan.scanner import DetectorType, MotionScanner, OutputMode
 from dvr_scan.shared.settings import ScanSettings
 
@@ -59,10 +60,16 @@ def init_logging(
     elif config is not None:
         quiet_mode = config.get("quiet-mode")
 
+    # The hikvision commands (and scans for the UI) print JSON messages on stdout, so
+    # human-readable logs go to stderr where they can't interleave with them.
+    use_stderr = args is not None and (
+        getattr(args, "command", None) == "hikvision" or getattr(args, "json_output", False)
+    )
     _init_logger(
         log_level=verbosity,
         show_stdout=not quiet_mode,
         log_file=args.logfile if hasattr(args, "logfile") else None,
+        use_stderr=use_stderr,
     )
 
 
@@ -120,6 +127,9 @@ def init_scanner(
         input_videos=settings.get_arg("input"),
         input_mode=settings.get("input-mode"),
         frame_skip=settings.get("frame-skip"),
+        adaptive_frame_skip=settings.get("adaptive-frame-skip"),
+        decoder_skip=settings.get("decoder-skip"),
+        two_pass=settings.get("two-pass"),
         show_progress=not settings.get("quiet-mode"),
         debug_mode=settings.get("debug"),
     )
@@ -202,6 +212,11 @@ def init_scanner(
         kernel_size=settings.get("kernel-size"),
         downscale_factor=settings.get("downscale-factor"),
         learning_rate=settings.get("learning-rate"),
+        tile_count=settings.get("tile-count"),
+        cascade_gate=settings.get("cascade-gate"),
+        cascade_threshold=settings.get("cascade-threshold"),
+        cascade_interval=settings.get("cascade-interval"),
+        skip_duplicates=settings.get("skip-duplicates"),
     )
 
     scanner.set_event_params(
@@ -220,6 +235,30 @@ def init_scanner(
         end_time=settings.get_arg("end-time"),
         duration=settings.get_arg("duration"),
     )
+    scan_windows = settings.get_arg("scan-windows")
+    if settings.get("prescreen"):
+        scan_windows = prescreen_windows(
+            settings.get_arg("input"), threshold=settings.get("prescreen-threshold")
+        )
+    if scan_windows is not None:
+        margin = settings.get_arg("window-margin")
+        if margin is not None:
+            margin_before, margin_after = margin
+        else:
+            margin_before = settings.get("window-margin-before")
+            margin_after = settings.get("window-margin-after")
+        scanner.set_scan_windows(
+            windows=scan_windows,
+            margin_before=margin_before,
+            margin_after=margin_after,
+            warmup=settings.get("window-warmup"),
+        )
+    load_background = settings.get("load-background")
+    save_background = settings.get("save-background")
+    scanner.set_background(
+        load_background=Path(load_background) if load_background else None,
+        save_background=Path(save_background) if save_background else None,
+    )
     load_region = settings.get("load-region")
     save_region = settings.get_arg("save-region")
     scanner.set_regions(
@@ -14,7 +14,9 @@ Defines an interface to background subtraction (`Subtractor`), and provides seve
 All current subtractors use algorithms backed by OpenCV, but this is not a requirement.
 """
 
+import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy
@@ -29,13 +31,27 @@ class Subtractor(ABC):
         """Apply the background subtractor to the given frame.
 
         Arguments:
-            frame: Frame to perform background subtraction on.
+            frame: Frame to perform background subtraction on, either BGR or grayscale.
 
         Returns:
             Mask of areas in the frame containing motion.
         """
         raise NotImplementedError()
 
+    def apply_batch(self, frames: numpy.ndarray) -> numpy.ndarray:
+        """Apply the background subtractor to a batch of consecutive frames, in order. The result
+        must be the same as calling `apply` on each frame. Subtractors which can process a whole
+        batch at once should override this, by default each frame is passed to `apply`.
+
+        Arguments:
+            frames: Frames to perform background subtraction on, with shape (N, H, W, 3) if BGR
+                or (N, H, W) if grayscale.
+
+        Returns:
+            Masks of areas in each frame containing motion, with shape (N, H, W).
+        """
+        return numpy.stack([self.apply(frame) for frame in frames])
+
     @staticmethod
     @abstractmethod
     def is_available():
@@ -43,6 +59,11 @@ class Subtractor(ABC):
         raise NotImplementedError()
 
 
+def _to_grayscale(frame: numpy.ndarray) -> numpy.ndarray:
+    """Converts a BGR frame, or a batch of frames stacked vertically, to grayscale."""
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
 class SubtractorMOG2(Subtractor):
     """MOG2 background subtractor."""
 
@@ -69,7 +90,7 @@ class SubtractorMOG2(Subtractor):
         self._learning_rate = learning_rate
 
     def apply(self, frame: numpy.ndarray) -> numpy.ndarray:
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame_gray = _to_grayscale(frame)
         frame_mask = self._subtractor.apply(frame_gray, learningRate=self._learning_rate)
         if self._kernel is not None:
             frame_filt = cv2.morphologyEx(frame_mask, cv2.MORPH_OPEN, self._kernel)
@@ -82,6 +103,184 @@ class SubtractorMOG2(Subtractor):
         return hasattr(cv2, "createBackgroundSubtractorMOG2")
 
 
+class SubtractorMOG2Tiled(SubtractorMOG2):
+    """MOG2 background subtractor which splits each frame into horizontal tiles, each with its
+    own model, and processes them in parallel on a thread pool (OpenCV releases the GIL).
+
+    MOG2 models every pixel independently, so the tiles don't affect the mask itself. Each tile
+    is extended by the reach of the noise reduction filter (twice the kernel radius, as opening
+    is an erosion followed by a dilation) into its neighbours, and only its own rows are kept,
+    so the filtered mask is the same as filtering the whole frame at once, without seams.
+    """
+
+    # Tiles smaller than this (in rows, excluding overlap) aren't worth the overhead.
+    MIN_TILE_HEIGHT = 32
+
+    def __init__(
+        self,
+        kernel_size: int,
+        history: int = 500,
+        variance_threshold: float = 16.0,
+        detect_shadows: bool = False,
+        learning_rate: float = -1,
+        tiles: int = 0,
+    ):
+        """
+        Arguments:
+            tiles: Number of tiles to split each frame into, or 0 for one per CPU core.
+        """
+        if kernel_size < 0 or (kernel_size > 1 and kernel_size % 2 == 0):
+            raise ValueError("kernel_size must be odd integer >= 1 or zero (0)")
+        if tiles < 0:
+            raise ValueError("tiles must be >= 0")
+        self._kernel = (
+            numpy.ones((kernel_size, kernel_size), numpy.uint8) if kernel_size > 1 else None
+        )
+        self._overlap = 2 * (kernel_size // 2) if kernel_size > 1 else 0
+        self._history = history
+        self._variance_threshold = variance_threshold
+        self._detect_shadows = detect_shadows
+        self._learning_rate = learning_rate
+        self._num_tiles = tiles if tiles > 0 else (os.cpu_count() or 1)
+        # (start, end, padded start, padded end) rows and model of each tile, created for the
+        # size of the first frame.
+        self._tiles = None
+        self._subtractors = None
+        self._executor = None
+
+    def apply(self, frame: numpy.ndarray) -> numpy.ndarray:
+        if self._tiles is None:
+            self._init_tiles(frame.shape[0])
+        mask = numpy.empty(frame.shape[:2], numpy.uint8)
+        if len(self._tiles) == 1:
+            self._apply_tile(0, frame, mask)
+        else:
+            # Each tile writes its own rows of the mask, so the results need no stitching.
+            for future in [
+                self._executor.submit(self._apply_tile, i, frame, mask) for i in range(len(self._tiles))
+            ]:
+                future.result()
+        return mask
+
+    def _init_tiles(self, height: int):
+        num_tiles = max(1, min(self._num_tiles, height // self.MIN_TILE_HEIGHT))
+        bounds = [height * i // num_tiles for i in range(num_tiles + 1)]
+        self._tiles = [
+            (start, end, max(0, start - self._overlap), min(height, end + self._overlap))
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        self._subtractors = []
+        for _ in self._tiles:
+            subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=self._history,
+                varThreshold=self._variance_threshold,
+                detectShadows=self._detect_shadows,
+            )
+            subtractor.setShadowValue(0)
+            self._subtractors.append(subtractor)
+        if num_tiles > 1:
+            self._executor = ThreadPoolExecutor(max_workers=num_tiles)
+
+    def _apply_tile(self, index: int, frame: numpy.ndarray, mask: numpy.ndarray):
+        start, end, padded_start, padded_end = self._tiles[index]
+        # Row slices of a contiguous frame are views, so tiles aren't copied.
+        tile_gray = _to_grayscale(frame[padded_start:padded_end])
+        tile_mask = self._subtractors[index].apply(tile_gray, learningRate=self._learning_rate)
+        if self._kernel is not None:
+            tile_mask = cv2.morphologyEx(tile_mask, cv2.MORPH_OPEN, self._kernel)
+        mask[start:end] = tile_mask[start - padded_start : end - padded_start]
+
+    def __del__(self):
+        if getattr(self, "_executor", None) is not None:
+            self._executor.shutdown(wait=False)
+
+
+class SubtractorRunningAverage(Subtractor):
+    """Running average background subtractor. Much cheaper than MOG2, as the background is a
+    single weighted average per pixel (via `cv2.accumulateWeighted`) rather than a mixture of
+    Gaussians, which makes it well suited to quickly triaging long recordings of mostly static
+    scenes. It adapts less well to repetitive background motion (e.g. trees, water).
+
+    Pixels differing from the background by more than `4 * sqrt(variance_threshold)` intensity
+    levels are foreground, which matches MOG2's threshold for a pixel with a variance of 16.
+    A `learning_rate` of 1 reduces this to differencing consecutive frames.
+    """
+
+    # Number of frames the learning rate is averaged over when set automatically, as with MOG2.
+    HISTORY = 500
+
+    def __init__(
+        self,
+        kernel_size: int,
+        variance_threshold: float = 16.0,
+        learning_rate: float = -1,
+    ):
+        if kernel_size < 0 or (kernel_size > 1 and kernel_size % 2 == 0):
+            raise ValueError("kernel_size must be odd integer >= 1 or zero (0)")
+        self._kernel = (
+            numpy.ones((kernel_size, kernel_size), numpy.uint8) if kernel_size > 1 else None
+        )
+        self._threshold = 4.0 * variance_threshold**0.5
+        self._learning_rate = learning_rate
+        self._background = None
+        self._num_frames = 0
+
+    def apply(self, frame: numpy.ndarray) -> numpy.ndarray:
+        frame_gray = _to_grayscale(frame)
+        self._num_frames += 1
+        if self._background is None:
+            self._background = frame_gray.astype(numpy.float32)
+            return numpy.zeros_like(frame_gray)
+        diff = cv2.absdiff(frame_gray, cv2.convertScaleAbs(self._background))
+        _, frame_mask = cv2.threshold(diff, self._threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(frame_gray, self._background, self._alpha())
+        if self._kernel is not None:
+            frame_mask = cv2.morphologyEx(frame_mask, cv2.MORPH_OPEN, self._kernel)
+        return frame_mask
+
+    def apply_batch(self, frames: numpy.ndarray) -> numpy.ndarray:
+        num_frames, height, width = frames.shape[:3]
+        # OpenCV only handles 2D images (plus channels), so the batch is processed as one tall
+        # frame. Reshaping a contiguous stack is free.
+        frames_gray = _to_grayscale(
+            numpy.ascontiguousarray(frames).reshape(num_frames * height, width, *frames.shape[3:])
+        ).reshape(num_frames, height, width)
+        # Updating the background is inherently sequential, but only needs one cheap call per
+        # frame. Keep the background each frame is compared against to threshold them together.
+        backgrounds = numpy.empty((num_frames, height, width), numpy.float32)
+        first = 0
+        if self._background is None:
+            self._background = frames_gray[0].astype(numpy.float32)
+            self._num_frames += 1
+            backgrounds[0] = self._background
+            first = 1
+        for i in range(first, num_frames):
+            backgrounds[i] = self._background
+            self._num_frames += 1
+            cv2.accumulateWeighted(frames_gray[i], self._background, self._alpha())
+        diff = cv2.absdiff(
+            frames_gray.reshape(num_frames * height, width),
+            cv2.convertScaleAbs(backgrounds.reshape(num_frames * height, width)),
+        )
+        _, masks = cv2.threshold(diff, self._threshold, 255, cv2.THRESH_BINARY)
+        masks = masks.reshape(num_frames, height, width)
+        if self._kernel is not None:
+            # Filtering the tall frame at once would bleed between frames.
+            for mask in masks:
+                cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kernel, dst=mask)
+        return masks
+
+    def _alpha(self) -> float:
+        if self._learning_rate >= 0:
+            return min(self._learning_rate, 1.0)
+        # Like OpenCV's subtractors, learn quickly at first then settle to 1/history.
+        return 1.0 / min(self._num_frames, self.HISTORY)
+
+    @staticmethod
+    def is_available():
+        return hasattr(cv2, "accumulateWeighted")
+
+
 class SubtractorCNT(SubtractorMOG2):
     """CNT background subtractor."""
 
@@ -148,7 +347,11 @@ class SubtractorCudaMOG2(SubtractorMOG2):
         stream = cv2.cuda_Stream()
         frame_bgr_dev = cv2.cuda_GpuMat()
         frame_bgr_dev.upload(frame, stream=stream)
-        frame_gray_dev = cv2.cuda.cvtColor(frame_bgr_dev, cv2.COLOR_BGR2GRAY, stream=stream)
+        frame_gray_dev = (
+            cv2.cuda.cvtColor(frame_bgr_dev, cv2.COLOR_BGR2GRAY, stream=stream)
+            if frame.ndim == 3
+            else frame_bgr_dev
+        )
         frame_mask_dev = self._subtractor.apply(frame_gray_dev, self._learning_rate, stream=stream)
         if self._filter is not None:
             frame_filt_dev = self._filter.apply(frame_mask_dev, stream=stream)
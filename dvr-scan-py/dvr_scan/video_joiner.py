@@ -26,6 +26,14 @@ from scenedetect.video_stream import VideoOpenFailure
 
 FRAMERATE_DELTA_TOLERANCE: float = 0.1
 
+DECODER_SKIP_MODES: ty.Dict[str, str] = {"nonref": "NONREF", "nonkey": "NONKEY"}
+"""Frames PyAV can drop in the decoder (the codec context `skip_frame`): non-reference frames, or
+all but keyframes. Only the frames left are decoded, and are placed by their timestamps."""
+
+SAMPLING_PROBE_FRAMES: int = 64
+"""Number of frames decoded from the start of the first input to estimate the average number of
+frames each decoded frame represents when the decoder drops frames."""
+
 logger = logging.getLogger("dvr_scan")
 
 
@@ -38,6 +46,29 @@ class BackendUnavailable(Exception):
         super().__init__(message % backend)
 
 
+class StreamInput:
+    """An input video read from a file-like object instead of a path, e.g. a byte range carved
+    from a disk image. `open_stream` is called each time the input is opened. Stream inputs are
+    always decoded with PyAV, as OpenCV can only read from paths."""
+
+    def __init__(self, name: str, open_stream: ty.Callable[[], ty.BinaryIO]):
+        self.name = name
+        self._open_stream = open_stream
+
+    @property
+    def stem(self) -> str:
+        return Path(self.name).stem
+
+    def open(self) -> ty.BinaryIO:
+        return self._open_stream()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+InputVideo = ty.Union[Path, StreamInput]
+
+
 # TODO: Replace this with the equivalent from PySceneDetect when available.
 class VideoJoiner:
     """Handles concatenating multiple videos together.
@@ -46,25 +77,40 @@ class VideoJoiner:
         VideoOpenFailure: Failed to open a video, or video parameters don't match.
     """
 
-    def __init__(self, paths: ty.List[Path], backend: str = "opencv"):
+    def __init__(
+        self, paths: ty.List[InputVideo], backend: str = "opencv", decoder_skip: str = "none"
+    ):
+        if decoder_skip != "none":
+            if decoder_skip not in DECODER_SKIP_MODES:
+                raise ValueError(f"Invalid decoder skip mode: {decoder_skip}")
+            # Only PyAV lets us configure which frames the decoder drops.
+            if backend != "pyav":
+                logger.debug("Using pyav backend to skip frames in the decoder.")
+            backend = "pyav"
         if backend not in AVAILABLE_BACKENDS:
             raise BackendUnavailable(backend=backend)
         self._backend: VideoStream = AVAILABLE_BACKENDS[backend]
+        self._decoder_skip = decoder_skip
 
         assert paths
-        self._paths = [Path(p) for p in paths]
+        self._paths = [p if isinstance(p, StreamInput) else Path(p) for p in paths]
         self._path_index = 0
 
         self._cap: ty.Optional[VideoStream] = None
+        self._stream: ty.Optional[ty.BinaryIO] = None
+        self._stream_frames: int = 0
         self._total_frames: int = 0
         self._decode_failures: int = 0
         self._load_input_videos(backend)
         # Initialize position now that the framerate is valid.
         self._position: FrameTimecode = FrameTimecode(0, self.framerate)
         self._last_cap_pos: FrameTimecode = FrameTimecode(0, self.framerate)
+        self._sampling_interval: float = 1.0
+        if decoder_skip != "none":
+            self._sampling_interval = self._estimate_sampling_interval()
 
     @property
-    def paths(self) -> ty.List[Path]:
+    def paths(self) -> ty.List[InputVideo]:
         """All paths this object was created with."""
         return self._paths
 
@@ -83,6 +129,12 @@ class VideoJoiner:
         """Total number of frames of all input videos combined. May be inaccurate."""
         return self._total_frames
 
+    @property
+    def sampling_interval(self) -> float:
+        """Estimated average number of frames each frame read represents, which is greater than 1
+        if the decoder drops frames."""
+        return self._sampling_interval
+
     @property
     def decode_failures(self) -> float:
         """Number of frames which failed to decode (may indicate video corruption)."""
@@ -113,36 +165,113 @@ class VideoJoiner:
                 logger.info(
                     f"Processing complete, opening next video: {self._paths[self._path_index]}"
                 )
-                self._cap = self._backend(str(self._paths[self._path_index]))
+                self._close_stream()
+                self._cap, self._stream = self._open_input(self._paths[self._path_index])
                 self._last_cap_pos = self._cap.base_timecode
                 return self.read(decode=decode)
             logger.debug("No more input to process.")
+            self._close_stream()
             return None
 
+        if isinstance(self._paths[self._path_index], StreamInput):
+            # Carved raw H.264 has no container timestamps, frames are evenly spaced (the
+            # first frame of an input is at its base timecode, like other backends report).
+            self._position += 1 if self._stream_frames else 0
+            self._stream_frames += 1
+            return next
         self._position += self._cap.position.frame_num - self._last_cap_pos.frame_num
         self._last_cap_pos = self._cap.position
         return next
 
+    @property
+    def can_seek_backward(self) -> bool:
+        """True if `seek` supports targets before the current `position`."""
+        return len(self._paths) == 1 and not isinstance(self._paths[0], StreamInput)
+
     def seek(self, target: FrameTimecode):
         """Seek to the target offset. Only seeking forward is supported (i.e. `target` must be
-        greater than the current `position`."""
-        if len(self._paths) == 1 or self._path_index == 0 and target <= self._cap.duration:
+        greater than the current `position`), unless `can_seek_backward` is True."""
+        # Carved streams have no index to seek with, and their position is counted by frame.
+        is_stream = isinstance(self._paths[self._path_index], StreamInput)
+        if not is_stream and (
+            len(self._paths) == 1 or self._path_index == 0 and target <= self._cap.duration
+        ):
             self._cap.seek(target)
+            self._position += self._cap.position.frame_num - self._last_cap_pos.frame_num
+            self._last_cap_pos = self._cap.position
         else:
             # TODO: This is ineffient if we have multiple input videos.
             while self.position < target:
                 if self.read(decode=False) is None:
                     break
 
+    def _open_input(
+        self, path: InputVideo
+    ) -> ty.Tuple[VideoStream, ty.Optional[ty.BinaryIO]]:
+        """Opens an input, returning the VideoStream and the file-like object it reads from
+        (if it is a StreamInput, which the caller is responsible for closing)."""
+        if not isinstance(path, StreamInput):
+            cap = self._backend(str(path))
+            if self._decoder_skip != "none":
+                # Carved streams have no timestamps to place the frames left, so aren't skipped.
+                self._set_skip_frame(cap)
+            return cap, None
+        if "pyav" not in AVAILABLE_BACKENDS:
+            raise BackendUnavailable(backend="pyav")
+        stream = path.open()
+        try:
+            return AVAILABLE_BACKENDS["pyav"](stream, name=path.stem), stream
+        except Exception:
+            stream.close()
+            raise
+
+    def _set_skip_frame(self, cap: VideoStream):
+        # VideoStreamAv doesn't expose its container, so check it still has one we can use.
+        container = getattr(cap, "_container", None)
+        try:
+            codec_context = container.streams.video[0].codec_context
+            codec_context.skip_frame = DECODER_SKIP_MODES[self._decoder_skip]
+        except (AttributeError, IndexError, TypeError, ValueError) as ex:
+            logger.warning("Decoder skip is not supported, decoding every frame: %s", ex)
+            self._decoder_skip = "none"
+
+    def _estimate_sampling_interval(self) -> float:
+        paths = [path for path in self._paths if not isinstance(path, StreamInput)]
+        if not paths or self._decoder_skip == "none":
+            return 1.0
+        cap, _ = self._open_input(paths[0])
+        try:
+            first_frame = None
+            frames_read = 0
+            while frames_read < SAMPLING_PROBE_FRAMES and cap.read(decode=False) is not False:
+                if first_frame is None:
+                    first_frame = cap.position.frame_num
+                frames_read += 1
+            last_frame = cap.position.frame_num
+        finally:
+            # VideoStream has no close(), its container is closed once it's deleted.
+            del cap
+        if frames_read < 2:
+            return 1.0
+        interval = (last_frame - first_frame) / (frames_read - 1)
+        logger.debug("Decoder skip: about 1 in %.1f frames decoded.", interval)
+        return max(1.0, interval)
+
+    def _close_stream(self):
+        self._stream_frames = 0
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
     def _load_input_videos(self, backend: str):
         unsupported_codec: bool = False
-        validated_paths: ty.List[Path] = []
+        validated_paths: ty.List[InputVideo] = []
         opened_video: bool = False
         for path in self._paths:
             video_name = path.name
             try:
                 assert backend in AVAILABLE_BACKENDS
-                cap = self._backend(str(path))
+                cap, stream = self._open_input(path)
             except VideoOpenFailure:
                 logger.error(f"Error: Couldn't load video {path} with {backend}")
                 raise
@@ -151,6 +280,7 @@ class VideoJoiner:
             # Set the resolution/framerate based on the first video.
             if not opened_video:
                 self._cap = cap
+                self._stream = stream
                 logger.info(
                     "Opened video %s (%d x %d at %2.3f FPS).",
                     video_name,
@@ -175,8 +305,11 @@ class VideoJoiner:
                 logger.warning(
                     "Warning: framerate does not match first input. Timecodes may be incorrect."
                 )
-            if round(cap.capture.get(cv2.CAP_PROP_FOURCC)) == 0:
+            if hasattr(cap, "capture") and round(cap.capture.get(cv2.CAP_PROP_FOURCC)) == 0:
                 unsupported_codec = True
+            # Only the current input is kept open, the others are reopened when we reach them.
+            if stream is not None:
+                stream.close()
 
         self._paths = validated_paths
 
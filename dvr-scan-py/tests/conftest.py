@@ -16,6 +16,7 @@ This file includes all pytest configuration for running DVR-Scan's tests.
 
 import os
 
+import numpy
 import pytest
 
 #
@@ -52,3 +53,24 @@ def traffic_camera_video() -> str:
 def corrupt_video() -> str:
     """Returns path to issue62.mp4 video."""
     return get_absolute_path("resources/issue62.mp4")
+
+
+@pytest.fixture
+def static_camera_video(tmp_path) -> str:
+    """Returns path to a generated video of a static scene, 500 frames at 25 FPS with a keyframe
+    every 50 frames, with a square moving across it from frame 200 to 249. Requires PyAV."""
+    av = pytest.importorskip("av")
+    path = str(tmp_path / "static_camera.mp4")
+    background = numpy.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=numpy.uint8)
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=25)
+        stream.width, stream.height, stream.pix_fmt = 320, 240, "yuv420p"
+        stream.codec_context.gop_size = 50
+        for frame_num in range(500):
+            frame = background.copy()
+            if 200 <= frame_num < 250:
+                x = (frame_num - 200) * 5
+                frame[100:140, x : x + 40] = 255
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(frame, format="bgr24")))
+        container.mux(stream.encode())
+    return path
@@ -0,0 +1,791 @@
+#
+#      DVR-Scan: Video Motion Event Detection & Extraction Tool
+#   --------------------------------------------------------------
+#       [  Site: https://www.dvr-scan.com/                 ]
+#       [  Repo: https://github.com/Breakthrough/DVR-Scan  ]
+#
+# Copyright (C) 2016 Brandon Castellano <http://www.bcastell.com>.
+# DVR-Scan is licensed under the BSD 2-Clause License; see the included
+# LICENSE file, or visit one of the above pages for details.
+#
+"""DVR-Scan Hikvision Tests
+
+Validates the Hikvision disk image parsers against small hand-built images.
+"""
+
+import hashlib
+import io
+import json
+import sqlite3
+import struct
+import threading
+import typing as ty
+
+import pytest
+
+from dvr_scan.hikvision.analyze import AnalysisPipeline
+from dvr_scan.hikvision.carver import CarveScanner
+from dvr_scan.hikvision.case_store import CaseStore
+from dvr_scan.hikvision.catalogue import RecordingCatalogue
+from dvr_scan.hikvision.extractor import VideoExtractor
+from dvr_scan.hikvision.helpers import ImageRangeStream, ImageReader, ProgressReporter, coalesce_ranges
+from dvr_scan.hikvision.hikbtree import HikbtreeParser
+from dvr_scan.hikvision.idr_parser import IdrParser
+from dvr_scan.hikvision.master_sector import MasterSectorParser
+from dvr_scan.hikvision.synthetic import SyntheticImageBuilder, parse_size
+from dvr_scan.hikvision.system_logs import SystemLogParser
+from dvr_scan.hikvision.timeline import GAP_MARKER_UUID, TimelineBuilder, gap_marker
+from dvr_scan.scanner import MotionScanner
+
+BLOCK_SIZE = 64 * 1024
+IDR_TIMESTAMP_BASE = 1700000000
+
+
+def make_idr_record(frame_index: int, channel: int, timestamp: int) -> bytes:
+    record = bytearray(IdrParser.IDR_RECORD_SIZE)
+    record[0:4] = IdrParser.IDR_SIGNATURE
+    struct.pack_into("<I", record, 4, IdrParser.IDR_RECORD_SIZE)
+    struct.pack_into("<I", record, 12, frame_index)
+    struct.pack_into("<B", record, 16, channel)
+    struct.pack_into("<I", record, 24, timestamp)
+    return bytes(record)
+
+
+def make_data_block(
+    num_records: int, channel: int = 1, video_size: int = 4096, start_time: int = IDR_TIMESTAMP_BASE
+) -> bytes:
+    """Builds a data block with `video_size` bytes of video followed by an IDR table, with a
+    keyframe every 1000 bytes of video."""
+    video = bytearray(b"\x00\x00\x00\x01\x67" + b"\xab" * (video_size - 5))
+    for offset in range(1000, video_size - 4, 1000):
+        video[offset : offset + 4] = b"\x00\x00\x00\x01"
+    # A stray signature inside the video must not be mistaken for part of the table.
+    video = bytes(video[:100]) + IdrParser.IDR_SIGNATURE + bytes(video[104:])
+    table = b"".join(
+        make_idr_record(i * 1000, channel, start_time + i) for i in range(num_records)
+    )
+    block = video + table
+    return block + b"\x00" * (BLOCK_SIZE - len(block))
+
+
+@pytest.fixture
+def idr_image(tmp_path):
+    """Returns path to an image containing three data blocks (the middle one has no table)."""
+    path = tmp_path / "idr.dd"
+    blocks = [make_data_block(10), b"\x00" * BLOCK_SIZE, make_data_block(25, channel=3)]
+    path.write_bytes(b"".join(blocks))
+    return str(path)
+
+
+def test_idr_parse_single_block(idr_image):
+    """Test parsing the IDR table of a single data block."""
+    reader = ImageReader(idr_image)
+    reader.open()
+    try:
+        records = IdrParser(reader).parse_single_data_block(0, BLOCK_SIZE)
+    finally:
+        reader.close()
+    assert len(records) == 10
+    assert records[0]["address"] == 4096
+    assert records[-1]["address"] == 4096 + 9 * IdrParser.IDR_RECORD_SIZE
+    assert [r["frame_index"] for r in records] == [i * 1000 for i in range(10)]
+    assert all(r["channel"] == 1 for r in records)
+    assert records[3]["timestamp_unix"] == IDR_TIMESTAMP_BASE + 3
+
+
+def test_idr_parse_data_blocks(idr_image):
+    """Test the batch API returns the same tables as parsing each block individually."""
+    reader = ImageReader(idr_image)
+    reader.open()
+    try:
+        parser = IdrParser(reader)
+        block_addrs = [2 * BLOCK_SIZE, 0, BLOCK_SIZE]
+        tables = parser.parse_data_blocks(block_addrs, BLOCK_SIZE)
+        assert tables[BLOCK_SIZE] is None
+        for addr in (0, 2 * BLOCK_SIZE):
+            table_addr, records = tables[addr]
+            expected_addr, expected = parser.read_table(addr, BLOCK_SIZE)
+            assert table_addr == expected_addr == addr + 4096
+            assert (records == expected).all()
+        summary = IdrParser.summarize_table(tables[2 * BLOCK_SIZE][1])
+        assert summary == {
+            "record_count": 25,
+            "start_time": IDR_TIMESTAMP_BASE,
+            "end_time": IDR_TIMESTAMP_BASE + 24,
+            "channels": [3],
+        }
+    finally:
+        reader.close()
+
+
+def test_idr_parse_data_blocks_read_error(idr_image):
+    """Test a block which can't be read is skipped without losing the others read with it."""
+
+    class FailingReader(ImageReader):
+        def read(self, offset, size):
+            if offset + size > 2 * BLOCK_SIZE:
+                raise OSError("bad chunk")
+            return super().read(offset, size)
+
+    reader = FailingReader(idr_image)
+    reader.open()
+    try:
+        tables = IdrParser(reader).parse_data_blocks([0, BLOCK_SIZE, 2 * BLOCK_SIZE], BLOCK_SIZE)
+        assert tables[0] is not None
+        assert tables[BLOCK_SIZE] is None
+        assert tables[2 * BLOCK_SIZE] is None
+    finally:
+        reader.close()
+
+
+def test_coalesce_ranges():
+    """Test merging of nearby byte ranges into larger reads."""
+    ranges = [(100, 200, "b"), (0, 50, "a"), (1000, 1100, "c")]
+    runs = coalesce_ranges(ranges, max_gap=60, max_size=10000)
+    assert [(start, end) for start, end, _ in runs] == [(0, 200), (1000, 1100)]
+    assert [tag for _, _, tag in runs[0][2]] == ["a", "b"]
+    # Runs are split once they would exceed the maximum read size.
+    runs = coalesce_ranges(ranges, max_gap=60, max_size=150)
+    assert len(runs) == 3
+
+
+def make_hikbtree_entry(channel: int, start_time: int, end_time: int, block_offset: int) -> dict:
+    """Builds a page entry in the form written to hikbtree.json."""
+    return {
+        "existence": "Has Video Data",
+        "channel": channel,
+        "start_time": {"value": start_time},
+        "end_time": {"value": end_time},
+        "data_block_offset": hex(block_offset),
+    }
+
+
+def test_catalogue_locate(tmp_path):
+    """Test building a catalogue and querying the byte ranges for a time range."""
+    image = tmp_path / "catalogue.dd"
+    # The IDR table of the channel 4 block lists keyframes past the end of its video.
+    image.write_bytes(
+        make_data_block(10, channel=2, video_size=16000) + make_data_block(5) + make_data_block(10, channel=4)
+    )
+    hikbtree_data = {
+        "pages": {
+            "page_1": {
+                "entries": [
+                    make_hikbtree_entry(2, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 9, 0),
+                    make_hikbtree_entry(1, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 4, BLOCK_SIZE),
+                    make_hikbtree_entry(4, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 9, 2 * BLOCK_SIZE),
+                ]
+            }
+        }
+    }
+    reader = ImageReader(str(image))
+    reader.open()
+    catalogue = RecordingCatalogue(str(tmp_path / "catalogue.db"))
+    try:
+        counts = catalogue.build(reader, hikbtree_data, BLOCK_SIZE)
+        assert counts == {"blocks": 3, "video_blocks": 3, "keyframes": 15, "unverified_blocks": 1}
+        # Keyframes are 1 second and 1000 bytes apart, so seconds 3 to 6 span keyframes 3 up to 7.
+        ranges = catalogue.locate(2, IDR_TIMESTAMP_BASE + 3, IDR_TIMESTAMP_BASE + 6)
+        assert len(ranges) == 1
+        assert (ranges[0]["start"], ranges[0]["end"]) == (3000, 7000)
+        # A range running past the last keyframe ends where the IDR table starts.
+        ranges = catalogue.locate(2, IDR_TIMESTAMP_BASE + 8, IDR_TIMESTAMP_BASE + 100)
+        assert (ranges[0]["start"], ranges[0]["end"]) == (8000, 16000)
+        assert catalogue.locate(3, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 100) == []
+        # Keyframes which can't be verified aren't used, the whole video of the block is carved.
+        ranges = catalogue.locate(4, IDR_TIMESTAMP_BASE + 3, IDR_TIMESTAMP_BASE + 6)
+        assert (ranges[0]["start"], ranges[0]["end"]) == (2 * BLOCK_SIZE, 2 * BLOCK_SIZE + 4096)
+    finally:
+        catalogue.close()
+        reader.close()
+
+
+def test_timeline(tmp_path):
+    """Test a channel is stitched in keyframe order, with a marker where recording stopped."""
+    # Three channel 2 blocks: the block at offset 0 was recorded last, and there is a
+    # 91 second gap between the last two. The HIKBTREE times are deliberately misleading.
+    blocks = [
+        make_data_block(10, channel=2, video_size=10000, start_time=IDR_TIMESTAMP_BASE + 110),
+        make_data_block(10, channel=2, video_size=10000),
+        make_data_block(5, channel=1),
+        make_data_block(10, channel=2, video_size=10000, start_time=IDR_TIMESTAMP_BASE + 10),
+    ]
+    # Junk ahead of the first start code is dropped. It also hides the first keyframe, so the
+    # block is carved whole.
+    blocks[3] = b"\xff" * 7 + blocks[3][:5] + blocks[3][12:]
+    image = tmp_path / "timeline.dd"
+    image.write_bytes(b"".join(blocks))
+    entries = [
+        make_hikbtree_entry(2, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 119, 0),
+        make_hikbtree_entry(2, IDR_TIMESTAMP_BASE + 1, IDR_TIMESTAMP_BASE + 9, BLOCK_SIZE),
+        make_hikbtree_entry(1, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 4, 2 * BLOCK_SIZE),
+        make_hikbtree_entry(2, IDR_TIMESTAMP_BASE + 10, IDR_TIMESTAMP_BASE + 19, 3 * BLOCK_SIZE),
+    ]
+    reader = ImageReader(str(image))
+    reader.open()
+    catalogue = RecordingCatalogue(str(tmp_path / "catalogue.db"))
+    try:
+        catalogue.build(reader, {"pages": {"page_1": {"entries": entries}}}, BLOCK_SIZE)
+        ranges = catalogue.locate(2, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 200)
+        assert [rng["start"] for rng in ranges] == [BLOCK_SIZE, 3 * BLOCK_SIZE, 0]
+
+        output = tmp_path / "ch02.h264"
+        summary = TimelineBuilder(reader, chunk_size=3000, workers=2).build(ranges, str(output))
+        data = output.read_bytes()
+        marker = gap_marker(IDR_TIMESTAMP_BASE + 19, IDR_TIMESTAMP_BASE + 110)
+        assert [segment["output_offset"] for segment in summary["segments"]] == [0, 10000, 19993 + len(marker)]
+        assert len(summary["gaps"]) == 1
+        assert summary["gaps"][0]["output_offset"] == 19993
+        assert summary["gaps"][0]["duration_seconds"] == 91
+        assert data.find(GAP_MARKER_UUID) == 19993 + 7
+        assert data[:10000] == blocks[1][:10000]
+        assert data[10000:19993] == blocks[3][7:10000]
+        assert data[19993:19993 + len(marker)] == marker
+        assert data[19993 + len(marker):] == blocks[0][:10000]
+        assert summary["output_size"] == len(data)
+        assert summary["hashes"] == {"sha256": hashlib.sha256(data).hexdigest()}
+        assert summary["segments"][1]["hashes"]["sha256"] == hashlib.sha256(blocks[3][:10000]).hexdigest()
+    finally:
+        catalogue.close()
+        reader.close()
+
+
+def test_timeline_read_error(tmp_path):
+    """Test a failed read is raised without leaving the hashing threads of any segment running."""
+
+    class FailingReader:
+        def read(self, addr, size):
+            if addr >= 2 * BLOCK_SIZE:
+                raise OSError("bad sector")
+            return b"\x00\x00\x00\x01" + b"\xab" * (size - 4)
+
+    ranges = [
+        {
+            "start": i * BLOCK_SIZE,
+            "end": i * BLOCK_SIZE + 8000,
+            "start_time": {"value": IDR_TIMESTAMP_BASE + 10 * i},
+            "end_time": {"value": IDR_TIMESTAMP_BASE + 10 * i + 9},
+        }
+        for i in range(4)
+    ]
+    threads = threading.active_count()
+    with pytest.raises(OSError):
+        TimelineBuilder(FailingReader(), workers=2).build(ranges, str(tmp_path / "ch01.h264"))
+    assert threading.active_count() == threads
+
+
+def test_case_multi_disk(tmp_path):
+    """Test catalogues of the disks of a case merge into one timeline spanning every disk."""
+    # The second disk holds the earlier recording of channel 2.
+    disks = [
+        [make_data_block(5, channel=1), make_data_block(10, channel=2, video_size=10000, start_time=IDR_TIMESTAMP_BASE + 10)],
+        [make_data_block(10, channel=2, video_size=10000)],
+    ]
+    channels = [[1, 2], [2]]
+    catalogue_paths = []
+    for disk, blocks in enumerate(disks):
+        image = tmp_path / f"disk{disk}.dd"
+        image.write_bytes(b"".join(blocks))
+        entries = [make_hikbtree_entry(channel, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 19, i * BLOCK_SIZE)
+                   for i, channel in enumerate(channels[disk])]
+        reader = ImageReader(str(image))
+        reader.open()
+        catalogue_paths.append(str(tmp_path / f"disk{disk}.db"))
+        catalogue = RecordingCatalogue(catalogue_paths[-1])
+        try:
+            catalogue.build(reader, {"pages": {"page_1": {"entries": entries}}}, BLOCK_SIZE)
+        finally:
+            catalogue.close()
+            reader.close()
+
+    catalogue = RecordingCatalogue(str(tmp_path / "case_catalogue.db"))
+    readers = {}
+    try:
+        assert catalogue.merge(catalogue_paths) == {"disks": 2, "blocks": 3, "keyframes": 25}
+        ranges = catalogue.locate(2, IDR_TIMESTAMP_BASE, IDR_TIMESTAMP_BASE + 100)
+        assert [(rng["disk"], rng["start"]) for rng in ranges] == [(1, 0), (0, BLOCK_SIZE)]
+        assert [rng["image"] for rng in ranges] == [str(tmp_path / "disk1.dd"), str(tmp_path / "disk0.dd")]
+
+        for rng in ranges:
+            readers[rng["image"]] = ImageReader(rng["image"])
+            readers[rng["image"]].open()
+        output = tmp_path / "ch02.h264"
+        summary = TimelineBuilder(readers[ranges[0]["image"]], readers=readers).build(ranges, str(output))
+        assert output.read_bytes() == disks[1][0][:10000] + disks[0][1][:10000]
+        assert [segment["disk"] for segment in summary["segments"]] == [1, 0]
+        assert summary["gaps"] == []
+    finally:
+        catalogue.close()
+        for reader in readers.values():
+            reader.close()
+
+
+def make_hikbtree(base: int, num_pages: int, entries_per_page: int) -> ty.Dict[int, bytes]:
+    """Builds a HIKBTREE at address `base`, returning a map of address to bytes to write."""
+    page_list_addr = base + 0x1000
+    pages_addr = page_list_addr + 0x80 + 48 * num_pages
+    pages_addr += -pages_addr % 0x1000
+    footer_addr = pages_addr + 0x1000 * num_pages
+    header = bytearray(256)
+    header[0:8] = HikbtreeParser.HIKBTREE_SIGNATURE
+    struct.pack_into("<IQ", header, 44, IDR_TIMESTAMP_BASE, footer_addr)
+    struct.pack_into("<QQ", header, 64, page_list_addr, pages_addr)
+    page_list = bytearray(80 + 48 * num_pages)
+    struct.pack_into("<I", page_list, 0, num_pages)
+    writes = {base: bytes(header)}
+    for page in range(num_pages):
+        page_addr = pages_addr + 0x1000 * page
+        struct.pack_into("<Q", page_list, 80 + 48 * page, page_addr)
+        content = bytearray(0x1000)
+        struct.pack_into("<Q", content, 16, 0xFFFFFFFFFFFFFFFF if page == num_pages - 1 else 0)
+        for i in range(entries_per_page):
+            entry_offset = 80 + 48 * i
+            content[entry_offset : entry_offset + 8] = b"\xff" * 8
+            block = page * entries_per_page + i
+            struct.pack_into("<B", content, entry_offset + 17, 1 + block % 4)
+            struct.pack_into("<II", content, entry_offset + 24, IDR_TIMESTAMP_BASE + block * 60,
+                             IDR_TIMESTAMP_BASE + block * 60 + 59)
+            struct.pack_into("<Q", content, entry_offset + 32, 0x10000000 + block * BLOCK_SIZE)
+        writes[page_addr] = bytes(content)
+    writes[page_list_addr] = bytes(page_list)
+    writes[footer_addr] = b"\xff" * 8 + struct.pack("<Q", pages_addr + 0x1000 * (num_pages - 1))
+    return writes
+
+
+def parse_hikbtree(tmp_path, num_pages: int, entries_per_page: int, case_store=None) -> str:
+    """Writes a HIKBTREE image and parses it, returning the path of the JSON output."""
+    image = tmp_path / "hikbtree.dd"
+    with open(image, "wb") as f:
+        for addr, data in make_hikbtree(0x2000, num_pages, entries_per_page).items():
+            f.seek(addr)
+            f.write(data)
+    master_file = tmp_path / "master_sector.json"
+    master_file.write_text(json.dumps({"master_sector": {"hikbtree1_offset": {"value": 0x2000}}}))
+    output_file = tmp_path / "out" / "hikbtree.json"
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        assert HikbtreeParser(reader).run_parser(str(master_file), str(output_file), case_store=case_store)
+    finally:
+        reader.close()
+    return str(output_file)
+
+
+def test_hikbtree_large_page_list(tmp_path):
+    """Test a HIKBTREE with more pages than fit in the old fixed-size page list read."""
+    num_pages, entries_per_page = 300, 5
+    output_file = parse_hikbtree(tmp_path, num_pages, entries_per_page)
+    with open(output_file) as f:
+        result = json.load(f)
+    assert result["page_list_summary"]["total_pages"]["value"] == num_pages
+    assert len(result["pages"]) == num_pages
+    assert all(len(page["entries"]) == entries_per_page for page in result["pages"].values())
+    assert result["pages"][f"page_{num_pages}"]["is_last_page"]
+    last_entry = result["pages"][f"page_{num_pages}"]["entries"][-1]
+    assert last_entry["data_block_offset"] == hex(0x10000000 + (num_pages * entries_per_page - 1) * BLOCK_SIZE)
+    assert "footer" in result and "image_info" in result
+
+
+def test_hikbtree_write_error(tmp_path):
+    """Test a HIKBTREE whose pages fail partway through writing doesn't leave a partial output."""
+
+    class FailingCaseStore:
+        def store_hikbtree_pages(self, pages):
+            yield next(pages)
+            raise sqlite3.OperationalError("database is locked")
+
+    with pytest.raises(sqlite3.OperationalError):
+        parse_hikbtree(tmp_path, 4, 5, case_store=FailingCaseStore())
+    assert not (tmp_path / "out" / "hikbtree.json").exists()
+    assert not (tmp_path / "out" / "hikbtree.json.tmp").exists()
+
+
+def test_case_store_query(tmp_path):
+    """Test paginated and filtered queries against the case database."""
+    case_store = CaseStore(str(tmp_path / "case.db"))
+    try:
+        parse_hikbtree(tmp_path, num_pages=4, entries_per_page=10, case_store=case_store)
+        result = case_store.query("entries", limit=15)
+        assert result["total"] == 40
+        assert len(result["rows"]) == 15
+        assert result["rows"][0]["data_block_offset"] == hex(0x10000000)
+        # Blocks are assigned to channels 1-4 in turn and each covers one minute.
+        result = case_store.query("entries", channel=2, start_time=IDR_TIMESTAMP_BASE + 600, limit=3, offset=1)
+        assert result["total"] == 7
+        assert [row["start_time"]["value"] for row in result["rows"]] == [
+            IDR_TIMESTAMP_BASE + 60 * block for block in (17, 21, 25)
+        ]
+        assert case_store.query("pages", page_number=4)["rows"][0]["is_last_page"]
+
+        case_store.store_logs([
+            {"entry_number": i + 1, "address": 0x1000 + 64 * i, "timestamp_unix": IDR_TIMESTAMP_BASE + i,
+             "log_type_code": 1 + i % 2, "description": {"parsed_type": "Motion Alarm"}}
+            for i in range(10)
+        ])
+        result = case_store.query("logs", log_type=1, end_time=IDR_TIMESTAMP_BASE + 5)
+        assert [row["entry_number"] for row in result["rows"]] == [1, 3, 5]
+        assert result["rows"][0]["log_type_name"].startswith("Alarm")
+    finally:
+        case_store.close()
+
+
+def make_log_entry(timestamp: int, log_type: int, body: bytes) -> bytes:
+    return SystemLogParser.SYSTEM_LOG_SIGNATURE + struct.pack("<IH", timestamp, log_type) + body
+
+
+def test_system_logs_windowed(tmp_path):
+    """Test entries spanning scan window boundaries are parsed the same as in one window."""
+    region = b"\x11" * 100 + b"".join(
+        make_log_entry(IDR_TIMESTAMP_BASE + i, 1 + i % 4, b"admin" + bytes(37 * i % 300)) for i in range(200)
+    )
+    image = tmp_path / "logs.dd"
+    image.write_bytes(b"\x00" * 512 + region)
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        parser = SystemLogParser(reader)
+        expected = list(parser.iter_log_entries(512, len(region)))
+        parser = SystemLogParser(reader)
+        parser.WINDOW_SIZE = 1000
+        entries = list(parser.iter_log_entries(512, len(region)))
+        assert parser.analysis_results["log_header_info"]["size_bytes"] == 100
+        parser = SystemLogParser(reader, include_previews=False)
+        parser.MAX_ENTRY_SIZE = 64
+        capped = list(parser.iter_log_entries(512, len(region)))
+    finally:
+        reader.close()
+    assert len(expected) == 200
+    assert entries == expected
+    assert entries[5]["address"] == 512 + 100 + sum(14 + 5 + 37 * i % 300 for i in range(5))
+    assert entries[6]["description"]["parsed_type"] == "User Login"
+    assert [entry["timestamp_unix"] for entry in capped] == [entry["timestamp_unix"] for entry in expected]
+    assert capped[5]["description"]["raw_hex_preview"] is None
+
+
+def test_carve_scan(tmp_path):
+    """Test the signature sweep finds every structure, including ones on chunk boundaries."""
+    chunk_size = 64 * 1024
+    image = bytearray(6 * chunk_size)
+    image[0x1000:0x1008] = HikbtreeParser.HIKBTREE_SIGNATURE
+    block = make_data_block(10)
+    # A data block straddling the first chunk boundary, with a start code split across it.
+    image[chunk_size - 2 : chunk_size - 2 + len(block)] = block
+    logs = b"".join(make_log_entry(IDR_TIMESTAMP_BASE + i, 1, b"admin" + bytes(50)) for i in range(20))
+    image[4 * chunk_size + 100 : 4 * chunk_size + 100 + len(logs)] = logs
+    image[5 * chunk_size - 3 : 5 * chunk_size + 2] = b"\x00\x00\x00\x01\x65"
+    path = tmp_path / "carve.dd"
+    path.write_bytes(bytes(image))
+
+    reader = ImageReader(str(path))
+    reader.open()
+    case_store = CaseStore(str(tmp_path / "case.db"))
+    try:
+        for workers in (1, 2):
+            summary = CarveScanner(reader, chunk_size=chunk_size, workers=workers).run(case_store)
+            assert summary["bytes_scanned"] == len(image)
+            hits = {kind: (counts["runs"], counts["hits"]) for kind, counts in summary["hits"].items()}
+            assert hits == {
+                "hikbtree": (1, 1),
+                "idr_table": (1, 10),
+                "system_log": (1, 20),
+                "h264_sps": (1, 1),
+                "h264_idr": (1, 1),
+            }
+            rows = case_store.query("carve", kind="idr_table")["rows"]
+            assert rows[0]["start"] == chunk_size - 2 + 4096
+            assert rows[0]["size_bytes"] == 10 * IdrParser.IDR_RECORD_SIZE
+            assert case_store.query("carve", kind="h264_sps")["rows"][0]["start"] == chunk_size - 2
+    finally:
+        case_store.close()
+        reader.close()
+
+
+def make_annexb_video(path: str) -> bytes:
+    """Remuxes an MP4 test video into a raw H.264 (Annex B) stream, like a DVR records."""
+    av = pytest.importorskip("av")
+    output = bytearray()
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        bsf = av.bitstream.BitStreamFilterContext("h264_mp4toannexb", stream)
+        for packet in container.demux(stream):
+            for filtered in bsf.filter(packet):
+                output += bytes(filtered)
+        for filtered in bsf.filter(None):
+            output += bytes(filtered)
+    return bytes(output)
+
+
+def test_scan_image_stream(tmp_path, traffic_camera_video):
+    """Test scanning video carved straight from an image matches scanning the extracted file."""
+    video = make_annexb_video(traffic_camera_video)
+    junk = b"\xAB" * 5000
+    path = tmp_path / "video.dd"
+    path.write_bytes(junk + video + bytes(3000))
+    reader = ImageReader(str(path))
+    reader.open()
+    try:
+        with ImageRangeStream(reader, 1000, 1000 + len(video), chunk_size=4096, prefetch=2) as stream:
+            assert stream.read(10000) == (junk + video)[1000:11000]
+            stream.seek(len(video) - 100)
+            assert stream.read() == (junk + video)[len(video) - 100 + 1000:len(video) + 1000]
+            stream.seek(20)
+            assert stream.read(5000) == (junk + video)[1020:6020]
+
+        extractor = VideoExtractor(reader, output_dir=str(tmp_path))
+        success, extracted = extractor.extract_range(0, len(junk) + len(video), "block")
+        assert success
+
+        def scan(input_video, input_mode, two_pass=False):
+            scanner = MotionScanner([input_video], input_mode=input_mode, two_pass=two_pass)
+            return [(event.start.frame_num, event.end.frame_num) for event in scanner.scan().event_list]
+
+        stream_input = extractor.stream_input(0, len(junk) + len(video), "block")
+        events = scan(stream_input, "pyav")
+        assert events
+        # Raw H.264 has no timestamps, frames must still be timed like the extracted file.
+        assert events == scan(extracted, "opencv")
+        # Frames can't be dropped in the decoder for carved inputs, so they're scanned in one pass.
+        assert events == scan(stream_input, "pyav", two_pass=True)
+    finally:
+        reader.close()
+
+
+def test_extract_remux(tmp_path, traffic_camera_video):
+    """Test remuxing a block to MP4/MKV, timestamped from its IDR table, without re-encoding."""
+    av = pytest.importorskip("av")
+    video = make_annexb_video(traffic_camera_video)
+    with av.open(io.BytesIO(video), format="h264") as container:
+        keyframe_offsets = [packet.pos for packet in container.demux(video=0) if packet.is_keyframe]
+    # The IDR records say each GOP started 3 seconds after the previous one.
+    table = b"".join(
+        make_idr_record(100 + offset, 1, IDR_TIMESTAMP_BASE + 3 * i)
+        for i, offset in enumerate(keyframe_offsets)
+    )
+    block = b"\xff" * 100 + video + table
+    image = tmp_path / "remux.dd"
+    image.write_bytes(block + bytes(1000))
+    master_file = tmp_path / "master_sector.json"
+    master_file.write_text(json.dumps({"master_sector": {"data_block_size": {"value": len(block)}}}))
+
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        extractor = VideoExtractor(reader, output_dir=str(tmp_path))
+        for container_format in ("mp4", "mkv"):
+            success, path = extractor.extract_single_block("0x0", str(master_file), container=container_format)
+            assert success and path.endswith(f".{container_format}")
+            with av.open(path) as container:
+                frames = [(frame.time, frame.key_frame) for frame in container.decode(video=0)]
+            assert len(frames) == 576
+            times = [time for time, _ in frames]
+            assert times == sorted(times)
+            keyframe_times = [time for time, key_frame in frames if key_frame]
+            assert keyframe_times == pytest.approx([3 * i for i in range(len(keyframe_offsets))], abs=0.1)
+            # Seeking lands on the last keyframe before the target.
+            with av.open(path) as container:
+                stream = container.streams.video[0]
+                container.seek(int(7 / stream.time_base), stream=stream)
+                assert next(container.decode(stream)).time == pytest.approx(6, abs=0.1)
+    finally:
+        reader.close()
+
+
+def test_extract_hashes(tmp_path):
+    """Test the source range and output are hashed while carving, and recorded in the case store."""
+    block = make_data_block(10, video_size=20000)
+    # Junk ahead of the first start code is part of the source, but not the output.
+    block = b"\xee" * 3000 + block[: BLOCK_SIZE - 3000]
+    image = tmp_path / "hashes.dd"
+    image.write_bytes(b"\x00" * BLOCK_SIZE + block)
+    master_file = tmp_path / "master_sector.json"
+    master_file.write_text(json.dumps({"master_sector": {"data_block_size": {"value": BLOCK_SIZE}}}))
+
+    reader = ImageReader(str(image))
+    reader.open()
+    case_store = CaseStore(str(tmp_path / "case.db"))
+    try:
+        extractor = VideoExtractor(reader, output_dir=str(tmp_path), hash_algorithms=("sha256", "md5"))
+        # A small chunk size so the source and output span several chunks.
+        extractor.COPY_CHUNK_SIZE = 4096
+        success, path = extractor.extract_single_block(hex(BLOCK_SIZE), str(master_file))
+        assert success
+        source = block[:23000]
+        output = source[3000:]
+        with open(path, "rb") as f:
+            assert f.read() == output
+        hashes = extractor.hashes[path]
+        assert (hashes["source_start"], hashes["source_end"]) == (BLOCK_SIZE, BLOCK_SIZE + 23000)
+        assert hashes["source"] == {
+            "sha256": hashlib.sha256(source).hexdigest(),
+            "md5": hashlib.md5(source).hexdigest(),
+        }
+        assert hashes["output"]["sha256"] == hashlib.sha256(output).hexdigest()
+        assert hashes["output_size"] == len(output)
+
+        case_store.store_export(path, "extract", hashes)
+        rows = case_store.query("exports", kind="extract")["rows"]
+        assert len(rows) == 1
+        assert rows[0]["output_sha256"] == hashlib.sha256(output).hexdigest()
+        assert rows[0]["source_md5"] == hashlib.md5(source).hexdigest()
+    finally:
+        case_store.close()
+        reader.close()
+
+
+def test_extract_write_error(tmp_path):
+    """Test a carve which can't be written fails without leaving its hashing threads running."""
+    image = tmp_path / "image.dd"
+    image.write_bytes(make_data_block(10))
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        # The output file can't be opened if a directory is in its place.
+        (tmp_path / "block.h264").mkdir()
+        extractor = VideoExtractor(reader, output_dir=str(tmp_path))
+        threads = threading.active_count()
+        assert extractor.extract_range(0, 4096, "block") == (False, None)
+        assert threading.active_count() == threads
+    finally:
+        reader.close()
+
+
+def make_master_sector(logs_offset: int, logs_size: int, hikbtree_offset: int) -> bytes:
+    """Builds a master sector (starting at its signature) pointing at the given regions."""
+    sector = bytearray(512)
+    sig_len = len(MasterSectorParser.FILESYSTEM_SIGNATURE)
+    sector[0:sig_len] = MasterSectorParser.FILESYSTEM_SIGNATURE
+    struct.pack_into("<Q", sector, sig_len + 38, 1 << 40)
+    struct.pack_into("<QQ", sector, sig_len + 62, logs_offset, logs_size)
+    struct.pack_into("<QQI", sector, sig_len + 102, 0x10000000, BLOCK_SIZE, 1000)
+    struct.pack_into("<QI", sector, sig_len + 118, hikbtree_offset, 0x100000)
+    struct.pack_into("<I", sector, sig_len + 210, IDR_TIMESTAMP_BASE)
+    return bytes(sector)
+
+
+def test_analyze_pipeline(tmp_path):
+    """Test the one-shot pipeline matches the individual commands, and caches its results."""
+    extra_offset = 0x100
+    logs = b"".join(make_log_entry(IDR_TIMESTAMP_BASE + i, 1 + i % 4, b"admin" + bytes(20)) for i in range(50))
+    writes = make_hikbtree(0x2000, 3, 4)
+    writes[0x200] = make_master_sector(0x80000, len(logs), 0x2000)
+    writes[0x80000] = logs
+    image = tmp_path / "analyze.dd"
+    with open(image, "wb") as f:
+        for addr, data in writes.items():
+            f.seek(addr + extra_offset)
+            f.write(data)
+
+    stages = []
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        pipeline = AnalysisPipeline(reader, str(tmp_path / "case"), case_db=str(tmp_path / "case" / "case.db"),
+                                    on_stage=lambda stage, success, _: stages.append((stage, success)))
+        summary = pipeline.run()
+        assert summary["success"] and not summary["cached"]
+        assert summary["extra_offset"] == extra_offset
+        assert sorted(stages) == [("hikbtree", True), ("logs", True), ("master", True)]
+
+        # The individual commands, passing the master sector through JSON, give the same results.
+        master_file = str(tmp_path / "single" / "master_sector.json")
+        assert MasterSectorParser(reader).run_parser(master_file) == extra_offset
+        assert HikbtreeParser(reader).run_parser(master_file, str(tmp_path / "single" / "hikbtree.json"), extra_offset)
+        assert SystemLogParser(reader).run_parser(master_file, str(tmp_path / "single" / "logs.json"), extra_offset)
+        for name, single in (("hikbtree.json", "hikbtree.json"), ("system_logs.json", "logs.json")):
+            with open(tmp_path / "case" / name) as f, open(tmp_path / "single" / single) as g:
+                assert json.load(f) == json.load(g)
+
+        case_store = CaseStore(summary["case_db"])
+        try:
+            assert case_store.query("entries")["total"] == 12
+            assert case_store.query("logs")["total"] == 50
+        finally:
+            case_store.close()
+
+        assert pipeline.run()["cached"]
+        assert not pipeline.run(use_cache=False)["cached"]
+    finally:
+        reader.close()
+
+    # Modifying the image invalidates the cache.
+    with open(image, "r+b") as f:
+        f.seek(0)
+        f.write(b"\x01")
+    reader = ImageReader(str(image))
+    reader.open()
+    try:
+        assert not AnalysisPipeline(reader, str(tmp_path / "case"), case_db=str(tmp_path / "case" / "case.db")).run()["cached"]
+    finally:
+        reader.close()
+
+
+def test_synthetic_image(tmp_path):
+    """Test the parsers and catalogue read back everything a synthetic image was written with."""
+    assert parse_size("4T") == 4 * 1024**4 and parse_size("512") == 512
+    builder = SyntheticImageBuilder(num_pages=2, entries_per_page=4, num_channels=2, data_block_size=1 << 20,
+                                    video_size=16 * 1024, keyframes_per_block=10, num_logs=50, extra_offset=0x100,
+                                    disk_size=parse_size("1T"))
+    info = builder.write(str(tmp_path / "synthetic.dd"))
+    assert info["logical_size"] == 1024**4 and info["allocated_size"] < 64 * 1024**2
+    assert info["blocks"] == 8
+
+    reader = ImageReader(info["path"])
+    reader.open()
+    catalogue = RecordingCatalogue(str(tmp_path / "catalogue.db"))
+    try:
+        summary = AnalysisPipeline(reader, str(tmp_path / "case"), case_db=str(tmp_path / "case" / "case.db")).run()
+        assert summary["success"] and summary["extra_offset"] == 0x100
+        with open(summary["hikbtree_file"]) as f:
+            hikbtree_data = json.load(f)
+        case_store = CaseStore(summary["case_db"])
+        try:
+            assert case_store.query("entries", video_only=True)["total"] == 8
+            assert case_store.query("logs")["total"] == 50
+        finally:
+            case_store.close()
+
+        counts = catalogue.build(reader, hikbtree_data, 1 << 20, 0x100)
+        # Every IDR record must point at a keyframe actually written to its block.
+        assert counts["blocks"] == 8 and counts["keyframes"] == 80 and counts["unverified_blocks"] == 0
+        ranges = catalogue.locate(2, info["start_time"], info["end_time"])
+        assert len(ranges) == 4
+        assert reader.read(ranges[0]["start"], 4) == b"\x00\x00\x00\x01"
+    finally:
+        catalogue.close()
+        reader.close()
+
+
+def test_progress_events(tmp_path):
+    """Test the parsers and extractor report progress against the right totals."""
+    builder = SyntheticImageBuilder(num_pages=3, entries_per_page=4, num_channels=2, data_block_size=1 << 20,
+                                    video_size=64 * 1024, keyframes_per_block=10, num_logs=40)
+    info = builder.write(str(tmp_path / "synthetic.dd"))
+    reader = ImageReader(info["path"])
+    reader.open()
+    try:
+        master = MasterSectorParser(reader)
+        assert master.run_parser(str(tmp_path / "master_sector.json")) == 0
+        events = {"hikbtree": [], "logs": [], "extract": []}
+        progress = {task: ProgressReporter(task, reader, interval=0, emit=events[task].append) for task in events}
+
+        assert HikbtreeParser(reader, progress=progress["hikbtree"]).parse(
+            master.analysis_results, str(tmp_path / "hikbtree.json"))
+        assert SystemLogParser(reader, progress=progress["logs"]).parse(
+            master.analysis_results, str(tmp_path / "logs.json"))
+        extractor = VideoExtractor(reader, output_dir=str(tmp_path / "out"), progress=progress["extract"])
+        assert extractor.extract_single_block(hex(info["video_data_offset"]), str(tmp_path / "master_sector.json"))[0]
+        progress["extract"].finish()
+    finally:
+        reader.close()
+
+    for task, task_events in events.items():
+        assert all(event["type"] == "hik_progress" and event["task"] == task for event in task_events)
+        done = [event["bytes_done"] for event in task_events]
+        assert done == sorted(done)
+        last = task_events[-1]
+        assert last["finished"] and last["percent"] == 100.0 and last["eta_seconds"] == 0
+        assert last["bytes_done"] == last["bytes_total"] and last["io_seconds"] is not None
+    assert events["hikbtree"][-1]["items_done"] == 3 and events["hikbtree"][-1]["entries"] == 12
+    assert events["logs"][-1]["items_done"] == 40
+    assert events["extract"][-1]["items_done"] == 1
+    assert reader.bytes_read > 0
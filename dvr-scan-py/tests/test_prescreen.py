@@ -0,0 +1,48 @@
+#
+#      DVR-Scan: Video Motion Event Detection & Extraction Tool
+#   --------------------------------------------------------------
+#       [  Site: https://www.dvr-scan.com/                 ]
+#       [  Repo: https://github.com/Breakthrough/DVR-Scan  ]
+#
+# Copyright (C) 2016 Brandon Castellano <http://www.bcastell.com>.
+# DVR-Scan is licensed under the BSD 2-Clause License; see the included
+# LICENSE file, or visit one of the above pages for details.
+#
+"""DVR-Scan Pre-Screen Tests
+
+Validates finding windows with motion from the sizes of compressed frames.
+"""
+
+import numpy
+import pytest
+
+from dvr_scan.prescreen import active_windows, prescreen_windows
+from dvr_scan.scanner import MotionScanner, OutputMode
+
+# Frames a square moves across the static camera video in (see conftest.py).
+MOVING_FRAMES = (200, 250)
+
+
+def test_active_windows():
+    """Test runs of activity above the threshold are found, including at either end."""
+    activity = numpy.array([1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 1.0])
+    assert active_windows(activity, 0.5) == [(0, 1), (3, 5), (6, 7)]
+    assert active_windows(activity, 1.0) == []
+
+
+def test_prescreen_windows(static_camera_video):
+    """Test the pre-screen only finds the frames with motion, which a scan of them confirms."""
+    windows = prescreen_windows([static_camera_video])
+    assert len(windows) == 1
+    start, end = windows[0]
+    assert MOVING_FRAMES[0] <= start < end <= MOVING_FRAMES[1]
+
+    scanner = MotionScanner([static_camera_video])
+    scanner.set_output(output_mode=OutputMode.SCAN_ONLY)
+    scanner.set_event_params(min_event_len=4, time_pre_event=0, time_post_event=0)
+    scanner.set_scan_windows(windows, margin_before="1s", margin_after="1s", warmup="1s")
+    result = scanner.scan()
+    assert result.num_frames < 200
+    assert len(result.event_list) == 1
+    event = result.event_list[0]
+    assert MOVING_FRAMES[0] <= event.start.frame_num < event.end.frame_num <= MOVING_FRAMES[1] + 1
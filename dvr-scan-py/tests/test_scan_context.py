@@ -16,11 +16,19 @@ Validates functionality of the motion scanning context using various parameters.
 import platform
 import typing as ty
 
+import numpy
 import pytest
 
+from dvr_scan.detector import DuplicateFilter, MotionGate
 from dvr_scan.region import Point
 from dvr_scan.scanner import DetectorType, MotionScanner
-from dvr_scan.subtractor import SubtractorCNT, SubtractorCudaMOG2
+from dvr_scan.subtractor import (
+    SubtractorCNT,
+    SubtractorCudaMOG2,
+    SubtractorMOG2,
+    SubtractorMOG2Tiled,
+    SubtractorRunningAverage,
+)
 
 MACHINE_ARCH = platform.machine().upper()
 
@@ -128,6 +136,210 @@ def test_scan_context_cuda(traffic_camera_video):
     compare_event_lists(event_list, TRAFFIC_CAMERA_EVENTS, CUDA_EVENT_TOLERANCE)
 
 
+def test_scan_context_tiled(traffic_camera_video):
+    """Test the tiled MOG2 subtractor finds the same events as MOG2."""
+    scanner = MotionScanner([traffic_camera_video])
+    scanner.set_detection_params(detector_type=DetectorType.MOG2_TILED, tile_count=3)
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    event_list = scanner.scan().event_list
+    event_list = [(event.start.frame_num, event.end.frame_num) for event in event_list]
+    compare_event_lists(event_list, TRAFFIC_CAMERA_EVENTS, EVENT_FRAME_TOLERANCE)
+
+
+def test_tiled_subtractor_seams():
+    """Test tiles are stitched so the filtered mask matches MOG2 exactly, including at seams."""
+    rng = numpy.random.default_rng(0)
+    background = rng.integers(0, 255, (240, 320, 3), dtype=numpy.uint8)
+    for kernel_size in (0, 3, 7):
+        mog2 = SubtractorMOG2(kernel_size=kernel_size)
+        tiled = SubtractorMOG2Tiled(kernel_size=kernel_size, tiles=4)
+        for i in range(20):
+            frame = background.copy()
+            # Move a noisy block across the tile boundaries (every 60 rows).
+            frame[10 + 8 * i : 80 + 8 * i, 40:200] = rng.integers(0, 255, (70, 160, 3), dtype=numpy.uint8)
+            assert numpy.array_equal(tiled.apply(frame), mog2.apply(frame))
+
+
+def test_scan_context_avg(traffic_camera_video):
+    """Test the running average subtractor finds every event MOG2 does."""
+    scanner = MotionScanner([traffic_camera_video])
+    scanner.set_detection_params(detector_type=DetectorType.AVG)
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    event_list = scanner.scan().event_list
+    assert len(event_list) == len(TRAFFIC_CAMERA_EVENTS)
+    # Events may start a few frames later than with MOG2, but must overlap the same motion.
+    for event, (start, end) in zip(event_list, TRAFFIC_CAMERA_EVENTS):
+        assert event.start.frame_num < end and event.end.frame_num > start
+
+
+def test_running_average_learning_rate():
+    """Test a learning rate of 1 differences consecutive frames and 0 keeps the first frame."""
+    frames = [numpy.full((48, 64, 3), value, dtype=numpy.uint8) for value in (0, 100, 100)]
+    frame_difference = SubtractorRunningAverage(kernel_size=0, learning_rate=1)
+    static_background = SubtractorRunningAverage(kernel_size=0, learning_rate=0)
+    masks = [(frame_difference.apply(f), static_background.apply(f)) for f in frames]
+    # The first frame only initializes the background.
+    assert not masks[0][0].any() and not masks[0][1].any()
+    assert masks[1][0].all() and masks[1][1].all()
+    assert not masks[2][0].any() and masks[2][1].all()
+
+
+def test_scan_context_cascade_gate(traffic_camera_video):
+    """Test the cascade gate skips quiet frames without missing any events."""
+    scanner = MotionScanner([traffic_camera_video])
+    scanner.set_detection_params(cascade_gate=True)
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    result = scanner.scan()
+    assert result.num_frames_gated > result.num_frames // 2
+    assert len(result.event_list) == len(TRAFFIC_CAMERA_EVENTS)
+    # Events can start a few frames late, as small changes don't open the gate.
+    for event, (start, end) in zip(result.event_list, TRAFFIC_CAMERA_EVENTS):
+        assert start <= event.start.frame_num <= start + 10
+        assert event.end.frame_num == end
+
+
+def test_scan_context_adaptive_frame_skip(traffic_camera_video):
+    """Test adaptive frame skip goes back over skipped frames so no events are missed."""
+    scanner = MotionScanner([traffic_camera_video], adaptive_frame_skip=4)
+    scanner.set_detection_params()
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    result = scanner.scan()
+    assert result.num_frames == TRAFFIC_CAMERA_EVENTS[-1][1]
+    assert len(result.event_list) == len(TRAFFIC_CAMERA_EVENTS)
+    # The background model sees fewer frames while skipping, so events can start a few frames late.
+    for event, (start, end) in zip(result.event_list, TRAFFIC_CAMERA_EVENTS):
+        assert start <= event.start.frame_num <= start + 10
+        assert event.end.frame_num == end
+    with pytest.raises(ValueError):
+        MotionScanner([traffic_camera_video], frame_skip=1, adaptive_frame_skip=4)
+
+
+def test_scan_context_decoder_skip(traffic_camera_video):
+    """Test dropping non-reference frames in the decoder keeps events in the same place."""
+    pytest.importorskip("av")
+    scanner = MotionScanner([traffic_camera_video], decoder_skip="nonref")
+    scanner.set_detection_params()
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    result = scanner.scan()
+    assert result.num_frames == TRAFFIC_CAMERA_EVENTS[-1][1]
+    assert len(result.event_list) == len(TRAFFIC_CAMERA_EVENTS)
+    # Events can start or end a frame or two later, as the frames around them may be dropped.
+    for event, (start, end) in zip(result.event_list, TRAFFIC_CAMERA_EVENTS):
+        assert start <= event.start.frame_num <= start + 2
+        assert end <= event.end.frame_num <= end + 2
+
+
+def test_scan_context_two_pass(static_camera_video):
+    """Test a two-pass scan only decodes around keyframes with motion, without changing events."""
+    events = []
+    for two_pass in (False, True):
+        scanner = MotionScanner([static_camera_video], two_pass=two_pass)
+        scanner.set_event_params(min_event_len=4, time_pre_event=0, time_post_event=0)
+        result = scanner.scan()
+        events.append([(event.start.frame_num, event.end.frame_num) for event in result.event_list])
+    assert (200, 250) in events[0]
+    assert events[1] == events[0]
+    assert result.num_frames < 250
+
+
+def test_scan_context_skip_duplicates(static_camera_video):
+    """Test duplicate frames are skipped while still finding the same events."""
+    events = []
+    for skip_duplicates in (False, True):
+        scanner = MotionScanner([static_camera_video])
+        scanner.set_detection_params(skip_duplicates=skip_duplicates)
+        scanner.set_event_params(min_event_len=4, time_pre_event=0, time_post_event=0)
+        result = scanner.scan()
+        events.append([(event.start.frame_num, event.end.frame_num) for event in result.event_list])
+    assert (200, 250) in events[0]
+    assert (200, 250) in events[1]
+    assert len(events[1]) == len(events[0])
+    assert result.num_frames_duplicate > 0
+
+
+def test_scan_context_background_snapshot(static_camera_video, tmp_path):
+    """Test a scan starting during motion finds where it ends if trained on a snapshot of the
+    background from a previous scan, which the first frame would otherwise be taken as."""
+    snapshot = tmp_path / "background.npz"
+    scanner = MotionScanner([static_camera_video])
+    scanner.set_background(save_background=snapshot)
+    scanner.set_video_time(end_time=200)
+    scanner.scan()
+    assert snapshot.exists()
+
+    events = []
+    for load_background in (None, snapshot):
+        scanner = MotionScanner([static_camera_video])
+        scanner.set_event_params(min_event_len=4, time_pre_event=0, time_post_event=0)
+        scanner.set_background(load_background=load_background)
+        scanner.set_video_time(start_time=210)
+        result = scanner.scan()
+        events.append([(event.start.frame_num, event.end.frame_num) for event in result.event_list])
+    assert len(events[1]) == 1
+    assert events[1][0][1] == 250
+    assert events[0][0][1] > 250
+
+    # Events are still returned if the snapshot can't be saved.
+    scanner.set_background(save_background=tmp_path / "missing" / "background.npz")
+    assert scanner.scan().event_list
+
+
+def test_duplicate_filter():
+    """Test duplicates are counted until a different frame, even if it only differs in one pixel."""
+    duplicates = DuplicateFilter()
+    frame = numpy.full((72, 128, 3), 100, dtype=numpy.uint8)
+    assert [duplicates.check(frame) for _ in range(4)] == [0, 1, 2, 3]
+    changed = frame.copy()
+    changed[1, 1] = 101
+    assert duplicates.check(changed) == 0
+    assert duplicates.check(changed.copy()) == 1
+
+
+def test_motion_gate():
+    """Test the cascade gate lets through changed frames, and every `interval` static frames."""
+    gate = MotionGate(threshold=10.0, interval=5)
+    frame = numpy.full((72, 128, 3), 100, dtype=numpy.uint8)
+    assert gate.check(frame)
+    assert [gate.check(frame) for _ in range(10)] == [False, False, False, False, True] * 2
+    moved = frame.copy()
+    moved[10:30, 10:30] = 200
+    assert gate.check(moved)
+    assert gate.check(moved)
+
+
+@pytest.mark.parametrize(
+    "subtractor",
+    [
+        lambda: SubtractorMOG2(kernel_size=3),
+        lambda: SubtractorRunningAverage(kernel_size=3),
+        lambda: SubtractorRunningAverage(kernel_size=0, learning_rate=1),
+        lambda: SubtractorRunningAverage(kernel_size=3, learning_rate=0.05),
+    ],
+)
+def test_subtractor_apply_batch(subtractor):
+    """Test subtracting batches of frames gives the same masks as one frame at a time."""
+    rng = numpy.random.default_rng(0)
+    background = rng.integers(0, 255, (60, 80, 3), dtype=numpy.uint8)
+    frames = numpy.stack([background] * 20)
+    for i, frame in enumerate(frames):
+        frame[5 + i : 30 + i, 2 * i : 20 + 2 * i] = rng.integers(0, 255, (25, 20, 3), dtype=numpy.uint8)
+    single, batched = subtractor(), subtractor()
+    expected = numpy.stack([single.apply(frame) for frame in frames])
+    masks = numpy.concatenate(
+        [batched.apply_batch(frames[:1]), batched.apply_batch(frames[1:8]), batched.apply_batch(frames[8:])]
+    )
+    assert expected.any()
+    assert numpy.array_equal(masks, expected)
+    # Grayscale frames are also accepted.
+    gray = numpy.stack([frame[:, :, 1] for frame in frames])
+    assert subtractor().apply_batch(gray).shape == gray.shape
+
+
 @pytest.mark.skipif(not SubtractorCNT.is_available(), reason="CNT algorithm not available.")
 def test_scan_context_cnt(traffic_camera_video):
     """Test basic functionality of MotionScanner using the CNT algorithm."""
@@ -237,3 +449,18 @@ def test_start_duration(traffic_camera_video):
     event_list = [(event.start.frame_num, event.end.frame_num) for event in event_list]
     # The set duration should only cover the middle event.
     compare_event_lists(event_list, TRAFFIC_CAMERA_EVENTS[1:2], EVENT_FRAME_TOLERANCE)
+
+
+def test_scan_windows(traffic_camera_video):
+    """Test only scanning windows of the video, each with a new background model."""
+    scanner = MotionScanner([traffic_camera_video])
+    scanner.set_regions(regions=[TRAFFIC_CAMERA_ROI])
+    scanner.set_event_params(min_event_len=4, time_pre_event=0)
+    # There is no motion in the first window (after padding), the second is cut off in the
+    # middle of an event.
+    scanner.set_scan_windows([(440, 450), (150, 300)], margin_before=20, margin_after=0, warmup=10)
+    result = scanner.scan()
+    event_list = [(event.start.frame_num, event.end.frame_num) for event in result.event_list]
+    # Events can't start during the warm-up before each window (frames 410 to 420).
+    compare_event_lists(event_list, [(428, 450)], EVENT_FRAME_TOLERANCE)
+    assert result.num_frames == (300 - 120) + (450 - 410)
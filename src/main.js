@@ -1,7 +1,6 @@
 const { app, BrowserWindow, ipcMain, dialog } = require("electron");
 const path = require("path");
 const { spawn } = require("child_process");
-const fs = require("fs").promises; // Use the promise-based version of fs
 
 let mainWindow;
 
@@ -60,25 +59,45 @@ async function handleOpenOutput() {
   return canceled ? null : filePaths[0];
 }
 
-// New handler to read the JSON results files
-ipcMain.handle("files:readHikvisionResults", async (event, outputDir) => {
-  try {
-    const hikbtreePath = path.join(outputDir, "hikbtree.json");
-    // You could also read system_logs.json here if you want to display that data too
-    // const logsPath = path.join(outputDir, "system_logs.json");
-
-    const hikbtreeData = await fs.readFile(hikbtreePath, "utf-8");
-
-    return {
-      success: true,
-      data: {
-        hikbtree: JSON.parse(hikbtreeData),
-      },
-    };
-  } catch (error) {
-    console.error("Failed to read forensic result files:", error);
-    return { success: false, error: error.message };
-  }
+// Runs a paginated, filtered query against the case database and returns one page of rows.
+// Only the requested window is ever loaded, so large HIKBTREEs and log regions don't freeze the UI.
+ipcMain.handle("hikvision:queryCase", (event, caseDb, filters = {}) => {
+  const { executablePath, commandArgs, options } = getBaseCommandArgs();
+  commandArgs.push("hikvision", "query", "--case-db", caseDb);
+  commandArgs.push("--table", filters.table || "entries");
+  if (filters.channel != null) commandArgs.push("--channel", `${filters.channel}`);
+  if (filters.start) commandArgs.push("--start", `${filters.start}`);
+  if (filters.end) commandArgs.push("--end", `${filters.end}`);
+  if (filters.logType != null) commandArgs.push("--log-type", `${filters.logType}`);
+  if (filters.pageNumber != null)
+    commandArgs.push("--page-number", `${filters.pageNumber}`);
+  if (filters.videoOnly) commandArgs.push("--video-only");
+  commandArgs.push("--limit", `${filters.limit || 100}`);
+  commandArgs.push("--offset", `${filters.offset || 0}`);
+
+  return new Promise((resolve) => {
+    const childProcess = spawn(executablePath, commandArgs, options);
+    let stdout = "";
+    let stderr = "";
+    childProcess.stdout.on("data", (data) => (stdout += data.toString()));
+    childProcess.stderr.on("data", (data) => (stderr += data.toString()));
+    childProcess.on("close", () => {
+      for (const line of stdout.split("\n")) {
+        try {
+          const parsed = JSON.parse(line);
+          if (parsed.type === "hik_query_complete") {
+            return resolve({ success: true, data: parsed });
+          } else if (parsed.type === "error") {
+            return resolve({ success: false, error: parsed.message });
+          }
+        } catch (e) {
+          // Not a JSON line, ignore.
+        }
+      }
+      console.error("Failed to query case database:", stderr);
+      resolve({ success: false, error: stderr || "No result returned." });
+    });
+  });
 });
 
 app.whenReady().then(() => {
@@ -143,12 +162,21 @@ function runPythonEngine(event, executablePath, commandArgs, options) {
       }
     });
   });
-  childProcess.stderr.on("data", (data) =>
-    event.sender.send("scan-error", data.toString())
-  );
-  childProcess.on("close", (code) =>
-    event.sender.send("scan-complete", `Process exited with code ${code}`)
-  );
+  // Human-readable logs are written to stderr (stdout only carries JSON messages), so
+  // stderr is only reported as an error if the process fails.
+  let stderrTail = "";
+  childProcess.stderr.on("data", (data) => {
+    const text = data.toString();
+    stderrTail = (stderrTail + text).slice(-4000);
+    text
+      .split("\n")
+      .filter((line) => line.trim() !== "")
+      .forEach((line) => event.sender.send("scan-log", line));
+  });
+  childProcess.on("close", (code) => {
+    if (code !== 0) event.sender.send("scan-error", stderrTail);
+    event.sender.send("scan-complete", `Process exited with code ${code}`);
+  });
 }
 
 ipcMain.on("start-scan", (event, settings) => {
@@ -189,6 +217,7 @@ ipcMain.on("start-hikvision-task", (event, { task, settings }) => {
   commandArgs.push("hikvision", task);
   if (settings.image) commandArgs.push("--image", settings.image);
   if (settings.output_file) commandArgs.push("-o", settings.output_file);
+  if (settings.case_db) commandArgs.push("--case-db", settings.case_db);
   if (settings.output_dir) commandArgs.push("-d", settings.output_dir);
   if (settings.master_file)
     commandArgs.push("--master-file", settings.master_file);
@@ -11,9 +11,9 @@ contextBridge.exposeInMainWorld("electronAPI", {
   startHikvisionTask: (task, settings) =>
     ipcRenderer.send("start-hikvision-task", { task, settings }),
 
-  // ADD THIS NEW FUNCTION TO READ PARSED DATA
-  readHikvisionResults: (outputDir) =>
-    ipcRenderer.invoke("files:readHikvisionResults", outputDir),
+  // Paginated/filtered query of the parsed data in the case database
+  queryHikvisionCase: (caseDb, filters) =>
+    ipcRenderer.invoke("hikvision:queryCase", caseDb, filters),
 
   // === Shared Functions ===
   openOutputDialog: () => ipcRenderer.invoke("dialog:openOutput"),
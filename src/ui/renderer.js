@@ -41,12 +41,19 @@ const loadExplorerDataButton = document.getElementById(
 const explorerTableContainer = document.getElementById(
   "explorer-table-container"
 );
+const explorerPager = document.getElementById("explorer-pager");
+const explorerPrevButton = document.getElementById("explorer-prev-button");
+const explorerNextButton = document.getElementById("explorer-next-button");
+const explorerPageInfo = document.getElementById("explorer-page-info");
+const EXPLORER_PAGE_SIZE = 100;
 
 // --- State Variables ---
 let selectedImagePath = null;
 let selectedOutputDir = null;
 let masterFilePath = null;
+let caseDbPath = null;
 let extraOffset = 0;
+let explorerOffset = 0;
 
 // ===================================================================
 //  INITIALIZATION & TAB SWITCHING
@@ -160,9 +167,12 @@ function setupHikvisionListeners() {
     logToOutput("Starting forensic parsing...");
     setHikvisionButtonsState(false);
     masterFilePath = path.join(selectedOutputDir, "master_sector.json");
-    window.electronAPI.startHikvisionTask("master", {
+    caseDbPath = path.join(selectedOutputDir, "case.db");
+    // One process parses the master sector, HIKBTREE and logs (see hik_analyze_stage).
+    window.electronAPI.startHikvisionTask("analyze", {
       image: selectedImagePath,
-      output_file: masterFilePath,
+      output_dir: selectedOutputDir,
+      case_db: caseDbPath,
     });
   });
 
@@ -177,10 +187,26 @@ function setupHikvisionListeners() {
       offset: offset,
       output_dir: selectedOutputDir,
       extra_offset: extraOffset,
+      case_db: caseDbPath,
     });
   });
 }
 
+function showHikvisionProgress(data) {
+  progressContainer.classList.remove("hidden");
+  if (data.percent !== null) progressBar.value = data.percent;
+  const done = data.bytes_total
+    ? `${(data.bytes_done / 1024 ** 2).toFixed(1)} of ${(data.bytes_total / 1024 ** 2).toFixed(1)} MB`
+    : `${data.items_done} ${data.unit}`;
+  const eta = data.eta_seconds !== null ? `, ETA ${Math.ceil(data.eta_seconds)}s` : "";
+  // A task that spends most of its time reading is I/O bound rather than parser bound.
+  const io =
+    data.io_seconds !== null && data.elapsed_seconds > 0
+      ? `, ${Math.round((100 * Math.min(data.io_seconds, data.elapsed_seconds)) / data.elapsed_seconds)}% I/O`
+      : "";
+  progressText.textContent = `${data.task}: ${done} (${data.mb_per_sec} MB/s${eta}${io})`;
+}
+
 function checkHikvisionStep1() {
   hikStep2Fieldset.disabled = !(selectedImagePath && selectedOutputDir);
 }
@@ -195,6 +221,7 @@ function resetHikvisionState() {
   logsStatus.className = "status-pending";
   logsStatus.textContent = "Pending...";
   masterFilePath = null;
+  caseDbPath = null;
   extraOffset = 0;
 }
 
@@ -207,31 +234,59 @@ function updateStatus(element, success, message) {
 //  FORENSIC EXPLORER LOGIC (NEW SECTION)
 // ===================================================================
 function setupExplorerListeners() {
-  loadExplorerDataButton.addEventListener("click", async () => {
+  loadExplorerDataButton.addEventListener("click", () => {
     if (!selectedOutputDir) {
       alert(
         "Please select an output directory on the 'Hikvision Forensics' tab first."
       );
       return;
     }
-    logToOutput("Loading forensic data from JSON files...");
-    explorerTableContainer.innerHTML = "<p>Loading...</p>";
-
-    const result = await window.electronAPI.readHikvisionResults(
-      selectedOutputDir
-    );
-
-    if (result.success) {
-      logToOutput("Data loaded successfully. Rendering table...\n");
-      renderExplorerTable(result.data.hikbtree);
-    } else {
-      logToOutput(`Error loading data: ${result.error}\n`);
-      explorerTableContainer.innerHTML = `<p class="status-fail">Error: Could not load data. Ensure you have run the parsing step first. Details: ${result.error}</p>`;
-    }
+    loadExplorerPage(0);
   });
+  explorerPrevButton.addEventListener("click", () =>
+    loadExplorerPage(Math.max(0, explorerOffset - EXPLORER_PAGE_SIZE))
+  );
+  explorerNextButton.addEventListener("click", () =>
+    loadExplorerPage(explorerOffset + EXPLORER_PAGE_SIZE)
+  );
 }
 
-function renderExplorerTable(hikbtreeData) {
+async function loadExplorerPage(offset) {
+  logToOutput("Loading forensic data from the case database...\n");
+  explorerTableContainer.innerHTML = "<p>Loading...</p>";
+
+  const result = await window.electronAPI.queryHikvisionCase(
+    path.join(selectedOutputDir, "case.db"),
+    {
+      table: "entries",
+      videoOnly: true,
+      limit: EXPLORER_PAGE_SIZE,
+      offset: offset,
+    }
+  );
+
+  if (result.success) {
+    explorerOffset = offset;
+    renderExplorerTable(result.data.rows);
+    updateExplorerPager(result.data.total);
+  } else {
+    logToOutput(`Error loading data: ${result.error}\n`);
+    explorerPager.classList.add("hidden");
+    explorerTableContainer.innerHTML = `<p class="status-fail">Error: Could not load data. Ensure you have run the parsing step first. Details: ${result.error}</p>`;
+  }
+}
+
+function updateExplorerPager(total) {
+  explorerPager.classList.toggle("hidden", total <= EXPLORER_PAGE_SIZE);
+  const last = Math.min(explorerOffset + EXPLORER_PAGE_SIZE, total);
+  explorerPageInfo.textContent = `Showing ${
+    total ? explorerOffset + 1 : 0
+  }-${last} of ${total} recordings`;
+  explorerPrevButton.disabled = explorerOffset === 0;
+  explorerNextButton.disabled = last >= total;
+}
+
+function renderExplorerTable(entries) {
   const table = document.createElement("table");
   table.className = "results-table";
 
@@ -255,45 +310,38 @@ function renderExplorerTable(hikbtreeData) {
   const tbody = table.createTBody();
   let entriesFound = 0;
 
-  // Iterate through pages and entries to populate the table
-  if (hikbtreeData && hikbtreeData.pages) {
-    Object.values(hikbtreeData.pages).forEach((page) => {
-      if (page.entries) {
-        page.entries.forEach((entry) => {
-          if (entry.existence === "Has Video Data") {
-            entriesFound++;
-            const row = tbody.insertRow();
-            row.dataset.offset = entry.data_block_offset; // Store offset in the row
-
-            row.insertCell().textContent = entry.channel;
-            row.insertCell().textContent = entry.start_time.readable;
-            row.insertCell().textContent = entry.end_time.readable;
-            row.insertCell().textContent = entry.data_block_offset;
-
-            const actionCell = row.insertCell();
-            actionCell.className = "extract-button-cell";
-            const extractBtn = document.createElement("button");
-            extractBtn.textContent = "Extract";
-            extractBtn.className = "extract-button";
-            extractBtn.onclick = () => {
-              const offset = row.dataset.offset;
-              logToOutput(`Starting extraction for offset ${offset}...\n`);
-              // Also disable buttons on the other tab to prevent conflicts
-              setHikvisionButtonsState(false);
-              window.electronAPI.startHikvisionTask("extract", {
-                image: selectedImagePath,
-                master_file: masterFilePath,
-                offset: offset,
-                output_dir: selectedOutputDir,
-                extra_offset: extraOffset,
-              });
-            };
-            actionCell.appendChild(extractBtn);
-          }
-        });
-      }
-    });
-  }
+  // Rows come pre-filtered (video entries only) and paginated from the case database
+  entries.forEach((entry) => {
+    entriesFound++;
+    const row = tbody.insertRow();
+    row.dataset.offset = entry.data_block_offset; // Store offset in the row
+
+    row.insertCell().textContent = entry.channel;
+    row.insertCell().textContent = entry.start_time.readable;
+    row.insertCell().textContent = entry.end_time.readable;
+    row.insertCell().textContent = entry.data_block_offset;
+
+    const actionCell = row.insertCell();
+    actionCell.className = "extract-button-cell";
+    const extractBtn = document.createElement("button");
+    extractBtn.textContent = "Extract";
+    extractBtn.className = "extract-button";
+    extractBtn.onclick = () => {
+      const offset = row.dataset.offset;
+      logToOutput(`Starting extraction for offset ${offset}...\n`);
+      // Also disable buttons on the other tab to prevent conflicts
+      setHikvisionButtonsState(false);
+      window.electronAPI.startHikvisionTask("extract", {
+        image: selectedImagePath,
+        master_file: masterFilePath,
+        offset: offset,
+        output_dir: selectedOutputDir,
+        extra_offset: extraOffset,
+        case_db: caseDbPath,
+      });
+    };
+    actionCell.appendChild(extractBtn);
+  });
 
   // Update the container
   explorerTableContainer.innerHTML = "";
@@ -301,7 +349,7 @@ function renderExplorerTable(hikbtreeData) {
     explorerTableContainer.appendChild(table);
   } else {
     explorerTableContainer.innerHTML =
-      "<p>No video recording entries found in hikbtree.json. Make sure you have parsed the image successfully.</p>";
+      "<p>No video recording entries found in the case database. Make sure you have parsed the image successfully.</p>";
   }
 }
 
@@ -334,8 +382,36 @@ function setupIPCListeners() {
     }
   });
 
+  const analyzeStatus = {
+    master: masterStatus,
+    hikbtree: hikbtreeStatus,
+    logs: logsStatus,
+  };
+
   window.electronAPI.onHikvisionUpdate((_event, data) => {
-    if (data.type === "hik_master_complete") {
+    if (data.type === "hik_progress") {
+      showHikvisionProgress(data);
+    } else if (data.type === "hik_analyze_stage") {
+      updateStatus(
+        analyzeStatus[data.stage],
+        data.success,
+        data.success ? "Success" : "Failed"
+      );
+    } else if (data.type === "hik_analyze_complete") {
+      extraOffset = data.extra_offset;
+      updateStatus(
+        masterStatus,
+        true,
+        `Success (Offset: ${data.extra_offset})`
+      );
+      logToOutput(
+        data.cached
+          ? "\nImage unchanged since it was last analysed, loaded the cached results.\n"
+          : `\nAll parsing complete in ${data.elapsed_seconds}s. You may now extract video blocks manually or use the Forensic Explorer tab.\n`
+      );
+      hikStep3Fieldset.disabled = false;
+      setHikvisionButtonsState(true);
+    } else if (data.type === "hik_master_complete") {
       updateStatus(
         masterStatus,
         data.success,
@@ -348,6 +424,7 @@ function setupIPCListeners() {
           image: selectedImagePath,
           master_file: masterFilePath,
           output_file: hikbtreeFile,
+          case_db: caseDbPath,
           extra_offset: extraOffset,
         });
       } else {
@@ -365,6 +442,7 @@ function setupIPCListeners() {
           image: selectedImagePath,
           master_file: masterFilePath,
           output_file: logsFile,
+          case_db: caseDbPath,
           extra_offset: extraOffset,
         });
       } else {
@@ -385,6 +463,10 @@ function setupIPCListeners() {
       setHikvisionButtonsState(true);
     } else if (data.type === "hik_extract_complete") {
       logToOutput(`\nSUCCESS! Video extracted to: ${data.path}\n`);
+      if (data.hashes) {
+        logToOutput(`SHA-256 (source range): ${data.hashes.source.sha256}\n`);
+        logToOutput(`SHA-256 (output file):  ${data.hashes.output.sha256}\n`);
+      }
       setHikvisionButtonsState(true);
     }
   });